@@ -1,4 +1,4 @@
-import {BlockContent} from "@/utils/renderBlocks";
+import {Blocks} from "@/utils/renderBlocks";
 
 export interface Medication {
     id: string;
@@ -17,12 +17,12 @@ export interface Medication {
     ai_use_and_conditions:string;
     ai_contraindications:string;
     vector_similar_ranking: Record<string, number>;
-    meta_description_blocks: BlockContent[];
-    description_blocks: BlockContent[];
-    use_and_conditions_blocks: BlockContent[];
-    contra_indications_blocks: BlockContent[];
-    warning_blocks: BlockContent[];
-    dosing_blocks: BlockContent[];
+    meta_description_blocks: Blocks;
+    description_blocks: Blocks;
+    use_and_conditions_blocks: Blocks;
+    contra_indications_blocks: Blocks;
+    warning_blocks: Blocks;
+    dosing_blocks: Blocks;
     tags_by_category?: { [category: string]: string[] };
 }
 
@@ -0,0 +1,75 @@
+import React from 'react';
+import { render } from '@testing-library/react';
+import { BlockContent, CompactBlocks, decodeBlocks, RenderBlocks } from '../renderBlocks';
+
+describe('decodeBlocks', () => {
+  const verboseBlocks = [
+    {
+      type: '[document]',
+      attrs: {},
+      contents: [
+        { type: 'h3', attrs: {}, contents: ['Dosing'] },
+        { type: 'p', attrs: {}, contents: ['Take', 'two', 'tablets'] },
+        {
+          type: 'table',
+          attrs: {},
+          contents: [
+            {
+              type: 'tr',
+              attrs: {},
+              contents: [{ type: 'td', attrs: { colspan: '2' }, contents: ['Adults'] }],
+            },
+          ],
+        },
+      ],
+    },
+  ] as unknown as BlockContent[];
+
+  const compactBlocks = [
+    1,
+    [0, [7, 'Dosing'], [1, 'Taketwotablets'], [14, [19, [21, { colspan: '2' }, 'Adults']]]],
+  ] as unknown as CompactBlocks;
+
+  it('decodes tag codes, omitted attrs and text runs', () => {
+    expect(decodeBlocks(compactBlocks)).toEqual([
+      {
+        type: '[document]',
+        attrs: {},
+        contents: [
+          { type: 'h3', attrs: {}, contents: ['Dosing'] },
+          { type: 'p', attrs: {}, contents: ['Taketwotablets'] },
+          {
+            type: 'table',
+            attrs: {},
+            contents: [
+              {
+                type: 'tr',
+                attrs: {},
+                contents: [{ type: 'td', attrs: { colspan: '2' }, contents: ['Adults'] }],
+              },
+            ],
+          },
+        ],
+      },
+    ]);
+  });
+
+  it('returns verbose blocks unchanged', () => {
+    expect(decodeBlocks(verboseBlocks)).toBe(verboseBlocks);
+  });
+
+  it('renders both formats identically', () => {
+    const verbose = render(<RenderBlocks blocks={verboseBlocks} headerOffset={0} />);
+    const compact = render(<RenderBlocks blocks={compactBlocks} headerOffset={0} />);
+    expect(compact.container.innerHTML).toBe(verbose.container.innerHTML);
+  });
+
+  it('renders nothing for an unknown version', () => {
+    const warn = jest.spyOn(console, 'warn').mockImplementation(() => {});
+    const { container } = render(
+      <RenderBlocks blocks={[2, [0, [1, 'text']]] as unknown as CompactBlocks} headerOffset={0} />
+    );
+    expect(container.innerHTML).toBe('');
+    warn.mockRestore();
+  });
+});
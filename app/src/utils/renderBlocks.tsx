@@ -14,6 +14,56 @@ export interface BlockContent {
     attrs?: KnownAttrs;
 }
 
+// Compact block format written by the worker (worker/scripts/block_encoding.py):
+// [version, ...nodes], where a node is a text run or [tag code, attrs?, ...contents].
+export const BLOCK_FORMAT_VERSION = 1;
+
+// Block types by integer code; must match BLOCK_TAG_CODES in block_encoding.py
+export const BLOCK_TAG_CODES = [
+    '[document]', 'p', 'ul', 'ol', 'li', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'strong', 'em',
+    'a', 'table', 'thead', 'tbody', 'tfoot', 'caption', 'tr', 'th', 'td', 'mark', 'sup', 'code',
+    'embed-medication',
+];
+
+export type CompactBlockNode = string | (number | string | KnownAttrs | CompactBlockNode)[];
+
+export type CompactBlocks = [number, ...CompactBlockNode[]];
+
+export type Blocks = BlockContent[] | CompactBlocks;
+
+function decodeBlock(node: CompactBlockNode): string | BlockContent {
+    if (typeof node === 'string') {
+        return node;
+    }
+
+    const [code, ...rest] = node;
+    // Omitted attrs decode to {}, as the verbose format stores them
+    const attrs = rest.length > 0 && typeof rest[0] === 'object' && !Array.isArray(rest[0]) ?
+        rest.shift() as KnownAttrs :
+        {} as KnownAttrs;
+
+    return {
+        type: typeof code === 'number' ? BLOCK_TAG_CODES[code] : code as string,
+        contents: (rest as CompactBlockNode[]).map(decodeBlock),
+        attrs,
+    };
+}
+
+// Returns blocks in the {type, contents, attrs} format; blocks already in it are returned as is
+export function decodeBlocks(blocks: Blocks): BlockContent[] {
+    if (blocks.length === 0 || typeof blocks[0] !== 'number') {
+        return blocks as BlockContent[];
+    }
+
+    const [version, ...nodes] = blocks as CompactBlocks;
+    if (version !== BLOCK_FORMAT_VERSION) {
+        console.warn(`Unsupported block format version: ${version}`);
+        return [];
+    }
+
+    return nodes.map(decodeBlock).filter((block): block is BlockContent => typeof block !== 'string');
+}
+
 interface RenderBlockProps {
     block: BlockContent;
     headerOffset: number
@@ -224,12 +274,12 @@ const getComponentMap = (block: BlockContent, headerOffset: number): Record<stri
 });
 
 // Utility function to render multiple blocks
-export function renderBlocks(blocks: BlockContent[], headerOffset: number): React.ReactElement[] {
+export function renderBlocks(blocks: Blocks, headerOffset: number): React.ReactElement[] {
     if (!blocks) {
         return [];
     }
 
-    return blocks.map((block, index) => {
+    return decodeBlocks(blocks).map((block, index) => {
         const renderedBlock = renderBlock({block, headerOffset});
         return renderedBlock !== null ? 
             React.createElement(React.Fragment, {key: index}, renderedBlock) : 
@@ -239,7 +289,7 @@ export function renderBlocks(blocks: BlockContent[], headerOffset: number): Reac
 
 // React component for easy usage
 interface RenderBlocksProps {
-    blocks: BlockContent[];
+    blocks: Blocks;
     headerOffset: number;
 }
 
@@ -0,0 +1,93 @@
+import os
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import orjson
+import zstandard
+
+# Default location of the pipeline artifact and its setId index
+DEFAULT_ARTIFACT_PATH = "./data/pipeline_items.jsonl.zst"
+
+
+def index_path_for(path: str) -> str:
+    return f"{path}.idx"
+
+
+class ArtifactWriter:
+    """
+    Appends one record per processed item to a zstd-compressed JSONL file.
+
+    Each record is written as its own zstd frame and its offset is recorded in a
+    sidecar index (`<path>.idx`, one JSON line per record), so a single item can be
+    read back by setId without decompressing the rest of the corpus. The file as a
+    whole is still a valid multi-frame .zst stream of JSON lines.
+    """
+
+    def __init__(self, path: str = DEFAULT_ARTIFACT_PATH, append: bool = False, level: int = 6):
+        self.path = path
+        self.count = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        mode = "ab" if append else "wb"
+        self._file = open(path, mode)
+        self._index = open(index_path_for(path), mode)
+        self._compressor = zstandard.ZstdCompressor(level=level)
+
+    def write(self, set_id: str, record: Dict[str, Any]):
+        """
+        Appends a record and its index entry, flushing both so completed items survive a crash.
+
+        Args:
+            set_id: setId of the item
+            record: JSON-serializable record
+        """
+        frame = self._compressor.compress(orjson.dumps(record) + b"\n")
+        offset = self._file.tell()
+        self._file.write(frame)
+        self._file.flush()
+
+        self._index.write(orjson.dumps({"setId": set_id, "offset": offset, "length": len(frame)}) + b"\n")
+        self._index.flush()
+        self.count += 1
+
+    def close(self):
+        self._file.close()
+        self._index.close()
+
+
+class ArtifactReader:
+    """Random and sequential access to an artifact written by ArtifactWriter."""
+
+    def __init__(self, path: str = DEFAULT_ARTIFACT_PATH):
+        self.path = path
+        self._decompressor = zstandard.ZstdDecompressor()
+        self.index: Dict[str, Tuple[int, int]] = {}
+
+        # Later entries win, so items re-written by a resumed run point at their latest record
+        with open(index_path_for(path), "rb") as f:
+            for line in f:
+                if line.strip():
+                    entry = orjson.loads(line)
+                    self.index[entry["setId"]] = (entry["offset"], entry["length"])
+
+    def get(self, set_id: str) -> Optional[Dict[str, Any]]:
+        """Reads the record of a single item, or returns None when it is not in the artifact."""
+        if set_id not in self.index:
+            return None
+        offset, length = self.index[set_id]
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            frame = f.read(length)
+        return orjson.loads(self._decompressor.decompress(frame))
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        """Yields the latest record of every item, in the order they were first written."""
+        with open(self.path, "rb") as f:
+            for set_id, (offset, length) in self.index.items():
+                f.seek(offset)
+                yield orjson.loads(self._decompressor.decompress(f.read(length)))
+
+    def __len__(self) -> int:
+        return len(self.index)
@@ -0,0 +1,276 @@
+import os
+import json
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from llm_cache import make_cache_key
+from openai_client import get_openai_client
+from run_ledger import annotate_call, record_usage
+
+# Where request and result JSONL files of each batch are kept
+DEFAULT_BATCH_DIR = "./data/batches"
+
+# Batch API limit on the number of requests per input file
+MAX_REQUESTS_PER_BATCH = 50_000
+
+_FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+# Active executor when process_data runs with --batch
+_batch_executor: Optional["BatchExecutor"] = None
+
+
+def _strict_schema(schema: Any) -> Any:
+    # Strict structured outputs require closed objects with every property required
+    if isinstance(schema, list):
+        return [_strict_schema(value) for value in schema]
+    if not isinstance(schema, dict):
+        return schema
+    schema = {key: _strict_schema(value) for key, value in schema.items()}
+    if schema.get("type") == "object" and "properties" in schema:
+        schema["required"] = list(schema["properties"])
+        schema["additionalProperties"] = False
+    return schema
+
+
+def response_format_param(response_format: Any) -> Dict[str, Any]:
+    """
+    Builds the strict json_schema response_format of a Pydantic model.
+
+    This is the payload client.chat.completions.parse() sends for the same model, so
+    batch lines and live calls request the same structured output.
+
+    Args:
+        response_format: Pydantic model class of the structured output
+
+    Returns:
+        A {"type": "json_schema", "json_schema": {...}} dict
+    """
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "schema": _strict_schema(response_format.model_json_schema()),
+            "name": response_format.__name__,
+            "strict": True,
+        },
+    }
+
+
+def build_request_body(
+        model: str,
+        messages: List[Dict[str, Any]],
+        temperature: float,
+        max_tokens: int,
+        response_format: Any = None,
+) -> Dict[str, Any]:
+    """Builds the /v1/chat/completions body of a request, as the synchronous call would send it."""
+    body = {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    }
+    if response_format is not None:
+        body["response_format"] = response_format_param(response_format)
+    return body
+
+
+class BatchExecutor:
+    """
+    Sends LLM requests through the OpenAI Batch API instead of one synchronous call each.
+
+    Requests are collected while the pipeline runs; once no new request has arrived
+    for idle_seconds (every item is waiting on an LLM answer), the collected requests
+    are written to a JSONL file, uploaded and submitted as a batch. The batch is polled
+    until it finishes and each waiting stage receives its response, so enhance outputs
+    feed the summary and tag requests of the next batch exactly like in live mode.
+    Requests the batch could not answer fall back to the live call.
+    """
+
+    def __init__(
+            self,
+            directory: str = DEFAULT_BATCH_DIR,
+            idle_seconds: float = 2.0,
+            poll_interval: float = 30.0,
+            completion_window: str = "24h",
+            max_requests: int = MAX_REQUESTS_PER_BATCH,
+    ):
+        self.directory = directory
+        self.idle_seconds = idle_seconds
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+        self.max_requests = max_requests
+        self._pending: Dict[str, dict] = {}
+        self._arrived = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._flushes: List[asyncio.Task] = []
+        self._batch_number = 0
+        self.stats = {"batches": 0, "requests": 0, "fallbacks": 0}
+
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self):
+        self._task = asyncio.create_task(self._collect())
+
+    async def submit(
+            self,
+            model: str,
+            messages: List[Dict[str, Any]],
+            temperature: float,
+            max_tokens: int,
+            response_format: Any = None,
+            fallback: Optional[Callable[[], Awaitable[str]]] = None,
+    ) -> str:
+        """
+        Queues a request for the next batch and waits for its response content.
+
+        Args:
+            model: Model name
+            messages: Chat messages sent to the model
+            temperature: Sampling temperature
+            max_tokens: Completion token limit
+            response_format: Optional Pydantic model used for structured output
+            fallback: Coroutine function performing the live call if the batch fails the request
+
+        Returns:
+            The response content
+        """
+        key = make_cache_key(model, messages, temperature, max_tokens, response_format)
+
+        # Identical requests in flight share one batch line
+        if key not in self._pending:
+            self._pending[key] = {
+                "body": build_request_body(model, messages, temperature, max_tokens, response_format),
+                "futures": [],
+                "fallback": fallback,
+            }
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key]["futures"].append(future)
+        self._arrived.set()
+
+        result = await future
+        if result is None:
+            if fallback is None:
+                raise RuntimeError(f"Batch request {key} failed and has no fallback")
+            self.stats["fallbacks"] += 1
+            return await fallback()
+
+        content, usage = result
+        annotate_call(source="batch")
+        record_usage(usage)
+        return content
+
+    async def _collect(self):
+        while True:
+            await self._arrived.wait()
+            # Keep collecting until the pipeline has gone quiet
+            while True:
+                self._arrived.clear()
+                try:
+                    await asyncio.wait_for(self._arrived.wait(), timeout=self.idle_seconds)
+                except asyncio.TimeoutError:
+                    break
+                if len(self._pending) >= self.max_requests:
+                    break
+
+            requests = dict(list(self._pending.items())[:self.max_requests])
+            for key in requests:
+                del self._pending[key]
+            if self._pending:
+                self._arrived.set()
+            self._flushes.append(asyncio.create_task(self._run_batch(requests)))
+
+    async def _run_batch(self, requests: Dict[str, dict]):
+        client = get_openai_client()
+        self._batch_number += 1
+        name = f"batch_{os.getpid()}_{self._batch_number}"
+        input_path = os.path.join(self.directory, f"{name}.input.jsonl")
+        results: Dict[str, Optional[tuple]] = {}
+
+        try:
+            with open(input_path, "w", encoding="utf-8") as f:
+                for key, request in requests.items():
+                    line = {"custom_id": key, "method": "POST", "url": "/v1/chat/completions", "body": request["body"]}
+                    f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+            with open(input_path, "rb") as f:
+                input_file = await client.files.create(file=f, purpose="batch")
+            batch = await client.batches.create(
+                input_file_id=input_file.id,
+                endpoint="/v1/chat/completions",
+                completion_window=self.completion_window,
+            )
+            self.stats["batches"] += 1
+            self.stats["requests"] += len(requests)
+            print(f"Submitted batch {batch.id} with {len(requests)} requests")
+
+            while batch.status not in _FINAL_STATUSES:
+                await asyncio.sleep(self.poll_interval)
+                batch = await client.batches.retrieve(batch.id)
+                counts = batch.request_counts
+                if counts is not None:
+                    print(f"Batch {batch.id} {batch.status}: {counts.completed}/{counts.total} completed")
+
+            print(f"Batch {batch.id} finished with status {batch.status}")
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                if not file_id:
+                    continue
+                content = await client.files.content(file_id)
+                with open(os.path.join(self.directory, f"{name}.{file_id}.jsonl"), "w", encoding="utf-8") as f:
+                    f.write(content.text)
+                for line in content.text.splitlines():
+                    if line.strip():
+                        results.update(self._parse_result(json.loads(line)))
+        except Exception as e:
+            print(f"Batch {name} failed: {e}")
+        finally:
+            for key, request in requests.items():
+                for future in request["futures"]:
+                    if not future.done():
+                        future.set_result(results.get(key))
+
+    @staticmethod
+    def _parse_result(line: Dict[str, Any]) -> Dict[str, Optional[tuple]]:
+        # Maps the request key to (content, usage), or None when the request failed
+        response = line.get("response") or {}
+        if line.get("error") or response.get("status_code") != 200:
+            print(f"Batch request {line.get('custom_id')} failed: {line.get('error') or response.get('body')}")
+            return {line["custom_id"]: None}
+        body = response["body"]
+        if body["choices"][0].get("finish_reason") == "length":
+            # Truncated output is not kept; the live fallback retries or raises for it (see chat_completion)
+            print(f"Batch request {line.get('custom_id')} was truncated at max_tokens")
+            return {line["custom_id"]: None}
+        return {line["custom_id"]: (body["choices"][0]["message"]["content"], body.get("usage"))}
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    def report(self) -> str:
+        return (
+            f"Batch API: {self.stats['requests']} requests in {self.stats['batches']} batches, "
+            f"{self.stats['fallbacks']} fell back to live calls"
+        )
+
+
+def start_batch_executor(**kwargs) -> BatchExecutor:
+    """Routes every LLM cache miss through the Batch API until stop_batch_executor() is called."""
+    global _batch_executor
+
+    _batch_executor = BatchExecutor(**kwargs)
+    _batch_executor.start()
+    return _batch_executor
+
+
+def get_batch_executor() -> Optional[BatchExecutor]:
+    return _batch_executor
+
+
+async def stop_batch_executor():
+    global _batch_executor
+
+    if _batch_executor is not None:
+        await _batch_executor.close()
+        _batch_executor = None
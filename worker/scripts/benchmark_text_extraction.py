@@ -0,0 +1,106 @@
+import json
+import math
+import time
+import argparse
+from typing import List, Tuple
+
+from bs4 import BeautifulSoup
+
+from html_normalizer import HtmlDocument, extract_text
+from token_counter import count_tokens
+
+# Target chunk size of upsert_to_chromadb (MAX_TOKENS), used to estimate the chunk count
+CHUNK_TOKENS = 300
+
+
+def legacy_extract_text(element) -> str:
+    """The previous extractor: each tag's full text, then its children again, one per line."""
+    result = ""
+
+    for child in element.children:
+        if hasattr(child, 'name') and child.name:
+            tag_text = child.get_text().strip()
+            if tag_text:
+                result += tag_text + "\n"
+            child_text = legacy_extract_text(child)
+            if child_text:
+                result += child_text
+        elif str(child).strip():
+            text = str(child).strip()
+            if text:
+                result += text + "\n"
+
+    return "\n".join(line.strip() for line in result.split("\n") if line.strip())
+
+
+def largest_sections(path: str, top: int) -> List[Tuple[str, str, str]]:
+    """
+    Returns the largest label sections of a labels file.
+
+    Args:
+        path: Path of the labels JSON array
+        top: Number of sections returned
+
+    Returns:
+        (drug name, section name, html) tuples, largest first
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        items = json.load(f)
+
+    sections = [
+        (item.get("drugName", ""), name, value)
+        for item in items
+        for name, value in (item.get("label") or {}).items()
+        if isinstance(value, str)
+    ]
+    sections.sort(key=lambda section: len(section[2]), reverse=True)
+    return sections[:top]
+
+
+def measure(extract, documents, repeat: int) -> Tuple[float, List[str]]:
+    """Returns the best total time of extract over the parsed documents, and its outputs."""
+    best = math.inf
+    outputs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        outputs = [extract(document) for document in documents]
+        best = min(best, time.perf_counter() - started)
+    return best, outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the vector-search text extractors on the largest label sections.")
+    parser.add_argument("--input", default="./data/Labels.json", help="Path of the labels JSON array")
+    parser.add_argument("--top", type=int, default=20, help="Number of sections measured, largest first")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per extractor; the best time is reported")
+    args = parser.parse_args()
+
+    sections = largest_sections(args.input, args.top)
+    # Both extractors walk the same trees, so parsing is left out of the timings
+    documents = [BeautifulSoup(html, "html.parser") for _, _, html in sections]
+    legacy_time, legacy_texts = measure(legacy_extract_text, documents, args.repeat)
+    new_time, new_texts = measure(extract_text, documents, args.repeat)
+
+    print(f"{'drug':<24} {'section':<28} {'html':>9} {'old chars':>10} {'new chars':>10} "
+          f"{'old chunks':>10} {'new chunks':>10}")
+    totals = [0, 0, 0, 0, 0]
+    for (drug, name, html), legacy_text, new_text in zip(sections, legacy_texts, new_texts):
+        legacy_chunks = math.ceil(count_tokens(legacy_text) / CHUNK_TOKENS)
+        new_chunks = math.ceil(count_tokens(new_text) / CHUNK_TOKENS)
+        row = [len(html), len(legacy_text), len(new_text), legacy_chunks, new_chunks]
+        totals = [total + value for total, value in zip(totals, row)]
+        print(f"{drug[:24]:<24} {name[:28]:<28} {row[0]:>9} {row[1]:>10} {row[2]:>10} {row[3]:>10} {row[4]:>10}")
+    print(f"{'total':<53} {totals[0]:>9} {totals[1]:>10} {totals[2]:>10} {totals[3]:>10} {totals[4]:>10}")
+
+    print(f"Extraction time (best of {args.repeat}): old {legacy_time:.3f}s, new {new_time:.3f}s "
+          f"({legacy_time / max(new_time, 1e-9):.1f}x)")
+
+    # Full text view (parse + extract) as used by process_data
+    started = time.perf_counter()
+    for _, _, html in sections:
+        HtmlDocument(html).remove_scripts().text(html)
+    print(f"Text view with parsing: {time.perf_counter() - started:.3f}s for {len(sections)} sections")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import json
+import argparse
+from typing import Any, Dict, List, Union
+
+from html_normalizer import clean_html
+from structure_json_html import build_blocks
+
+# Version marker, stored as the first element of every encoded block list
+BLOCK_FORMAT_VERSION = 1
+
+# Integer codes of the block types, by position. Shared with app/src/utils/renderBlocks.tsx
+# (BLOCK_TAG_CODES): append new types at the end and never reorder.
+BLOCK_TAG_CODES = (
+    '[document]', 'p', 'ul', 'ol', 'li', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'strong', 'em',
+    'a', 'table', 'thead', 'tbody', 'tfoot', 'caption', 'tr', 'th', 'td', 'mark', 'sup', 'code',
+    'embed-medication',
+)
+_TAG_CODE = {tag: code for code, tag in enumerate(BLOCK_TAG_CODES)}
+
+# Encoded node: a text string, or [tag code, (attrs,) *contents] for a block
+EncodedNode = Union[str, list]
+
+
+def encode_block(block: Dict[str, Any]) -> EncodedNode:
+    """
+    Encodes a {"type", "contents", "attrs"} block in the compact format.
+
+    The type becomes its integer code (types without a code keep their name), empty attrs
+    are omitted, and adjacent text strings are joined into one run, as they render.
+
+    Args:
+        block: A block from structure_json_html
+
+    Returns:
+        [code, *contents], or [code, attrs, *contents] when the block has attributes
+    """
+    node = [_TAG_CODE.get(block["type"], block["type"])]
+    if block.get("attrs"):
+        node.append(block["attrs"])
+    for content in block.get("contents", []):
+        if isinstance(content, str):
+            if len(node) > 1 and isinstance(node[-1], str):
+                node[-1] += content
+            else:
+                node.append(content)
+        else:
+            node.append(encode_block(content))
+    return node
+
+
+def encode_blocks(blocks: List[Dict[str, Any]]) -> list:
+    """Encodes a list of blocks as [BLOCK_FORMAT_VERSION, *encoded blocks]."""
+    return [BLOCK_FORMAT_VERSION, *(encode_block(block) for block in blocks)]
+
+
+def encode_view_blocks(view_blocks: Dict[str, Any]) -> Dict[str, Any]:
+    """Encodes every block list of a view_blocks dict (metaDescription, description, ...)."""
+    return {
+        key: encode_blocks(value) if isinstance(value, list) else value
+        for key, value in view_blocks.items()
+    }
+
+
+def decode_block(node: EncodedNode) -> Union[str, Dict[str, Any]]:
+    if isinstance(node, str):
+        return node
+    code, *rest = node
+    attrs = rest.pop(0) if rest and isinstance(rest[0], dict) else {}
+    return {
+        "type": BLOCK_TAG_CODES[code] if isinstance(code, int) else code,
+        "contents": [decode_block(content) for content in rest],
+        "attrs": attrs,
+    }
+
+
+def decode_blocks(encoded: list) -> List[Dict[str, Any]]:
+    """
+    Decodes an encoded block list; lists of {"type", ...} blocks are returned unchanged.
+
+    Args:
+        encoded: [version, *encoded blocks], or a list in the verbose format
+
+    Returns:
+        The blocks in the verbose format
+    """
+    if not encoded or not isinstance(encoded[0], int):
+        return encoded
+    if encoded[0] != BLOCK_FORMAT_VERSION:
+        raise ValueError(f"Unsupported block format version {encoded[0]}")
+    return [decode_block(node) for node in encoded[1:]]
+
+
+def _join_text_runs(block: Dict[str, Any]) -> Dict[str, Any]:
+    contents = []
+    for content in block["contents"]:
+        if isinstance(content, str) and contents and isinstance(contents[-1], str):
+            contents[-1] += content
+        else:
+            contents.append(content if isinstance(content, str) else _join_text_runs(content))
+    return {**block, "contents": contents}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the verbose and compact view block sizes of every label section.")
+    parser.add_argument("--input", default="./data/Labels.json", help="Path of the labels JSON array")
+    args = parser.parse_args()
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        items = json.load(f)
+
+    verbose_size = compact_size = sections = 0
+    for item in items:
+        for name, value in (item.get("label") or {}).items():
+            if not isinstance(value, str):
+                continue
+            # Cleaned sections stand in for the summaries the pipeline stores
+            blocks = [build_blocks(clean_html(value))]
+            encoded = encode_blocks(blocks)
+            # Decoding gives the same blocks, with the adjacent text strings joined
+            if decode_blocks(json.loads(json.dumps(encoded))) != [_join_text_runs(block) for block in blocks]:
+                raise SystemExit(f"Round trip mismatch in {item.get('drugName')} {name}")
+            verbose_size += len(json.dumps(blocks, separators=(",", ":")))
+            compact_size += len(json.dumps(encoded, separators=(",", ":")))
+            sections += 1
+
+    print(f"{sections} sections: verbose {verbose_size} bytes, compact {compact_size} bytes "
+          f"({100 * (1 - compact_size / max(verbose_size, 1)):.0f}% smaller)")
@@ -0,0 +1,245 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+# Default location of the checkpoint database, next to the pipeline data files
+DEFAULT_CHECKPOINT_PATH = "./data/checkpoints.sqlite"
+
+
+class CheckpointStore:
+    """
+    Crash-safe record of per-item stage outputs, stored in SQLite (WAL mode).
+
+    Every stage output is committed as soon as the stage finishes, so a run that
+    dies part way through can be resumed and only the missing stages are re-run.
+    Outputs are stored with the fingerprint of their inputs; in incremental mode a
+    stage whose inputs are unchanged since any previous run reuses that output.
+    """
+
+    def __init__(self, path: str = DEFAULT_CHECKPOINT_PATH, incremental: bool = False):
+        self.path = path
+        self.incremental = incremental
+        self.run_id: Optional[int] = None
+        self.stats = {"reused_stages": 0, "saved_stages": 0, "reused_items": 0, "unchanged_stages": 0}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                started_at REAL NOT NULL,
+                finished_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS stage_outputs (
+                run_id INTEGER NOT NULL,
+                set_id TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                output TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (run_id, set_id, stage)
+            );
+            CREATE TABLE IF NOT EXISTS label_fingerprints (
+                set_id TEXT PRIMARY KEY,
+                effective_time TEXT,
+                fingerprints TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS item_results (
+                run_id INTEGER NOT NULL,
+                set_id TEXT NOT NULL,
+                result TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (run_id, set_id)
+            );
+            """
+        )
+
+        # Databases created before change detection lack the input fingerprint column
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(stage_outputs)")}
+        if "input_hash" not in columns:
+            self._conn.execute("ALTER TABLE stage_outputs ADD COLUMN input_hash TEXT")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_stage_outputs_input ON stage_outputs (set_id, stage, input_hash)"
+        )
+        self._conn.commit()
+
+    def start_run(self, resume: bool = False) -> int:
+        """
+        Starts a new run, or continues the latest unfinished one when resume is True.
+
+        Returns:
+            The id of the active run
+        """
+        if resume:
+            row = self._conn.execute(
+                "SELECT id FROM runs WHERE finished_at IS NULL ORDER BY id DESC LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                self.run_id = row[0]
+                print(f"Resuming checkpointed run {self.run_id}")
+                return self.run_id
+            print("No unfinished run to resume, starting a new one")
+
+        cursor = self._conn.execute("INSERT INTO runs (started_at) VALUES (?)", (time.time(),))
+        self._conn.commit()
+        self.run_id = cursor.lastrowid
+        return self.run_id
+
+    def finish_run(self):
+        """Marks the active run finished and prunes rows no later run can read."""
+        self._conn.execute("UPDATE runs SET finished_at = ? WHERE id = ?", (time.time(), self.run_id))
+        # Completion markers only matter while their run can be resumed
+        self._conn.execute("DELETE FROM item_results WHERE run_id <= ?", (self.run_id,))
+        # Incremental runs reuse the latest output of a stage; older ones it superseded are dropped
+        self._conn.execute(
+            """
+            DELETE FROM stage_outputs WHERE run_id < ? AND EXISTS (
+                SELECT 1 FROM stage_outputs AS latest
+                WHERE latest.run_id = ? AND latest.set_id = stage_outputs.set_id AND latest.stage = stage_outputs.stage
+            )
+            """,
+            (self.run_id, self.run_id),
+        )
+        self._conn.commit()
+
+    def get_stage(self, set_id: str, stage: str) -> Tuple[bool, Any]:
+        row = self._conn.execute(
+            "SELECT output FROM stage_outputs WHERE run_id = ? AND set_id = ? AND stage = ?",
+            (self.run_id, set_id, stage),
+        ).fetchone()
+        if row is None:
+            return False, None
+        return True, json.loads(row[0])
+
+    def get_previous_stage(self, set_id: str, stage: str, input_hash: str) -> Tuple[bool, Any]:
+        """Looks up the latest output of a stage, from any run, computed from the same inputs."""
+        row = self._conn.execute(
+            """
+            SELECT output FROM stage_outputs
+            WHERE set_id = ? AND stage = ? AND input_hash = ?
+            ORDER BY run_id DESC LIMIT 1
+            """,
+            (set_id, stage, input_hash),
+        ).fetchone()
+        if row is None:
+            return False, None
+        return True, json.loads(row[0])
+
+    def save_stage(self, set_id: str, stage: str, output: Any, input_hash: Optional[str] = None):
+        self._conn.execute(
+            """
+            INSERT OR REPLACE INTO stage_outputs (run_id, set_id, stage, output, updated_at, input_hash)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (self.run_id, set_id, stage, json.dumps(output, ensure_ascii=False), time.time(), input_hash),
+        )
+        self._conn.commit()
+
+    async def run_stage(
+            self,
+            set_id: str,
+            stage: str,
+            create: Callable[[], Awaitable[Any]],
+            input_hash: Optional[str] = None,
+    ) -> Any:
+        """
+        Returns the checkpointed output of a stage, or runs it and checkpoints the result.
+
+        Args:
+            set_id: setId of the item being processed
+            stage: Stage name (e.g. "enhance:description")
+            create: Coroutine function computing the stage output
+            input_hash: Fingerprint of the stage inputs, used for incremental reuse
+
+        Returns:
+            The stage output
+        """
+        found, output = self.get_stage(set_id, stage)
+        if found:
+            self.stats["reused_stages"] += 1
+            return output
+
+        if self.incremental and input_hash is not None:
+            found, output = self.get_previous_stage(set_id, stage, input_hash)
+            if found:
+                self.save_stage(set_id, stage, output, input_hash)
+                self.stats["unchanged_stages"] += 1
+                return output
+
+        output = await create()
+        self.save_stage(set_id, stage, output, input_hash)
+        self.stats["saved_stages"] += 1
+        return output
+
+    def get_label_fingerprints(self, set_id: str) -> Optional[Dict[str, str]]:
+        row = self._conn.execute(
+            "SELECT fingerprints FROM label_fingerprints WHERE set_id = ?", (set_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def save_label_fingerprints(self, set_id: str, effective_time: Optional[str], fingerprints: Dict[str, str]):
+        self._conn.execute(
+            """
+            INSERT OR REPLACE INTO label_fingerprints (set_id, effective_time, fingerprints, updated_at)
+            VALUES (?, ?, ?, ?)
+            """,
+            (set_id, effective_time, json.dumps(fingerprints, sort_keys=True), time.time()),
+        )
+        self._conn.commit()
+
+    def item_completed(self, set_id: str) -> bool:
+        """True when the active run already wrote this item to the artifact and every sink."""
+        row = self._conn.execute(
+            "SELECT 1 FROM item_results WHERE run_id = ? AND set_id = ?", (self.run_id, set_id)
+        ).fetchone()
+        if row is None:
+            return False
+        self.stats["reused_items"] += 1
+        return True
+
+    def mark_item_completed(self, set_id: str, record: Any):
+        """
+        Records that an item reached the artifact and every sink, so --resume skips it.
+
+        Only the SHA-256 of the record is stored; the record itself lives in the artifact.
+        """
+        digest = hashlib.sha256(json.dumps(record, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO item_results (run_id, set_id, result, updated_at) VALUES (?, ?, ?, ?)",
+            (self.run_id, set_id, digest, time.time()),
+        )
+        self._conn.commit()
+
+    def report(self) -> str:
+        return (
+            f"Checkpoints (run {self.run_id}): {self.stats['reused_items']} items and "
+            f"{self.stats['reused_stages']} stages reused, {self.stats['unchanged_stages']} unchanged stages "
+            f"taken from previous runs, {self.stats['saved_stages']} stages computed"
+        )
+
+    def close(self):
+        self._conn.close()
+
+
+async def run_stage(
+        checkpoint: Optional[CheckpointStore],
+        set_id: str,
+        stage: str,
+        create: Callable[[], Awaitable[Any]],
+        input_hash: Optional[str] = None,
+) -> Any:
+    """Runs a stage through the checkpoint store when one is configured."""
+    if checkpoint is None:
+        return await create()
+    return await checkpoint.run_stage(set_id, stage, create, input_hash)
@@ -1,83 +1,22 @@
 #!/usr/bin/env python3
 
-import re
 import json
-from bs4 import BeautifulSoup, NavigableString, Tag
-
-def is_effectively_empty(tag: Tag) -> bool:
-    # Check if a tag is empty or only contains whitespace or other empty tags
-    if not tag.contents:
-        return True
-    for child in tag.contents:
-        if isinstance(child, NavigableString) and child.strip():
-            return False
-        if isinstance(child, Tag) and not is_effectively_empty(child):
-            return False
-    return True
-
-def traverse_and_clean(node):
-    unwrap_tags = ['section', 'article', 'aside', 'div', 'span']
-
-    if isinstance(node, Tag):
-        # Recurse first to clean children before evaluating the current tag
-        for child in list(node.children):
-            traverse_and_clean(child)
-
-        # Remove attributes except colspan and rowspan
-        if node.attrs:
-            attrs_to_remove = [attr for attr in list(node.attrs.keys()) 
-                              if attr not in ['colspan', 'rowspan']]
-            for attr in attrs_to_remove:
-                del node.attrs[attr]
-
-        # Replace <a> with text
-        if node.name == "a":
-            node.replace_with(node.get_text())
-            return
-
-        # Unwrap tags that should be "popped out" if they have content
-        if node.name in unwrap_tags and node.contents:
-            node.unwrap()
-            return  # No need to check for emptiness after unwrapping
-
-        # Remove empty tags
-        if is_effectively_empty(node):
-            node.decompose()
+from html_normalizer import HtmlDocument, strip_non_ascii
 
 def remove_html_tags(text):
     """Remove HTML tags from a string, keeping only the inner text.
     Uses BeautifulSoup to handle malformed HTML gracefully."""
     if not isinstance(text, str):
         return text
-    
-    soup = BeautifulSoup(text, 'html.parser')
-        
-    # Get all text content, preserving some structure with newlines
-    # Remove script and style elements as they don't contain meaningful text
-    for script in soup(["script", "style"]):
-        script.decompose()
-    
-    traverse_and_clean(soup)
 
-    text_content = str(soup)
-    
-    # Clean up excessive whitespace and newlines
-    text_content = re.sub(r'\n\s*\n', '\n', text_content)  # Remove multiple consecutive newlines
-    text_content = re.sub(r'[ \t]+', ' ', text_content)     # Normalize spaces
-    text_content = text_content.strip()
-    
-    return text_content
+    # Script/style removal, attribute stripping, unwrapping and whitespace cleanup on one parse
+    return HtmlDocument(text).remove_scripts().clean().html
 
 def remove_unicode_characters(text):
     """Remove problematic unicode characters from a string, keeping only ASCII characters."""
     if not isinstance(text, str):
         return text
-    # Remove unicode characters but keep basic punctuation and spaces
-    # This keeps ASCII characters (0-127) and common punctuation
-    cleaned = ''.join(char for char in text if ord(char) < 128)
-    # Remove extra whitespace that might be left after cleaning
-    cleaned = re.sub(r'\s+', ' ', cleaned).strip()
-    return cleaned
+    return strip_non_ascii(text)
 
 def clean_json_html(obj):
     """
@@ -94,4 +33,4 @@ def clean_json_html(obj):
         cleaned = remove_html_tags(cleaned)
         return cleaned
     else:
-        return json.dumps(obj) 
\ No newline at end of file
+        return json.dumps(obj)
@@ -4,7 +4,11 @@ import asyncio
 from typing import Optional
 # Removed import of ChatCompletionUserMessageParam
 from bs4 import BeautifulSoup
-from rate_limiter import get_rate_limiter
+from llm_call import chat_completion
+from model_router import route_model, is_blank
+from table_converter import convert_locally, local_conversion_config
+from html_normalizer import demote_headings
+from section_splitter import split_html_section, align_heading_levels, DEFAULT_MAX_PART_TOKENS
 
 prompt = """
 You are an expert in clinical data presentation. Your task is to process raw HTML drug labeling content and convert it into clear, fully detailed, human-readable output suitable for healthcare providers.
@@ -76,74 +80,101 @@ Here is the HTML content to process:
 
 """
 
+# Sent with each part when a long section is enhanced in several calls
+PART_NOTE = """
+The HTML below is part {index} of {count} of a longer label section; the other parts are processed separately and joined with this one.
+Keep the heading levels of the input (an <h2> stays an <h2>), do not add a title or any heading that is not in the input, and do not repeat or refer to content from the other parts.
+"""
+
+
+def _max_part_tokens() -> int:
+    return int(os.getenv("ENHANCE_MAX_PART_TOKENS", DEFAULT_MAX_PART_TOKENS))
+
+
+def enhance_config() -> dict:
+    """Prompts and settings that change the enhanced output, for stage fingerprints."""
+    return {
+        'prompt': prompt,
+        'part_note': PART_NOTE,
+        'max_part_tokens': _max_part_tokens(),
+        'local_tables': local_conversion_config(),
+    }
+
+
+async def _enhance_part(text: str, note: Optional[str] = None) -> str:
+    # Simple tables and tag cleanup are converted locally when --local-tables is on
+    converted = convert_locally(text)
+    if converted is not None:
+        return converted.strip()
+
+    # Create the full prompt by combining the predefined prompt with the input text
+    full_prompt = prompt + text
+
+    # Small inputs go to the cheaper model when routing is enabled
+    model = route_model('enhance', text)
+    messages = [
+        {"role": "user", "content": full_prompt}
+    ]
+    if note is not None:
+        messages.insert(0, {"role": "system", "content": note})
+    temperature = 0.1  # Low temperature for consistent, structured output
+    max_tokens = 4000  # Adjust based on your needs
+
+    # A truncated part fails the item instead of being retried; ENHANCE_MAX_PART_TOKENS is the fix
+    content = await chat_completion(model, messages, temperature, max_tokens, retry_truncated=False)
+    return content.strip()
+
+
 async def enhance_content(text: str) -> str:
     """
-    Enhances content using GPT-4o with the predefined clinical data presentation prompt.
+    Enhances content using the routed model (see model_router) with the predefined clinical data presentation prompt.
+
+    Sections longer than ENHANCE_MAX_PART_TOKENS input tokens are split on heading and
+    table boundaries and the parts are enhanced concurrently, so a long section neither
+    dominates the item's latency nor runs into the completion token limit. The enhanced
+    parts are joined in order with their headings aligned to the input's outline.
+    With local conversion enabled, sections and parts without complex tables or
+    free-form structure are converted without a call (see table_converter).
     
     Args:
         text (str): The HTML content to be processed
-        api_key (Optional[str]): OpenAI API key. If not provided, will use OPENAI_API_KEY environment variable.
     
     Returns:
-        str: The enhanced content processed by GPT-4o
+        str: The enhanced content
     
     Raises:
         ValueError: If no API key is provided and OPENAI_API_KEY environment variable is not set
         openai.OpenAIError: If there's an error with the OpenAI API call
     """
-    # Get API key from parameter or environment variable
-    api_key = os.getenv('OPENAI_API_KEY')
-    # Initialize OpenAI client
-    client = openai.AsyncOpenAI(api_key=api_key)
-
-    # Remove all header tags and their content using BeautifulSoup
+    # Empty sections are not sent to the model
+    if is_blank(text):
+        return ""
 
     try:
-        # Create the full prompt by combining the predefined prompt with the input text
-        full_prompt = prompt + text
-
         print('Enhancing Content...')
 
-        # Get rate limiter for the model
-        model = "gpt-4o"
-        rate_limiter = get_rate_limiter(model)
-        
-        # Use rate limiter before making the API call
-        async with rate_limiter:
-            # Call GPT-4o
-            response = await client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "user", "content": full_prompt}
-                ],
-                temperature=0.1,  # Low temperature for consistent, structured output
-                max_tokens=4000   # Adjust based on your needs
-            )
+        parts = split_html_section(text, _max_part_tokens())
+        if len(parts) == 1:
+            soup = BeautifulSoup(await _enhance_part(text), "html.parser")
+        else:
+            print(f'Enhancing {len(parts)} parts concurrently...')
+            contents = await asyncio.gather(*[
+                _enhance_part(part.html, PART_NOTE.format(index=index, count=len(parts)))
+                for index, part in enumerate(parts, start=1)
+            ])
+            soup = BeautifulSoup("", "html.parser")
+            for part, content in zip(parts, contents):
+                part_soup = BeautifulSoup(content, "html.parser")
+                align_heading_levels(part_soup, part)
+                soup.extend(list(part_soup.contents))
 
         print('Content enhanced')
 
-        # Extract and return the response content
-        result_content = response.choices[0].message.content.strip()
-
-        soup = BeautifulSoup(result_content, "html.parser")
-        # Change all h5 to h6
-        for h5_tag in soup.find_all('h5'):
-            h5_tag.name = 'h6'
-        # Change all h4 to h5
-        for h4_tag in soup.find_all('h4'):
-            h4_tag.name = 'h5'
-        # Change all h3 to h4
-        for h3_tag in soup.find_all('h3'):
-            h3_tag.name = 'h4'
-        # Change all h2 to h3
-        for h2_tag in soup.find_all('h2'):
-            h2_tag.name = 'h3'
-        # Remove all h1 tags
-        for h1_tag in soup.find_all('h1'):
-            h1_tag.decompose()
+        # Remove h1 and move h2-h5 one level down, in one pass over the tree
+        demote_headings(soup)
         return str(soup)
 
     except openai.OpenAIError as e:
         raise openai.OpenAIError(f"Error calling OpenAI API: {str(e)}")
     except Exception as e:
-        raise Exception(f"Unexpected error: {str(e)}")
\ No newline at end of file
+        raise Exception(f"Unexpected error: {str(e)}")
@@ -2,13 +2,17 @@ import json
 import os
 import sys
 import asyncio
-from typing import Dict, Any, List
-from openai import AsyncOpenAI
+from functools import partial
+from typing import Dict, Any, List, Type
 from dotenv import load_dotenv
-from pydantic import BaseModel
+from openai import LengthFinishReasonError
+from pydantic import BaseModel, ValidationError
 
-from rate_limiter import get_rate_limiter
 from clean_json_html import remove_html_tags
+from llm_call import chat_completion
+from token_counter import count_tokens
+from request_packer import get_request_packer
+from model_router import route_model, is_blank
 
 # Load environment variables from .env file in the parent directory (project root)
 load_dotenv('../.env')
@@ -22,46 +26,95 @@ class TagList(BaseModel):
     tags: List[str]
 
 
-async def extract_tags(prompt: str) -> dict:
+class TagCategories(BaseModel):
+    condition: List[str]
+    substance: List[str]
+    indications: List[str]
+    strengthsConcentrations: List[str]
+    population: List[str]
+
+
+class DrugTagCategories(TagCategories):
+    setId: str
+
+
+class PackedTagCategories(BaseModel):
+    drugs: List[DrugTagCategories]
+
+
+async def extract_tags(
+        prompt: str,
+        response_format: Type[BaseModel] = TagList,
+        max_tokens: int = 500,
+        model: str = "gpt-4o",
+) -> dict:
     """
-    Extracts condition tags from a q_item dictionary using GPT-4
-    without hallucinating or adding information not present in the original text.
+    Runs a tag extraction prompt with structured output and returns the parsed response.
 
     Args:
-        q_item: A dictionary containing item data with description content
+        prompt: The extraction prompt, including the content to extract from
+        response_format: Pydantic model of the structured output (TagList by default)
+        max_tokens: Completion token limit
+        model: Model to call (chosen by route_model at the call sites)
 
     Returns:
-        A TagList object containing extracted condition tags
+        The parsed response as a dict (e.g. {"tags": [...]})
     """
 
-    # Initialize OpenAI client
-    client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-
     try:
-        # Get rate limiter for the model
-        model = "gpt-4o"
-        rate_limiter = get_rate_limiter(model)
-
-        # Use rate limiter before making the API call
-        async with rate_limiter:
-            # Use GPT-4 for the best extraction quality
-            response = await client.chat.completions.parse(
-                model=model,
-                messages=[
-                    {"role": "system", "content": prompt},
-                ],
-                temperature=0,  # Low temperature for more deterministic output
-                max_tokens=500,
-                response_format=TagList,
-            )
+        messages = [
+            {"role": "system", "content": prompt},
+        ]
+        temperature = 0  # Low temperature for more deterministic output
+
+        content = await chat_completion(model, messages, temperature, max_tokens, response_format=response_format)
 
-        return json.loads(response.choices[0].message.content)
+        return json.loads(content)
 
     except Exception as e:
         print(f"Error during extraction: {e}")
         raise e
 
 
+# Extraction rules of each tag category, shared by the per-category and merged prompts
+TAG_RULES = {
+    'condition': """- Include only diagnosed **conditions** or **diseases**.
+- **Do not include** patient populations, treatment goals, symptoms, or dosage information.
+- Return generic terms only (no brand names, abbreviations, or drug names).
+- Normalize plurals (e.g., "infections" → "infection") and use sentence case.""",
+    'substance': """- Include only active **chemical substances**, **biologic agents**, or **defined ingredients**.
+- **Do not include** brand names, excipients, inactive ingredients, or dosage forms.
+- Normalize common spelling variants (e.g., “Paracetamol” → “Acetaminophen” if applicable).
+- Use correct capitalization (e.g., “Metformin”, not “metformin” or “METFORMIN”).""",
+    'indications': """- Include only **diagnosed conditions** or **disease names** that are explicitly treated by the drug.
+- **Do not include** symptoms, patient populations, therapeutic goals, dosage details, or procedures.
+- Use proper medical terminology (no slang, no abbreviations, no brand names).
+- Normalize plurals (e.g., "infections" → "infection") and use sentence case (e.g., "Heart failure").""",
+    'strengthsConcentrations': """- Include only values representing **strength**, **dose**, or **concentration** of the active ingredient.
+- Valid formats include: `mg`, `g`, `mcg`, `mg/mL`, `%`, `Units/mL`, etc.
+- **Do not include** package quantities (e.g., "30 tablets") or frequencies (e.g., "twice daily").
+- If multiple strengths are mentioned, include each as a separate item in the array.
+- Preserve correct casing and spacing as written in the input.""",
+    'population': """- Include only **explicitly referenced populations** (e.g., age-based groups, pregnancy/lactation, organ impairment).
+- **Do not include** general usage notes, dosage instructions, or treatment goals.
+- Normalize common phrases into consistent categories (e.g., “children 6 years and older” → “Pediatric”).
+- Use sentence case for all population tags.""",
+    'contraindications': """- Include only conditions, diagnoses, or population characteristics that are stated as contraindications.
+- **Do not include** side effects, general warnings, dosage information, or indications.
+- Normalize terms to sentence case (e.g., "Severe hepatic impairment").
+- Use generic clinical terms only—do not include brand names or abbreviations.""",
+}
+
+# What each category holds, introducing its rules in the merged prompt
+TAG_TARGETS = {
+    'condition': 'The **conditions or diseases** the drug is indicated to treat, not symptoms, signs, procedures, or populations (e.g. "Hypertension", "Type 2 Diabetes", "Rheumatoid Arthritis").',
+    'substance': 'The **substances or active pharmaceutical ingredients** that serve as the therapeutic agents (e.g. "Lisinopril", "Acetaminophen", "Insulin glargine").',
+    'indications': 'The **indications** for which the drug is prescribed (e.g. "Hypertension", "Type 2 Diabetes", "Rheumatoid Arthritis").',
+    'strengthsConcentrations': 'The **strengths and concentrations** in which the drug is available (e.g. "10 mg", "100 mg/mL", "0.1%").',
+    'population': 'The **patient populations** for which the drug is **approved**, **recommended**, or **restricted** (e.g. "Pediatric", "Pregnant", "Geriatric", "Renal impairment").',
+}
+
+
 def get_extract_condition_tags_prompt(content):
     return f"""
 You are a medical data extraction assistant. Your task is to extract the **conditions or diseases** that a drug is indicated to treat based on the text provided. Focus only on medically recognized conditions—not symptoms, signs, procedures, or populations.
@@ -70,10 +123,7 @@ You are a medical data extraction assistant. Your task is to extract the **condi
 Return only a **JSON array** of distinct condition names. Each item must be a concise, human-readable term (e.g., "Hypertension", "Type 2 Diabetes", "Rheumatoid Arthritis").
 
 ## Extraction Rules:
-- Include only diagnosed **conditions** or **diseases**.
-- **Do not include** patient populations, treatment goals, symptoms, or dosage information.
-- Return generic terms only (no brand names, abbreviations, or drug names).
-- Normalize plurals (e.g., "infections" → "infection") and use sentence case.
+{TAG_RULES['condition']}
 
 ## Example Input:
 "Lisinopril is indicated for the treatment of hypertension in adults and pediatric patients 6 years and older. It is also indicated to reduce signs and symptoms of heart failure and to improve survival in patients with acute myocardial infarction."
@@ -102,11 +152,12 @@ async def extract_condition_tags(q_item: Dict[str, Any]) -> dict:
     content += q_item['label']['description']
 
     # If no content found, return an empty string
-    if not content:
+    if is_blank(content):
         return {"tags": []}
 
+    model = route_model('tags:condition', content)
     content = remove_html_tags(content)
-    tag_list = await extract_tags(get_extract_condition_tags_prompt(content))
+    tag_list = await extract_tags(get_extract_condition_tags_prompt(content), model=model)
     return tag_list
 
 
@@ -118,10 +169,7 @@ You are a medical data extraction assistant. Your task is to extract the **subst
 Return only a **JSON array** under the `"substances"` key. Each item must be a concise, human-readable name of a substance (e.g., "Lisinopril", "Acetaminophen", "Insulin glargine").
 
 ## Extraction Rules:
-- Include only active **chemical substances**, **biologic agents**, or **defined ingredients**.
-- **Do not include** brand names, excipients, inactive ingredients, or dosage forms.
-- Normalize common spelling variants (e.g., “Paracetamol” → “Acetaminophen” if applicable).
-- Use correct capitalization (e.g., “Metformin”, not “metformin” or “METFORMIN”).
+{TAG_RULES['substance']}
 
 ## Example Input:
 "This product contains metformin hydrochloride as the active ingredient. It also includes povidone, magnesium stearate, and microcrystalline cellulose."
@@ -146,11 +194,12 @@ async def extract_substance_tags(q_item: Dict[str, Any]) -> dict:
     content = q_item['label']['description']
 
     # If no content found, return an empty string
-    if not content:
+    if is_blank(content):
         return {"tags": []}
 
+    model = route_model('tags:substance', content)
     content = remove_html_tags(content)
-    tag_list = await extract_tags(get_extract_substance_tags_prompt(content))
+    tag_list = await extract_tags(get_extract_substance_tags_prompt(content), model=model)
     return tag_list
 
 
@@ -162,10 +211,7 @@ You are a medical data extraction assistant. Your task is to extract the **indic
 Return only a **JSON array** under the key `"indications"`. Each item must be a concise, human-readable medical term (e.g., "Hypertension", "Type 2 Diabetes", "Rheumatoid Arthritis").
 
 ## Extraction Rules:
-- Include only **diagnosed conditions** or **disease names** that are explicitly treated by the drug.
-- **Do not include** symptoms, patient populations, therapeutic goals, dosage details, or procedures.
-- Use proper medical terminology (no slang, no abbreviations, no brand names).
-- Normalize plurals (e.g., "infections" → "infection") and use sentence case (e.g., "Heart failure").
+{TAG_RULES['indications']}
 
 ## Example Input:
 "Lisinopril is indicated for the treatment of hypertension in adults and pediatric patients 6 years and older. It is also indicated to reduce signs and symptoms of heart failure and to improve survival in patients with acute myocardial infarction."
@@ -190,11 +236,12 @@ async def extract_indication_tags(q_item: Dict[str, Any]) -> dict:
     content += q_item['label']['dosageAndAdministration']
 
     # If no content found, return an empty string
-    if not content:
+    if is_blank(content):
         return {"tags": []}
 
+    model = route_model('tags:indications', content)
     content = remove_html_tags(content)
-    tag_list = await extract_tags(get_extract_indications_prompt(content))
+    tag_list = await extract_tags(get_extract_indications_prompt(content), model=model)
     return tag_list
 
 
@@ -206,11 +253,7 @@ You are a medical data extraction assistant. Your task is to extract the **stren
 Return only a **JSON array** under the key `"strengths"`. Each item must be a precise, human-readable string that reflects a dosage strength or concentration (e.g., "10 mg", "100 mg/mL", "0.1%").
 
 ## Extraction Rules:
-- Include only values representing **strength**, **dose**, or **concentration** of the active ingredient.
-- Valid formats include: `mg`, `g`, `mcg`, `mg/mL`, `%`, `Units/mL`, etc.
-- **Do not include** package quantities (e.g., "30 tablets") or frequencies (e.g., "twice daily").
-- If multiple strengths are mentioned, include each as a separate item in the array.
-- Preserve correct casing and spacing as written in the input.
+{TAG_RULES['strengthsConcentrations']}
 
 ## Example Input:
 "This product is supplied as tablets containing 10 mg, 20 mg, or 40 mg of lisinopril. An oral solution is also available in 1 mg/mL concentration."
@@ -237,11 +280,12 @@ async def extract_strengths_and_concentrations_tags(q_item: Dict[str, Any]) -> d
     content += q_item['label']['description']
 
     # If no content found, return an empty string
-    if not content:
+    if is_blank(content):
         return {"tags": []}
 
+    model = route_model('tags:strengthsConcentrations', content)
     content = remove_html_tags(content)
-    tag_list = await extract_tags(get_extract_strengths_and_concentrations(content))
+    tag_list = await extract_tags(get_extract_strengths_and_concentrations(content), model=model)
     return tag_list
 
 
@@ -253,10 +297,7 @@ You are a medical data extraction assistant. Your task is to extract the **popul
 Return only a **JSON array** under the key `"populations"`. Each item must be a concise, human-readable population group (e.g., "Pediatric", "Pregnant", "Geriatric", "Renal impairment").
 
 ## Extraction Rules:
-- Include only **explicitly referenced populations** (e.g., age-based groups, pregnancy/lactation, organ impairment).
-- **Do not include** general usage notes, dosage instructions, or treatment goals.
-- Normalize common phrases into consistent categories (e.g., “children 6 years and older” → “Pediatric”).
-- Use sentence case for all population tags.
+{TAG_RULES['population']}
 
 ## Example Input:
 "This medication is indicated in adults and children aged 6 years and older. Use in geriatric patients should be closely monitored. Safety during pregnancy has not been established. Dosage adjustment may be required in patients with renal impairment."
@@ -284,11 +325,12 @@ async def extract_population_tags(q_item: Dict[str, Any]) -> dict:
     content += q_item['label']['description']
 
     # If no content found, return an empty string
-    if not content:
+    if is_blank(content):
         return {"tags": []}
 
+    model = route_model('tags:population', content)
     content = remove_html_tags(content)
-    tag_list = await extract_tags(get_extract_population(content))
+    tag_list = await extract_tags(get_extract_population(content), model=model)
     return tag_list
 
 
@@ -300,10 +342,7 @@ You are a medical data extraction assistant. Your task is to extract the **contr
 Return only a **JSON array** under the key `"contraindications"`. Each item must be a concise, human-readable term (e.g., "Angioedema", "Pregnancy", "Severe renal impairment").
 
 ## Extraction Rules:
-- Include only conditions, diagnoses, or population characteristics that are stated as contraindications.
-- **Do not include** side effects, general warnings, dosage information, or indications.
-- Normalize terms to sentence case (e.g., "Severe hepatic impairment").
-- Use generic clinical terms only—do not include brand names or abbreviations.
+{TAG_RULES['contraindications']}
 
 ## Example Input:
 "Use of this drug is contraindicated in patients with a history of angioedema related to previous ACE inhibitor therapy. It should also not be used during pregnancy or in patients with severe renal impairment."
@@ -327,9 +366,178 @@ async def extract_contraindications_tags(q_item: Dict[str, Any]) -> dict:
     content = q_item['label']['contraindications']
 
     # If no content found, return an empty string
-    if not content:
+    if is_blank(content):
         return {"tags": []}
 
+    model = route_model('tags:contraindications', content)
     content = remove_html_tags(content)
-    tag_list = await extract_tags(get_extract_contraindications(content))
+    tag_list = await extract_tags(get_extract_contraindications(content), model=model)
     return tag_list
+
+
+# Label sections each tag category is extracted from, as in the per-category functions
+TAG_SOURCES = {
+    'condition': ['indicationsAndUsage', 'dosageAndAdministration', 'description'],
+    'substance': ['description'],
+    'indications': ['indicationsAndUsage', 'dosageAndAdministration'],
+    'strengthsConcentrations': ['indicationsAndUsage', 'dosageFormsAndStrengths', 'description'],
+    'population': ['indicationsAndUsage', 'dosageFormsAndStrengths', 'description'],
+}
+
+# Per-category functions used when the merged response does not match the schema
+TAG_FALLBACKS = {
+    'condition': extract_condition_tags,
+    'substance': extract_substance_tags,
+    'indications': extract_indication_tags,
+    'strengthsConcentrations': extract_strengths_and_concentrations_tags,
+    'population': extract_population_tags,
+}
+
+def _tag_rules(categories: List[str]) -> str:
+    return "\n\n".join(
+        f"### {category} (from {', '.join(TAG_SOURCES[category])})\n{TAG_TARGETS[category]}\n{TAG_RULES[category]}"
+        for category in categories
+    )
+
+
+def _tag_sections(sections: Dict[str, str]) -> str:
+    return "\n\n".join(f"## BEGIN {name}:\n{content}\n## END {name}" for name, content in sections.items())
+
+
+def _tag_categories(sections: Dict[str, str]) -> List[str]:
+    # Categories with at least one non-empty source section
+    return [category for category, sources in TAG_SOURCES.items() if any(name in sections for name in sources)]
+
+
+def get_extract_all_tags_prompt(sections: Dict[str, str], categories: List[str]) -> str:
+    rules = _tag_rules(categories)
+    source_content = _tag_sections(sections)
+    return f"""
+You are a medical data extraction assistant. Extract the tag categories below from the drug labeling sections provided, reading each category only from the sections listed next to it.
+
+## Output Format:
+Return a JSON object with one array of distinct, concise, human-readable strings per category. Return an empty array for a category that is not listed below or has nothing to extract.
+
+## Categories and Extraction Rules:
+{rules}
+
+## Input:
+{source_content}
+"""
+
+
+async def extract_all_tags(q_item: Dict[str, Any], pack: bool = True) -> Dict[str, dict]:
+    """
+    Extracts every tag category of a drug with one structured-output call instead of five.
+
+    The union of the needed sections is sent once (HTML stripped) together with the
+    per-category extraction rules, and the response is validated against TagCategories.
+    If it does not match the schema, the per-category extract_* functions are used.
+    When request packing is enabled, short inputs are sent together with other drugs'.
+
+    Args:
+        q_item: A dictionary containing item data with the enhanced label sections
+        pack: Whether the request may be packed with other drugs
+
+    Returns:
+        A dict mapping each category (condition, substance, indications,
+        strengthsConcentrations, population) to a {"tags": [...]} dict
+    """
+    label = q_item['label']
+
+    # Categories without source content get no tags, as in the per-category functions
+    categories = [
+        category for category, sources in TAG_SOURCES.items()
+        if not is_blank("".join(label[section] for section in sources))
+    ]
+    results = {category: {"tags": []} for category in TAG_SOURCES}
+    if not categories:
+        return results
+
+    sections = {}
+    for section in dict.fromkeys(name for category in categories for name in TAG_SOURCES[category]):
+        if not is_blank(label[section]):
+            sections[section] = remove_html_tags(label[section])
+
+    packer = get_request_packer('tags') if pack else None
+    if packer is not None:
+        tokens = count_tokens("".join(sections.values()))
+        if packer.fits(tokens):
+            return await packer.submit(
+                q_item['setId'], sections, tokens, fallback=partial(extract_all_tags, q_item, pack=False)
+            )
+
+    try:
+        extracted = await extract_tags(
+            get_extract_all_tags_prompt(sections, categories),
+            response_format=TagCategories,
+            max_tokens=1500,
+            model=route_model('tags:all', "".join(label[section] for section in sections)),
+        )
+        extracted = TagCategories.model_validate(extracted).model_dump()
+    except (ValidationError, ValueError, LengthFinishReasonError) as e:
+        print(f"Merged tag extraction for {q_item['drugName']} did not match the schema: {e}")
+        fallbacks = await asyncio.gather(*[TAG_FALLBACKS[category](q_item) for category in categories])
+        results.update(zip(categories, fallbacks))
+        return results
+
+    for category in categories:
+        results[category] = {"tags": extracted[category]}
+    return results
+
+
+def get_extract_packed_tags_prompt(drug_sections: Dict[str, Dict[str, str]]) -> str:
+    drugs = "\n\n".join(
+        f"# DRUG setId: {set_id}\n{_tag_sections(sections)}\n# END DRUG {set_id}" for set_id, sections in drug_sections.items()
+    )
+    return f"""
+You are a medical data extraction assistant. Extract the tag categories below for each of the drugs that follow, reading each drug's categories only from that drug's own sections, and only from the sections listed next to each category.
+
+## Output Format:
+Return a JSON object with a "drugs" array holding one entry per drug: its setId exactly as given and one array of distinct, concise, human-readable strings per category. Return an empty array for a category with nothing to extract.
+
+## Categories and Extraction Rules:
+{_tag_rules(list(TAG_SOURCES))}
+
+## Input:
+{drugs}
+"""
+
+
+async def extract_packed_tags(drug_sections: Dict[str, Dict[str, str]]) -> Dict[str, Dict[str, dict]]:
+    """
+    Extracts the tags of several drugs with short labels in one structured-output call.
+
+    Entries are matched back by setId and validated one by one, so a malformed or
+    missing entry only sends that drug to its own request.
+
+    Args:
+        drug_sections: Maps each setId to its HTML-stripped source sections
+
+    Returns:
+        A dict mapping the setIds that were answered to their extract_all_tags result
+    """
+    extracted = await extract_tags(
+        get_extract_packed_tags_prompt(drug_sections),
+        response_format=PackedTagCategories,
+        max_tokens=min(16000, 1500 * len(drug_sections)),
+        model=route_model('tags:all:packed', "".join(
+            content for sections in drug_sections.values() for content in sections.values()
+        )),
+    )
+
+    results = {}
+    drugs = extracted.get("drugs") if isinstance(extracted, dict) else None
+    for entry in drugs or []:
+        try:
+            drug = DrugTagCategories.model_validate(entry)
+        except ValidationError:
+            continue
+        set_id = drug.setId.strip()
+        if set_id not in drug_sections or set_id in results:
+            continue
+        categories = _tag_categories(drug_sections[set_id])
+        results[set_id] = {
+            category: {"tags": getattr(drug, category) if category in categories else []} for category in TAG_SOURCES
+        }
+    return results
@@ -0,0 +1,316 @@
+import os
+import re
+import json
+from functools import lru_cache
+from typing import Any, Collection, Optional, Tuple
+
+from bs4 import BeautifulSoup, NavigableString, Tag
+
+# BeautifulSoup backend. html.parser is the reference for the stored outputs; lxml parses
+# several times faster but repairs malformed markup differently, so it is opt-in.
+DEFAULT_PARSER = "html.parser"
+
+UNWRAP_TAGS = ('section', 'article', 'aside', 'div', 'span')
+KEEP_ATTRIBUTES = ('colspan', 'rowspan')
+HEADING_TAGS = ('h1', 'h2', 'h3', 'h4', 'h5', 'h6')
+
+# Elements that start and end a line of the text view; other tags are inline
+BLOCK_TAGS = frozenset({
+    'address', 'article', 'aside', 'blockquote', 'br', 'caption', 'dd', 'details', 'div', 'dl',
+    'dt', 'fieldset', 'figcaption', 'figure', 'footer', 'form', 'header', 'hr', 'li', 'main',
+    'nav', 'ol', 'p', 'pre', 'section', 'summary', 'table', 'tbody', 'td', 'tfoot', 'th',
+    'thead', 'tr', 'ul', *HEADING_TAGS,
+})
+# Elements whose content is not text
+SKIPPED_TAGS = frozenset({'script', 'style', 'template'})
+
+_WHITESPACE_RUN = re.compile(r'\s+')
+_BLANK_LINES = re.compile(r'\n\s*\n')
+_SPACES = re.compile(r'[ \t]+')
+
+
+@lru_cache(maxsize=None)
+def get_parser() -> str:
+    """
+    Returns the BeautifulSoup backend configured with HTML_PARSER, falling back to
+    html.parser when the requested one (e.g. lxml) is not installed.
+    """
+    parser = os.getenv("HTML_PARSER", DEFAULT_PARSER)
+    if parser != DEFAULT_PARSER:
+        try:
+            BeautifulSoup("", parser)
+        except Exception:
+            print(f"HTML parser {parser} is not available, using {DEFAULT_PARSER}")
+            return DEFAULT_PARSER
+    return parser
+
+
+def strip_non_ascii(text: str) -> str:
+    """Keeps only ASCII characters and collapses whitespace runs to single spaces."""
+    cleaned = text.encode('ascii', 'ignore').decode('ascii')
+    return _WHITESPACE_RUN.sub(' ', cleaned).strip()
+
+
+def _is_text(node) -> bool:
+    # Plain text only; comments, CDATA and doctypes are NavigableString subclasses
+    return type(node) is NavigableString
+
+
+class HtmlDocument:
+    """
+    One parsed HTML string and the normalization passes applied to its tree.
+
+    The string is parsed once; clean(), repair() and demote_headings() mutate the same
+    tree, and the html and text views are rendered from it. Each pass gives the output
+    the former serialize-and-reparse chain (remove_html_tags, fix_html_with_beautifulsoup,
+    prepare_item_for_vector_search) produced, without the intermediate parses.
+    """
+
+    def __init__(self, html: str, parser: Optional[str] = None):
+        self.parser = parser or get_parser()
+        self.soup = BeautifulSoup(html, self.parser)
+        # Document parsers (lxml) wrap fragments in <html><body>
+        self.root = self.soup.body if self.parser != DEFAULT_PARSER and self.soup.body else self.soup
+
+    def remove_scripts(self) -> "HtmlDocument":
+        for script in self.root(["script", "style"]):
+            script.decompose()
+        return self
+
+    def clean(self) -> "HtmlDocument":
+        """Strips attributes (except colspan/rowspan), replaces links with their text,
+        unwraps layout tags, drops empty tags and normalizes whitespace."""
+        for child in list(self.root.children):
+            self._clean_node(child)
+        # A document left without tags or text is emptied, comments included
+        if not any(isinstance(child, Tag) or child.strip() for child in self.root.contents):
+            self.root.clear()
+        self._normalize_whitespace()
+        return self
+
+    def _clean_node(self, node):
+        if not isinstance(node, Tag):
+            return
+
+        # Recurse first to clean children before evaluating the current tag
+        for child in list(node.children):
+            self._clean_node(child)
+
+        if node.attrs:
+            node.attrs = {name: value for name, value in node.attrs.items() if name in KEEP_ATTRIBUTES}
+
+        # Replace <a> with text
+        if node.name == "a":
+            node.replace_with(node.get_text())
+            return
+
+        # Unwrap tags that should be "popped out" if they have content
+        if node.name in UNWRAP_TAGS and node.contents:
+            node.unwrap()
+            return
+
+        # Children left after cleaning are non-empty tags, so only text can make the tag non-empty
+        if not any(isinstance(child, Tag) or child.strip() for child in node.contents):
+            node.decompose()
+
+    def _normalize_whitespace(self):
+        # Merge adjacent text nodes and collapse spaces, as serializing and reparsing would
+        for tag in [self.root, *self.root.find_all(True)]:
+            run = []
+            for child in list(tag.contents) + [None]:
+                if child is not None and _is_text(child):
+                    run.append(child)
+                    continue
+                if run:
+                    text = _SPACES.sub(' ', _BLANK_LINES.sub('\n', ''.join(run)))
+                    if text != ''.join(run) or len(run) > 1:
+                        run[0].replace_with(NavigableString(text))
+                        for extra in run[1:]:
+                            extra.extract()
+                    run = []
+            for name, value in tag.attrs.items():
+                if isinstance(value, str):
+                    tag.attrs[name] = _SPACES.sub(' ', value)
+
+        contents = self.root.contents
+        if contents and _is_text(contents[0]):
+            contents[0].replace_with(NavigableString(contents[0].lstrip()))
+        if contents and _is_text(contents[-1]):
+            contents[-1].replace_with(NavigableString(contents[-1].rstrip()))
+        for child in list(self.root.contents):
+            if _is_text(child) and not child:
+                child.extract()
+
+    def repair(self) -> "HtmlDocument":
+        """Wraps orphaned <tr> in <table>, <td>/<th> in <tr> (and <table>) and <li> in <ul>."""
+        # One walk over the tree; a wrapper only adds ancestors to the element it wraps,
+        # so handling the elements in document order gives the same tree as one walk per tag
+        for element in self.root.find_all(['tr', 'td', 'th', 'li']):
+            if element.name == 'tr':
+                if not element.find_parent('table'):
+                    print(f"Fixing orphaned TR: {element}")
+                    table = self.soup.new_tag('table')
+                    element.wrap(table)
+                    print(f"Wrapped TR in table: {table}")
+            elif element.name == 'li':
+                if not element.find_parent(['ul', 'ol']):
+                    print(f"Fixing orphaned LI: {element}")
+                    ul = self.soup.new_tag('ul')
+                    element.wrap(ul)
+                    print(f"Wrapped LI in UL: {ul}")
+            elif not element.find_parent('tr'):
+                print(f"Fixing orphaned TD/TH: {element}")
+                tr = self.soup.new_tag('tr')
+                element.wrap(tr)
+                if not tr.find_parent('table'):
+                    table = self.soup.new_tag('table')
+                    tr.wrap(table)
+                    print(f"Wrapped TD/TH in TR and table: {table}")
+        return self
+
+    def demote_headings(self) -> "HtmlDocument":
+        demote_headings(self.root)
+        return self
+
+    @property
+    def html(self) -> str:
+        if self.root is self.soup:
+            return str(self.soup)
+        return self.root.decode_contents()
+
+    def text(self, default: str) -> str:
+        """
+        Plain-text view used for vector search: each block's text on its own line.
+
+        Args:
+            default: Returned when the document has no tags or no text
+
+        Returns:
+            The text, one non-empty line per block
+        """
+        if not self.root.find():
+            return default
+        processed_text = extract_text(self.root)
+        return processed_text if processed_text else default
+
+
+def extract_text(root: Tag) -> str:
+    """
+    Extracts the text of a tree in one pass, one line per block element.
+
+    Each text node is emitted once: inline tags (b, i, sup, a, ...) are joined on the
+    current line, and block tags (p, li, td, headings, ...) and <br> end it.
+
+    Args:
+        root: The parsed document or element
+
+    Returns:
+        The non-empty lines, whitespace collapsed, joined with newlines
+    """
+    lines = []
+    line = []
+
+    def end_line():
+        text = _WHITESPACE_RUN.sub(' ', ''.join(line)).strip()
+        if text:
+            lines.append(text)
+        line.clear()
+
+    # Explicit stack of child iterators, so deep nesting does not hit the recursion limit
+    stack = [(root, iter(root.contents))]
+    while stack:
+        element, children = stack[-1]
+        child = next(children, None)
+        if child is None:
+            stack.pop()
+            if element.name in BLOCK_TAGS:
+                end_line()
+        elif isinstance(child, Tag):
+            if child.name in SKIPPED_TAGS:
+                continue
+            if child.name in BLOCK_TAGS:
+                end_line()
+            stack.append((child, iter(child.contents)))
+        elif _is_text(child):
+            line.append(child)
+    end_line()
+    return "\n".join(lines)
+
+
+def demote_headings(root: Tag):
+    """Removes <h1> and moves <h2>-<h5> one level down (<h6> stays), in a single pass."""
+    # Reverse document order, so headings nested in an <h1> are handled before it is removed
+    for heading in reversed(root.find_all(HEADING_TAGS)):
+        if heading.name == 'h1':
+            heading.decompose()
+        elif heading.name != 'h6':
+            heading.name = f"h{int(heading.name[1]) + 1}"
+
+
+def clean_html(html: str) -> str:
+    """Returns the cleaned HTML of a string (see HtmlDocument.clean)."""
+    return HtmlDocument(html).remove_scripts().clean().html
+
+
+def normalize_label_value(value: Any, text_view: bool = True) -> Tuple[Any, Any]:
+    """
+    Cleans and repairs a raw label value and renders its text view from the same parse.
+
+    Args:
+        value: A string, a number/bool/None, or a dict/list of them
+        text_view: Whether to also render the text view
+
+    Returns:
+        (normalized html value, text value or None), in the structure of the input
+    """
+    if isinstance(value, dict):
+        pairs = {key: normalize_label_value(item, text_view) for key, item in value.items()}
+        return {key: pair[0] for key, pair in pairs.items()}, \
+            ({key: pair[1] for key, pair in pairs.items()} if text_view else None)
+    if isinstance(value, list):
+        pairs = [normalize_label_value(item, text_view) for item in value]
+        return [pair[0] for pair in pairs], ([pair[1] for pair in pairs] if text_view else None)
+
+    if isinstance(value, str):
+        document = HtmlDocument(strip_non_ascii(value)).remove_scripts().clean().repair()
+    else:
+        # Non-string values are stored as their JSON text
+        document = HtmlDocument(json.dumps(value)).repair()
+    html = document.html
+    return html, (document.text(html) if text_view else None)
+
+
+def normalize_item(item: dict, text_exclude: Collection[str] = ()) -> Tuple[dict, dict]:
+    """
+    Normalizes a raw label item with one parse per string.
+
+    Args:
+        item: The raw item (drugName, setId, ..., label)
+        text_exclude: Label sections left out of the text view (they are rendered later)
+
+    Returns:
+        (item with cleaned and repaired HTML, text view of the item for vector search)
+    """
+    html_item, text_item = {}, {}
+    for key, value in item.items():
+        if key == 'label' and isinstance(value, dict):
+            html_item[key], text_item[key] = {}, {}
+            for section, content in value.items():
+                included = section not in text_exclude
+                html_item[key][section], text = normalize_label_value(content, text_view=included)
+                if included:
+                    text_item[key][section] = text
+        else:
+            html_item[key], text_item[key] = normalize_label_value(value)
+    return html_item, text_item
+
+
+def text_view(value: Any) -> Any:
+    """Renders the text view of an HTML value (or a dict/list of them) without cleaning it."""
+    if isinstance(value, dict):
+        return {key: text_view(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [text_view(item) for item in value]
+    if isinstance(value, str):
+        return HtmlDocument(value).remove_scripts().text(value)
+    return json.dumps(value)
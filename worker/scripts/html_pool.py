@@ -0,0 +1,80 @@
+import os
+import sys
+import time
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Optional
+
+# Process pool running the CPU-heavy BeautifulSoup passes, when enabled
+_html_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _init_worker(paths):
+    # Make the scripts importable in spawned workers and pay the import cost up front
+    for path in reversed(paths):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    # Same module paths as the functions process_data submits, so the tasks find them already imported
+    import bs4  # noqa: F401
+    import scripts.html_normalizer  # noqa: F401
+    import scripts.prepare_item_for_vector_search  # noqa: F401
+    import scripts.structure_json_html  # noqa: F401
+
+
+def _warm_up(_) -> int:
+    # Hold the worker briefly so each warm-up task lands on a different process
+    time.sleep(0.1)
+    return os.getpid()
+
+
+def start_html_pool(workers: int) -> Optional[ProcessPoolExecutor]:
+    """
+    Starts the process pool used for HTML transforms and pre-warms its workers.
+
+    Args:
+        workers: Number of worker processes; 0 keeps the transforms on the event loop thread
+
+    Returns:
+        The executor, or None when the pool is disabled
+    """
+    global _html_pool
+
+    if workers <= 0:
+        return None
+
+    scripts_dir = os.path.dirname(os.path.abspath(__file__))
+    _html_pool = ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=([scripts_dir, os.path.dirname(scripts_dir)],),
+    )
+
+    # One task per worker forces every process to start (and import bs4) before the run
+    pids = set(_html_pool.map(_warm_up, range(workers)))
+    print(f"HTML process pool started with {len(pids)} workers")
+    return _html_pool
+
+
+async def run_html(fn: Callable[..., Any], *args) -> Any:
+    """
+    Runs an HTML transform on the process pool, or inline when the pool is disabled.
+
+    Args:
+        fn: A picklable, module-level function
+        args: Arguments passed to fn
+
+    Returns:
+        The result of fn(*args)
+    """
+    if _html_pool is None:
+        return fn(*args)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_html_pool, fn, *args)
+
+
+def shutdown_html_pool():
+    global _html_pool
+
+    if _html_pool is not None:
+        _html_pool.shutdown(wait=True)
+        _html_pool = None
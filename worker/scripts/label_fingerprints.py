@@ -0,0 +1,97 @@
+import json
+import hashlib
+from typing import Any, Dict, List, Optional
+
+# Raw label sections each LLM stage reads, directly or through enhance_content
+STAGE_INPUTS = {
+    'enhance:description': ['description'],
+    'enhance:indicationsAndUsage': ['indicationsAndUsage'],
+    'enhance:dosageAndAdministration': ['dosageAndAdministration'],
+    'enhance:dosageFormsAndStrengths': ['dosageFormsAndStrengths'],
+    'enhance:contraindications': ['contraindications'],
+    'enhance:warningsAndPrecautions': ['warningsAndPrecautions'],
+    'enhance:adverseReactions': ['adverseReactions'],
+    'summary:metaDescription': ['description'],
+    'summary:description': ['description'],
+    'summary:useAndConditions': ['indicationsAndUsage', 'dosageAndAdministration'],
+    'summary:contraIndications': ['contraindications'],
+    'summary:warnings': ['warningsAndPrecautions'],
+    'summary:dosing': ['dosageAndAdministration', 'dosageFormsAndStrengths'],
+    'summary:all': ['description', 'indicationsAndUsage', 'dosageAndAdministration', 'dosageFormsAndStrengths',
+                    'contraindications', 'warningsAndPrecautions'],
+    'tags:condition': ['indicationsAndUsage', 'dosageAndAdministration', 'description'],
+    'tags:substance': ['description'],
+    'tags:indications': ['indicationsAndUsage', 'dosageAndAdministration'],
+    'tags:strengthsConcentrations': ['indicationsAndUsage', 'dosageFormsAndStrengths', 'description'],
+    'tags:population': ['indicationsAndUsage', 'dosageFormsAndStrengths', 'description'],
+    'tags:all': ['indicationsAndUsage', 'dosageAndAdministration', 'dosageFormsAndStrengths', 'description'],
+}
+
+# Bump the version of a stage family when its prompts or output format change, so
+# --incremental runs it again instead of reusing outputs of the previous prompts
+STAGE_VERSIONS = {
+    'enhance': 1,
+    'summary': 1,
+    'tags': 2,
+}
+
+
+def _digest(value: Any) -> str:
+    if not isinstance(value, str):
+        value = json.dumps(value, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()
+
+
+def section_fingerprints(item: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Fingerprints every section of a raw (unprocessed) label.
+
+    Args:
+        item: A raw item from Labels.json
+
+    Returns:
+        A dict mapping each label section name to the SHA-256 of its content
+    """
+    return {key: _digest(value) for key, value in item.get('label', {}).items()}
+
+
+def stage_fingerprint(
+        stage: str,
+        fingerprints: Dict[str, str],
+        config: Optional[Dict[str, Any]] = None,
+        enhance_config: Optional[Dict[str, Any]] = None,
+) -> str:
+    """
+    Combines the fingerprints of the sections a stage depends on with the stage's version and configuration.
+
+    Two runs produce the same stage fingerprint only when every input section of the
+    stage is unchanged and the stage ran with the same prompts, models and settings,
+    so the previous output can be reused as-is. Summary and tag stages read enhanced
+    sections, so their inputs are the fingerprints of the enhance stages feeding them:
+    anything that regenerates an enhanced section also re-runs the stages built on it.
+
+    Args:
+        stage: Stage name (e.g. 'enhance:description')
+        fingerprints: Section fingerprints of the raw label, from section_fingerprints
+        config: Settings that change the stage's output (models, prompt text, flags)
+        enhance_config: Settings of the enhance stages, for stages reading enhanced sections
+    """
+    inputs = {}
+    for name in STAGE_INPUTS[stage]:
+        upstream = f'enhance:{name}'
+        if stage != upstream and upstream in STAGE_INPUTS:
+            inputs[name] = stage_fingerprint(upstream, fingerprints, enhance_config)
+        else:
+            inputs[name] = fingerprints.get(name)
+    return _digest({
+        'stage': stage,
+        'version': STAGE_VERSIONS[stage.split(':')[0]],
+        'config': config,
+        'inputs': inputs,
+    })
+
+
+def changed_sections(previous: Dict[str, str], current: Dict[str, str]) -> List[str]:
+    """Returns the names of sections that were added, removed or modified."""
+    names = set(previous) | set(current)
+    return sorted(name for name in names if previous.get(name) != current.get(name))
@@ -0,0 +1,281 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from run_ledger import annotate_call
+
+# Default location of the cache database, next to the pipeline data files
+DEFAULT_CACHE_PATH = "./data/llm_cache.sqlite"
+
+# Entries older than this are treated as misses and evicted (30 days)
+DEFAULT_MAX_AGE_SECONDS = 30 * 24 * 60 * 60
+
+# Upper bounds on the number of entries and on the total size of stored responses
+DEFAULT_MAX_ENTRIES = 200_000
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+# Eviction runs once every this many writes
+_EVICT_EVERY = 500
+
+
+def make_cache_key(
+        model: str,
+        messages: List[Dict[str, Any]],
+        temperature: float,
+        max_tokens: int,
+        response_format: Any = None,
+) -> str:
+    """
+    Builds a content-addressed key for a chat completion request.
+
+    Args:
+        model: Model name
+        messages: Chat messages sent to the model
+        temperature: Sampling temperature
+        max_tokens: Completion token limit
+        response_format: Optional Pydantic model used for structured output
+
+    Returns:
+        A SHA-256 hex digest identifying the request
+    """
+    schema = None
+    if response_format is not None:
+        schema = response_format.model_json_schema() if hasattr(response_format, "model_json_schema") \
+            else str(response_format)
+
+    payload = json.dumps(
+        {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "response_format": schema,
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def make_answer_cache_key(kind: str, payload: Any, scope: Any = None) -> str:
+    """
+    Builds a key for one drug's answer taken out of a shared request (e.g. a packed call).
+
+    Args:
+        kind: Request kind, e.g. 'packed:tags'
+        payload: The drug's own input
+        scope: Settings that change the answer (prompt template, models)
+
+    Returns:
+        A SHA-256 hex digest identifying the answer
+    """
+    payload = json.dumps({"kind": kind, "payload": payload, "scope": scope}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    Persistent SQLite cache of LLM responses keyed by make_cache_key (or make_answer_cache_key).
+
+    Entries are evicted when they are older than max_age_seconds, and the least
+    recently used entries are dropped when max_entries or max_bytes is exceeded.
+    """
+
+    def __init__(
+            self,
+            path: str = DEFAULT_CACHE_PATH,
+            max_age_seconds: int = DEFAULT_MAX_AGE_SECONDS,
+            max_entries: int = DEFAULT_MAX_ENTRIES,
+            max_bytes: int = DEFAULT_MAX_BYTES,
+    ):
+        self.path = path
+        self.max_age_seconds = max_age_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        self._writes_since_evict = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_responses_accessed ON llm_responses (accessed_at)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        row = self._conn.execute(
+            "SELECT response, created_at FROM llm_responses WHERE key = ?", (key,)
+        ).fetchone()
+
+        now = time.time()
+        if row is None or now - row[1] > self.max_age_seconds:
+            self.stats["misses"] += 1
+            return None
+
+        self._conn.execute("UPDATE llm_responses SET accessed_at = ? WHERE key = ?", (now, key))
+        self._conn.commit()
+        self.stats["hits"] += 1
+        return row[0]
+
+    def set(self, key: str, model: str, response: str):
+        now = time.time()
+        self._conn.execute(
+            """
+            INSERT INTO llm_responses (key, model, response, size, created_at, accessed_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET
+                response = excluded.response,
+                size = excluded.size,
+                created_at = excluded.created_at,
+                accessed_at = excluded.accessed_at
+            """,
+            (key, model, response, len(response.encode("utf-8")), now, now),
+        )
+        self._conn.commit()
+        self.stats["writes"] += 1
+
+        self._writes_since_evict += 1
+        if self._writes_since_evict >= _EVICT_EVERY:
+            self.evict()
+
+    def evict(self) -> int:
+        """
+        Removes expired entries, then least recently used entries until
+        the entry and size limits are respected.
+
+        Returns:
+            The number of evicted entries
+        """
+        self._writes_since_evict = 0
+        cursor = self._conn.execute(
+            "DELETE FROM llm_responses WHERE created_at < ?", (time.time() - self.max_age_seconds,)
+        )
+        evicted = cursor.rowcount
+
+        count, total_size = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_responses"
+        ).fetchone()
+
+        if count > self.max_entries or total_size > self.max_bytes:
+            rows = self._conn.execute("SELECT key, size FROM llm_responses ORDER BY accessed_at ASC").fetchall()
+            to_delete = []
+            for key, size in rows:
+                if count <= self.max_entries and total_size <= self.max_bytes:
+                    break
+                to_delete.append((key,))
+                count -= 1
+                total_size -= size
+            self._conn.executemany("DELETE FROM llm_responses WHERE key = ?", to_delete)
+            evicted += len(to_delete)
+
+        self._conn.commit()
+        self.stats["evictions"] += evicted
+        return evicted
+
+    async def get_or_create(
+            self,
+            model: str,
+            messages: List[Dict[str, Any]],
+            temperature: float,
+            max_tokens: int,
+            create: Callable[[], Awaitable[str]],
+            response_format: Any = None,
+    ) -> str:
+        """
+        Returns the cached response for the request, calling create() on a miss.
+
+        Args:
+            model: Model name
+            messages: Chat messages sent to the model
+            temperature: Sampling temperature
+            max_tokens: Completion token limit
+            create: Coroutine function performing the actual API call and returning the content
+            response_format: Optional Pydantic model used for structured output
+
+        Returns:
+            The response content
+        """
+        key = make_cache_key(model, messages, temperature, max_tokens, response_format)
+        cached = self.get(key)
+        if cached is not None:
+            annotate_call(source="cache")
+            return cached
+
+        response = await create()
+        if response is not None:
+            self.set(key, model, response)
+        return response
+
+    def report(self) -> str:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        hit_rate = (self.stats["hits"] / lookups * 100) if lookups else 0.0
+        return (
+            f"LLM cache: {self.stats['hits']} hits, {self.stats['misses']} misses "
+            f"({hit_rate:.1f}% hit rate), {self.stats['writes']} writes, {self.stats['evictions']} evictions"
+        )
+
+    def close(self):
+        self._conn.close()
+
+
+_llm_cache: Optional[LLMCache] = None
+
+
+class _DisabledCache:
+    """Stand-in used when LLM_CACHE_DISABLED is set; always calls through."""
+
+    stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+    def get(self, key):
+        return None
+
+    def set(self, key, model, response):
+        pass
+
+    async def get_or_create(self, model, messages, temperature, max_tokens, create, response_format=None):
+        return await create()
+
+    def report(self) -> str:
+        return "LLM cache: disabled"
+
+    def close(self):
+        pass
+
+
+def get_llm_cache():
+    """
+    Returns the worker-wide LLM response cache, configured from the environment:
+    LLM_CACHE_PATH, LLM_CACHE_MAX_AGE_SECONDS, LLM_CACHE_MAX_ENTRIES,
+    LLM_CACHE_MAX_BYTES and LLM_CACHE_DISABLED.
+    """
+    global _llm_cache
+
+    if _llm_cache is None:
+        if os.getenv("LLM_CACHE_DISABLED", "").lower() in ("1", "true", "yes"):
+            _llm_cache = _DisabledCache()
+        else:
+            _llm_cache = LLMCache(
+                path=os.getenv("LLM_CACHE_PATH", DEFAULT_CACHE_PATH),
+                max_age_seconds=int(os.getenv("LLM_CACHE_MAX_AGE_SECONDS", DEFAULT_MAX_AGE_SECONDS)),
+                max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+                max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)),
+            )
+
+    return _llm_cache
@@ -0,0 +1,476 @@
+import os
+import re
+import time
+import random
+import asyncio
+from contextlib import AsyncExitStack
+from typing import Any, AsyncContextManager, Awaitable, Callable, Dict, List, Optional
+
+import openai
+
+from llm_cache import get_llm_cache
+from batch_executor import get_batch_executor
+from singleflight import get_singleflight, make_dedup_key
+from run_ledger import track_call, record_retry, record_usage, current_stage
+from rate_limiter import get_rate_limiter
+from openai_client import get_openai_client
+
+# Retry and deadline defaults, overridable from the environment (see get_llm_controller)
+DEFAULT_MAX_RETRIES = 6
+DEFAULT_DEADLINE_SECONDS = 600.0
+DEFAULT_BASE_DELAY = 1.0
+DEFAULT_MAX_DELAY = 60.0
+
+# Concurrency window defaults
+DEFAULT_INITIAL_CONCURRENCY = 8
+DEFAULT_MAX_CONCURRENCY = 64
+
+# Upper bound of the larger max_tokens a truncated completion is retried with
+MAX_TRUNCATION_RETRY_TOKENS = 16000
+
+# Circuit breaker defaults
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30.0
+
+# Errors worth retrying; anything else (bad request, auth, validation) fails immediately
+_TRANSIENT_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+    asyncio.TimeoutError,
+)
+
+# One controller per model, created on first use
+_controllers: Dict[str, "LLMCallController"] = {}
+
+
+class LLMCallError(Exception):
+    """Raised when an LLM call still fails after its retries or its deadline."""
+
+
+def _parse_duration(value: str) -> Optional[float]:
+    # OpenAI reset headers look like "1s", "250ms" or "6m0s"
+    total = 0.0
+    matched = False
+    for amount, unit in re.findall(r"(\d+(?:\.\d+)?)(ms|s|m|h)", value):
+        matched = True
+        total += float(amount) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    if matched:
+        return total
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """
+    Reads how long the API asked us to wait from the response headers of an error.
+
+    Args:
+        error: The exception raised by the OpenAI client
+
+    Returns:
+        Seconds to wait, or None when the response carries no hint
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    if headers.get("retry-after"):
+        try:
+            return float(headers["retry-after"])
+        except ValueError:
+            pass
+
+    resets = [
+        _parse_duration(headers[name])
+        for name in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")
+        if headers.get(name)
+    ]
+    resets = [reset for reset in resets if reset is not None]
+    return max(resets) if resets else None
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests to a model after repeated transient failures.
+
+    After failure_threshold consecutive failures the circuit opens for reset_timeout
+    seconds and callers wait instead of hammering the API. Then a single probe call
+    is let through; its success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD, reset_timeout: float = DEFAULT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_until = 0.0
+        self.probing = False
+        self.opened = 0
+
+    async def wait_until_closed(self, deadline: float) -> bool:
+        """Waits until a call may be sent; returns True when that call is the half-open probe."""
+        while True:
+            now = time.monotonic()
+            if self.failures < self.failure_threshold:
+                return False
+            if now >= self.opened_until and not self.probing:
+                self.probing = True
+                return True
+            if now >= deadline:
+                raise LLMCallError("Circuit breaker open until the call deadline")
+            wait = self.opened_until - now if now < self.opened_until else 1.0
+            await asyncio.sleep(min(wait, deadline - now))
+
+    def record_success(self):
+        self.failures = 0
+        self.probing = False
+
+    def cancel_probe(self):
+        """
+        Lets the next call probe when the probe call ended without a verdict on the API's health.
+        Only the caller that wait_until_closed picked as the probe may cancel it.
+        """
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.probing or self.failures == self.failure_threshold:
+            self.opened_until = time.monotonic() + self.reset_timeout
+            self.opened += 1
+            print(f"Circuit breaker opened for {self.reset_timeout:.0f}s after {self.failures} failures")
+        self.probing = False
+
+
+class AIMDWindow:
+    """
+    Additive-increase/multiplicative-decrease limit on concurrent calls.
+
+    Every success below the latency threshold grows the window by about one slot per
+    window's worth of calls; a 429 or a call much slower than the running average
+    halves it (at most once per cooldown, so one burst of errors counts once).
+    """
+
+    def __init__(
+            self,
+            initial: int = DEFAULT_INITIAL_CONCURRENCY,
+            minimum: int = 1,
+            maximum: int = DEFAULT_MAX_CONCURRENCY,
+            decrease_factor: float = 0.5,
+            slow_factor: float = 2.0,
+            cooldown: float = 5.0,
+    ):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease_factor = decrease_factor
+        self.slow_factor = slow_factor
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.average_latency: Optional[float] = None
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self, latency: float):
+        if self.average_latency is None:
+            self.average_latency = latency
+        slow = latency > self.slow_factor * self.average_latency
+        self.average_latency = 0.9 * self.average_latency + 0.1 * latency
+
+        if slow:
+            self.decrease()
+        else:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def decrease(self):
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(self.minimum, self.limit * self.decrease_factor)
+
+
+class LLMCallController:
+    """Retry policy, circuit breaker and concurrency window shared by every call to one model."""
+
+    def __init__(
+            self,
+            model: str,
+            max_retries: int = DEFAULT_MAX_RETRIES,
+            deadline_seconds: float = DEFAULT_DEADLINE_SECONDS,
+            base_delay: float = DEFAULT_BASE_DELAY,
+            max_delay: float = DEFAULT_MAX_DELAY,
+            window: Optional[AIMDWindow] = None,
+            breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.model = model
+        self.max_retries = max_retries
+        self.deadline_seconds = deadline_seconds
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.window = window or AIMDWindow()
+        self.breaker = breaker or CircuitBreaker()
+        self.stats = {"calls": 0, "retries": 0, "rate_limited": 0, "failed": 0}
+
+    async def call(
+            self,
+            create: Callable[..., Awaitable[Any]],
+            deadline_seconds: Optional[float] = None,
+            reserve: Optional[Callable[[], AsyncContextManager[Any]]] = None,
+    ) -> Any:
+        """
+        Runs create() with retries, backoff, a deadline, the circuit breaker and the concurrency window.
+
+        Args:
+            create: Coroutine function performing one API request
+            deadline_seconds: Overall time budget for the call including retries
+            reserve: Optional rate-limit reservation (e.g. a limiter's reserve(...)), entered before
+                each attempt takes its window slot; create then receives the reservation
+
+        Returns:
+            The result of create()
+
+        Raises:
+            LLMCallError: When the call failed after all retries or ran past its deadline
+            Exception: Non-transient errors (e.g. a bad request) are raised as-is without retrying
+                and leave the circuit breaker unchanged
+        """
+        deadline = time.monotonic() + (deadline_seconds or self.deadline_seconds)
+        self.stats["calls"] += 1
+        attempt = 0
+
+        while True:
+            probe = await self.breaker.wait_until_closed(deadline)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.stats["failed"] += 1
+                raise LLMCallError(f"{self.model} call ran past its deadline")
+
+            try:
+                async with AsyncExitStack() as stack:
+                    # Waiting for rate-limit capacity holds no window slot and is not counted as latency.
+                    # Both local waits are bounded by the deadline but are not failures of the API
+                    try:
+                        async with asyncio.timeout(remaining):
+                            reservation = await stack.enter_async_context(reserve()) if reserve is not None else None
+                            await self.window.acquire()
+                            stack.push_async_callback(self.window.release)
+                    except TimeoutError:
+                        self.stats["failed"] += 1
+                        raise LLMCallError(f"{self.model} call ran past its deadline waiting for capacity") from None
+
+                    started = time.monotonic()
+                    async with asyncio.timeout(deadline - started):
+                        result = await (create() if reserve is None else create(reservation))
+                    latency = time.monotonic() - started
+            except _TRANSIENT_ERRORS as e:
+                error = e
+            except BaseException:
+                # A bad request or a local wait says nothing about the API's health; another
+                # call may be the probe in flight, so only this call's own probe is released
+                if probe:
+                    self.breaker.cancel_probe()
+                raise
+            else:
+                self.window.on_success(latency)
+                self.breaker.record_success()
+                return result
+
+            self.breaker.record_failure()
+            delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+            if isinstance(error, openai.RateLimitError):
+                self.stats["rate_limited"] += 1
+                self.window.decrease()
+                delay = max(delay, retry_after_seconds(error) or 0.0)
+
+            attempt += 1
+            if attempt > self.max_retries or time.monotonic() + delay >= deadline:
+                self.stats["failed"] += 1
+                raise LLMCallError(f"{self.model} call failed after {attempt} attempts: {error!r}") from error
+
+            self.stats["retries"] += 1
+            record_retry()
+            print(f"[{self.model}] {type(error).__name__}, retrying in {delay:.1f}s (attempt {attempt}/{self.max_retries})")
+            await asyncio.sleep(delay)
+
+    def report(self) -> str:
+        return (
+            f"[{self.model}] {self.stats['calls']} calls, {self.stats['retries']} retries, "
+            f"{self.stats['rate_limited']} rate limited, {self.stats['failed']} failed, "
+            f"concurrency window {int(self.window.limit)}, circuit opened {self.breaker.opened} times"
+        )
+
+
+def get_llm_controller(model: str) -> LLMCallController:
+    """
+    Returns the call controller of a model, configured from the environment:
+    LLM_MAX_RETRIES, LLM_CALL_DEADLINE_SECONDS, LLM_INITIAL_CONCURRENCY and LLM_MAX_CONCURRENCY.
+    """
+    if model not in _controllers:
+        _controllers[model] = LLMCallController(
+            model,
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", DEFAULT_MAX_RETRIES)),
+            deadline_seconds=float(os.getenv("LLM_CALL_DEADLINE_SECONDS", DEFAULT_DEADLINE_SECONDS)),
+            window=AIMDWindow(
+                initial=int(os.getenv("LLM_INITIAL_CONCURRENCY", DEFAULT_INITIAL_CONCURRENCY)),
+                maximum=int(os.getenv("LLM_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY)),
+            ),
+        )
+    return _controllers[model]
+
+
+def with_retries(
+        model: str,
+        create: Callable[..., Awaitable[Any]],
+        reserve: Optional[Callable[[], AsyncContextManager[Any]]] = None,
+) -> Callable[[], Awaitable[Any]]:
+    """Wraps a request coroutine function so it runs through the model's call controller."""
+
+    async def call() -> Any:
+        return await get_llm_controller(model).call(create, reserve=reserve)
+
+    return call
+
+
+async def cached_completion(
+        model: str,
+        messages: List[Dict[str, Any]],
+        temperature: float,
+        max_tokens: int,
+        create: Callable[..., Awaitable[str]],
+        response_format: Any = None,
+        reserve: Optional[Callable[[], AsyncContextManager[Any]]] = None,
+) -> str:
+    """
+    Answers a chat completion from the LLM cache, or else from the Batch API (--batch) or a retried live call.
+
+    Identical requests (after whitespace normalization) share one call: concurrent ones
+    wait for the request in flight and later ones in the same run reuse its response.
+    Every request is recorded in the run ledger with its source, tokens, retries and latency.
+
+    Args:
+        model: Model name
+        messages: Chat messages sent to the model
+        temperature: Sampling temperature
+        max_tokens: Completion token limit
+        create: Coroutine function performing the live API call and returning the content
+        response_format: Optional Pydantic model used for structured output
+        reserve: Optional rate-limit reservation taken before each live attempt (see LLMCallController.call)
+
+    Returns:
+        The response content
+    """
+    request = with_retries(model, create, reserve)
+
+    batch = get_batch_executor()
+    if batch is not None:
+        live_request = request
+
+        async def request() -> str:
+            return await batch.submit(model, messages, temperature, max_tokens, response_format, fallback=live_request)
+
+    async def cached() -> str:
+        # Identical requests are answered from the on-disk cache
+        return await get_llm_cache().get_or_create(
+            model, messages, temperature, max_tokens, request, response_format=response_format
+        )
+
+    key = make_dedup_key(model, messages, temperature, max_tokens, response_format)
+    with track_call(model):
+        return await get_singleflight().do(key, cached)
+
+
+async def chat_completion(
+        model: str,
+        messages: List[Dict[str, Any]],
+        temperature: float,
+        max_tokens: int,
+        response_format: Any = None,
+        retry_truncated: bool = True,
+) -> str:
+    """
+    Sends a chat completion through the model's rate limiter, via cached_completion.
+
+    Each live attempt reserves its prompt tokens plus the completion tokens the stage
+    usually produces before taking a slot of the concurrency window, then settles the
+    reservation against the reported usage and records it in the run ledger.
+    A completion cut off at max_tokens is never cached; it is requested once more
+    with twice the limit unless retry_truncated is False.
+
+    Args:
+        model: Model name
+        messages: Chat messages sent to the model
+        temperature: Sampling temperature
+        max_tokens: Completion token limit
+        response_format: Optional Pydantic model used for structured output
+        retry_truncated: Whether a truncated completion is retried with a larger max_tokens
+
+    Returns:
+        The response content
+
+    Raises:
+        openai.LengthFinishReasonError: If the completion was cut off (again) at max_tokens
+    """
+    # Shared client, so connections are reused across calls
+    client = get_openai_client()
+    rate_limiter = get_rate_limiter(model)
+
+    # Completion sizes are averaged per stage; calls outside a stage are grouped by their limit
+    kind = current_stage() or f"max_tokens={max_tokens}"
+
+    def reserve():
+        # Prompt + expected completion tokens, settled against the reported usage
+        return rate_limiter.reserve(messages, max_tokens, kind=kind)
+
+    async def create(reservation) -> str:
+        request = dict(model=model, messages=messages, temperature=temperature, max_tokens=max_tokens)
+        try:
+            if response_format is not None:
+                response = await client.chat.completions.parse(**request, response_format=response_format)
+            else:
+                response = await client.chat.completions.create(**request)
+        except openai.LengthFinishReasonError as e:
+            # parse() raises for a truncated completion before returning it; its tokens were still used
+            reservation.reconcile(e.completion.usage)
+            record_usage(e.completion.usage)
+            raise
+        reservation.reconcile(response.usage)
+        record_usage(response.usage)
+        # A truncated completion must not reach the cache or a checkpoint; the item fails and is retried
+        if response.choices[0].finish_reason == "length":
+            raise openai.LengthFinishReasonError(completion=response)
+        return response.choices[0].message.content
+
+    # Served from the LLM cache, the Batch API (--batch) or a retried live call
+    try:
+        return await cached_completion(
+            model, messages, temperature, max_tokens, create, response_format=response_format, reserve=reserve
+        )
+    except openai.LengthFinishReasonError:
+        if not retry_truncated or max_tokens >= MAX_TRUNCATION_RETRY_TOKENS:
+            raise
+        larger = min(MAX_TRUNCATION_RETRY_TOKENS, max_tokens * 2)
+        print(f"[{model}] Completion cut off at {max_tokens} tokens, retrying with {larger}")
+        return await chat_completion(model, messages, temperature, larger, response_format, retry_truncated=False)
+
+
+def llm_call_report() -> str:
+    return "\n".join(controller.report() for controller in _controllers.values())
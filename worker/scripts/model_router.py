@@ -0,0 +1,103 @@
+import re
+from collections import Counter
+from typing import Any, Dict, Optional
+
+from token_counter import count_tokens
+
+DEFAULT_LARGE_MODEL = "gpt-4o"
+DEFAULT_SMALL_MODEL = "gpt-4o-mini"
+
+# Inputs up to this many tokens (with at most DEFAULT_MAX_SMALL_TABLES tables) go to the small model
+DEFAULT_TOKEN_THRESHOLD = 400
+DEFAULT_MAX_SMALL_TABLES = 0
+
+_TAG_PATTERN = re.compile(r"<[^>]*>")
+_TABLE_PATTERN = re.compile(r"<table[\s>]", re.IGNORECASE)
+
+# Active router when process_data runs with --route-models
+_model_router: Optional["ModelRouter"] = None
+
+
+def is_blank(text: Optional[str]) -> bool:
+    """Whether an input has no text once HTML tags and whitespace are removed (e.g. '' or '<p> </p>')."""
+    if not text:
+        return True
+    return not _TAG_PATTERN.sub("", text).replace("&nbsp;", "").strip()
+
+
+class ModelRouter:
+    """
+    Chooses the model of each LLM request from the size of its input.
+
+    Inputs up to token_threshold tokens containing at most max_small_tables tables are
+    sent to small_model; large or table-heavy inputs keep large_model. Every decision
+    is logged with the stage, input size and table count, and counted for the report.
+    """
+
+    def __init__(
+            self,
+            small_model: str = DEFAULT_SMALL_MODEL,
+            large_model: str = DEFAULT_LARGE_MODEL,
+            token_threshold: int = DEFAULT_TOKEN_THRESHOLD,
+            max_small_tables: int = DEFAULT_MAX_SMALL_TABLES,
+    ):
+        self.small_model = small_model
+        self.large_model = large_model
+        self.token_threshold = token_threshold
+        self.max_small_tables = max_small_tables
+        self.decisions = Counter()
+
+    def route(self, stage: str, text: str) -> str:
+        """
+        Args:
+            stage: Name of the calling stage, for the audit log (e.g. 'enhance', 'summary:dosing')
+            text: The input content the request is built from
+
+        Returns:
+            The model to call
+        """
+        tokens = count_tokens(text, self.large_model)
+        tables = len(_TABLE_PATTERN.findall(text))
+        if tokens <= self.token_threshold and tables <= self.max_small_tables:
+            model = self.small_model
+        else:
+            model = self.large_model
+        print(f"[router] {stage}: {tokens} tokens, {tables} tables -> {model}")
+        self.decisions[(stage.split(":")[0], model)] += 1
+        return model
+
+    def report(self) -> str:
+        return "Model routing: " + (", ".join(
+            f"{stage} -> {model}: {count}" for (stage, model), count in sorted(self.decisions.items())
+        ) or "no requests")
+
+
+def enable_model_routing(**kwargs) -> ModelRouter:
+    """Routes LLM requests by input size until the process exits."""
+    global _model_router
+
+    _model_router = ModelRouter(**kwargs)
+    return _model_router
+
+
+def route_model(stage: str, text: str, default: str = DEFAULT_LARGE_MODEL) -> str:
+    """Returns the model for a request: the routed one when routing is enabled, else default."""
+    if _model_router is None:
+        return default
+    return _model_router.route(stage, text)
+
+
+def routing_config() -> Dict[str, Any]:
+    """The models requests can be sent to and the routing settings, for stage fingerprints."""
+    if _model_router is None:
+        return {'model': DEFAULT_LARGE_MODEL}
+    return {
+        'small_model': _model_router.small_model,
+        'large_model': _model_router.large_model,
+        'token_threshold': _model_router.token_threshold,
+        'max_small_tables': _model_router.max_small_tables,
+    }
+
+
+def model_router_report() -> str:
+    return _model_router.report() if _model_router is not None else ""
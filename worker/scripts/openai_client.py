@@ -0,0 +1,84 @@
+import os
+from typing import Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+# Connection pool defaults, sized for the ~18 concurrent calls per label times --concurrency labels
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 50
+DEFAULT_KEEPALIVE_EXPIRY = 60.0
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_REQUEST_TIMEOUT = 120.0
+
+# Worker-wide client, created on first use
+_openai_client: Optional[AsyncOpenAI] = None
+
+
+def create_openai_client(
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        max_keepalive_connections: int = DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry: float = DEFAULT_KEEPALIVE_EXPIRY,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+        request_timeout: float = DEFAULT_REQUEST_TIMEOUT,
+) -> AsyncOpenAI:
+    """
+    Creates an AsyncOpenAI client backed by a pooled keep-alive HTTP client.
+
+    Args:
+        max_connections: Maximum number of open connections to the API
+        max_keepalive_connections: Idle connections kept open for reuse
+        keepalive_expiry: Seconds an idle connection is kept open
+        connect_timeout: Seconds allowed to establish a connection
+        request_timeout: Seconds allowed for a whole request (read/write/pool)
+
+    Returns:
+        The client
+    """
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(request_timeout, connect=connect_timeout),
+    )
+    return AsyncOpenAI(
+        api_key=os.getenv('OPENAI_API_KEY'),
+        base_url=os.getenv('OPENAI_BASE_URL') or None,
+        http_client=http_client,
+        timeout=httpx.Timeout(request_timeout, connect=connect_timeout),
+        # Retries are handled by llm_call, which also honours Retry-After and the circuit breaker
+        max_retries=0,
+    )
+
+
+def get_openai_client() -> AsyncOpenAI:
+    """
+    Returns the worker-wide OpenAI client, configured from the environment:
+    OPENAI_API_KEY, OPENAI_BASE_URL, OPENAI_MAX_CONNECTIONS, OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+    OPENAI_KEEPALIVE_EXPIRY, OPENAI_CONNECT_TIMEOUT and OPENAI_REQUEST_TIMEOUT.
+
+    Every LLM call shares its connection pool, so TLS sessions are reused across calls.
+    """
+    global _openai_client
+
+    if _openai_client is None:
+        _openai_client = create_openai_client(
+            max_connections=int(os.getenv("OPENAI_MAX_CONNECTIONS", DEFAULT_MAX_CONNECTIONS)),
+            max_keepalive_connections=int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", DEFAULT_MAX_KEEPALIVE_CONNECTIONS)),
+            keepalive_expiry=float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", DEFAULT_KEEPALIVE_EXPIRY)),
+            connect_timeout=float(os.getenv("OPENAI_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT)),
+            request_timeout=float(os.getenv("OPENAI_REQUEST_TIMEOUT", DEFAULT_REQUEST_TIMEOUT)),
+        )
+
+    return _openai_client
+
+
+async def close_openai_client():
+    """Closes the worker-wide client and its connections; the next get_openai_client() creates a new one."""
+    global _openai_client
+
+    if _openai_client is not None:
+        await _openai_client.close()
+        _openai_client = None
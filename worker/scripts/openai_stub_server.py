@@ -0,0 +1,141 @@
+"""
+Local stand-in for the parts of the OpenAI API used by the worker (files, batches, chat completions).
+
+Start it and point the worker at it to exercise `process_data.py --batch` without an API key:
+
+    python scripts/openai_stub_server.py --port 8089
+    OPENAI_BASE_URL=http://localhost:8089/v1 OPENAI_API_KEY=stub python scripts/process_data.py --batch --batch-poll-interval 1
+
+Batches complete on their first poll and every completion returns a canned answer
+(an empty tag list for structured-output requests).
+"""
+import json
+import time
+import uuid
+import argparse
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_files = {}
+_batches = {}
+
+
+def _completion(body: dict) -> dict:
+    if body.get("response_format", {}).get("type") == "json_schema":
+        content = json.dumps({"tags": []})
+    else:
+        content = "<p>Stub response.</p>"
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model"),
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+    }
+
+
+def _file_object(file_id: str) -> dict:
+    return {
+        "id": file_id,
+        "object": "file",
+        "bytes": len(_files[file_id]["content"]),
+        "created_at": int(time.time()),
+        "filename": _files[file_id]["filename"],
+        "purpose": _files[file_id]["purpose"],
+        "status": "processed",
+    }
+
+
+def _run_batch(batch: dict):
+    lines = []
+    for line in _files[batch["input_file_id"]]["content"].decode("utf-8").splitlines():
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        lines.append(json.dumps({
+            "id": f"batch_req_{uuid.uuid4().hex}",
+            "custom_id": request["custom_id"],
+            "response": {"status_code": 200, "request_id": uuid.uuid4().hex, "body": _completion(request["body"])},
+            "error": None,
+        }))
+
+    output_id = f"file-{uuid.uuid4().hex}"
+    _files[output_id] = {"content": ("\n".join(lines) + "\n").encode("utf-8"), "filename": "output.jsonl", "purpose": "batch_output"}
+    batch.update({
+        "status": "completed",
+        "output_file_id": output_id,
+        "completed_at": int(time.time()),
+        "request_counts": {"total": len(lines), "completed": len(lines), "failed": 0},
+    })
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def _send(self, payload, status=200, raw: bytes = None):
+        data = raw if raw is not None else json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream" if raw is not None else "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_POST(self):
+        if self.path == "/v1/chat/completions":
+            return self._send(_completion(json.loads(self._body())))
+
+        if self.path == "/v1/files":
+            header = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8")
+            message = BytesParser(policy=HTTP).parsebytes(header + self._body())
+            fields = {part.get_param("name", header="content-disposition"): part for part in message.iter_parts()}
+            file_id = f"file-{uuid.uuid4().hex}"
+            _files[file_id] = {
+                "content": fields["file"].get_payload(decode=True),
+                "filename": fields["file"].get_filename(),
+                "purpose": fields["purpose"].get_payload(decode=True).decode("utf-8"),
+            }
+            return self._send(_file_object(file_id))
+
+        if self.path == "/v1/batches":
+            request = json.loads(self._body())
+            batch_id = f"batch_{uuid.uuid4().hex}"
+            _batches[batch_id] = {
+                "id": batch_id,
+                "object": "batch",
+                "endpoint": request["endpoint"],
+                "input_file_id": request["input_file_id"],
+                "completion_window": request["completion_window"],
+                "status": "validating",
+                "created_at": int(time.time()),
+                "output_file_id": None,
+                "error_file_id": None,
+                "request_counts": {"total": 0, "completed": 0, "failed": 0},
+            }
+            return self._send(_batches[batch_id])
+
+        self._send({"error": {"message": f"Unknown path {self.path}"}}, status=404)
+
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        if len(parts) == 3 and parts[1] == "batches" and parts[2] in _batches:
+            batch = _batches[parts[2]]
+            if batch["status"] != "completed":
+                _run_batch(batch)
+            return self._send(batch)
+
+        if len(parts) == 4 and parts[1] == "files" and parts[3] == "content" and parts[2] in _files:
+            return self._send(None, raw=_files[parts[2]]["content"])
+
+        self._send({"error": {"message": f"Unknown path {self.path}"}}, status=404)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI files, batches and chat APIs.")
+    parser.add_argument("--port", type=int, default=8089)
+    args = parser.parse_args()
+
+    print(f"OpenAI stub listening on http://localhost:{args.port}/v1")
+    ThreadingHTTPServer(("", args.port), StubHandler).serve_forever()
@@ -0,0 +1,77 @@
+import psycopg2
+
+from sink_fanout import SinkWorker
+from upsert_items_to_elasticsearch import create_elasticsearch_client, ensure_index, upsert_batch_to_elasticsearch
+from upsert_to_chromadb import create_chroma_collections, upsert_batch_to_chromadb
+from upsert_items_to_postgres import get_postgres_params, upsert_items_with_connection
+
+
+def create_pipeline_sinks(batch_size: int = 16, flush_interval: float = 5.0, max_retries: int = 5) -> list:
+    """
+    Creates the Elasticsearch, ChromaDB and Postgres sink workers fed by process_data.
+
+    Every record is a dict with the 'item', 'q_item' and 'view_blocks' of one drug.
+    Each sink opens its client once and reuses it for every micro-batch.
+
+    Args:
+        batch_size: Maximum number of items per write
+        flush_interval: Seconds after which a partial batch is written
+        max_retries: Attempts per batch before it is reported as failed
+
+    Returns:
+        A list of SinkWorker instances
+    """
+    state = {}
+
+    def open_elasticsearch():
+        es = create_elasticsearch_client()
+        ensure_index(es)
+        state['es'] = es
+
+    def write_elasticsearch(records):
+        upsert_batch_to_elasticsearch(state['es'], [record['q_item'] for record in records])
+
+    def open_chromadb():
+        state['chroma'] = create_chroma_collections()
+
+    def write_chromadb(records):
+        collection, collection_similar = state['chroma']
+        upsert_batch_to_chromadb(collection, collection_similar, [record['q_item'] for record in records])
+
+    def open_postgres():
+        state['pg'] = psycopg2.connect(**get_postgres_params())
+
+    def write_postgres(records):
+        # Reconnect if a previous failure closed the connection
+        if state['pg'].closed:
+            open_postgres()
+        upsert_items_with_connection(
+            state['pg'],
+            [record['q_item'] for record in records],
+            [record['item'] for record in records],
+            [record['view_blocks'] for record in records],
+        )
+
+    def close(key):
+        def close_client():
+            client = state.pop(key, None)
+            if client is not None and hasattr(client, 'close'):
+                client.close()
+        return close_client
+
+    def close_elasticsearch():
+        es = state.get('es')
+        try:
+            if es is not None:
+                # Make every written document searchable with one refresh instead of one per batch;
+                # until then documents show up after the index's refresh_interval
+                es.indices.refresh(index="drugs_db")
+        finally:
+            close('es')()
+
+    options = {'batch_size': batch_size, 'flush_interval': flush_interval, 'max_retries': max_retries}
+    return [
+        SinkWorker('elasticsearch', write_elasticsearch, open_sink=open_elasticsearch, close_sink=close_elasticsearch, **options),
+        SinkWorker('chromadb', write_chromadb, open_sink=open_chromadb, close_sink=close('chroma'), **options),
+        SinkWorker('postgres', write_postgres, open_sink=open_postgres, close_sink=close('pg'), **options),
+    ]
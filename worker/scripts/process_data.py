@@ -1,24 +1,43 @@
 #!/usr/bin/env python3
 
 import asyncio
+import argparse
 import sys
 import os
 import json
+from functools import partial
 from dotenv import load_dotenv
-from scripts.clean_json_html import clean_json_html
-from scripts.enhance_content import enhance_content
+from scripts.enhance_content import enhance_content, enhance_config
 from scripts.extract_tags import extract_condition_tags, extract_substance_tags, extract_indication_tags, \
-    extract_strengths_and_concentrations_tags, extract_population_tags, extract_contraindications_tags
+    extract_strengths_and_concentrations_tags, extract_population_tags, extract_contraindications_tags, \
+    extract_all_tags, extract_packed_tags, get_extract_packed_tags_prompt
 from scripts.structure_json_html import structure_json_html
+from scripts.block_encoding import encode_view_blocks
 from scripts.prepare_item_for_vector_search import prepare_item_for_vector_search
 from scripts.summarize_description import summarize_meta_description, summarize_use_and_conditions, \
-    summarize_contra_indications, summarize_dosing, summarize_warnings, summarize_description
-from scripts.upsert_to_chromadb import upsert_q_items_to_chromadb
-from scripts.upsert_items_to_postgres import upsert_items_to_postgres
-from scripts.fix_html_syntax import fix_html_syntax
-from scripts.find_similar_drugs_by_name import find_similar_drugs_by_name
-from scripts.update_vector_similar_ranking import update_vector_similar_ranking
-from scripts.upsert_items_to_elasticsearch import upsert_items_to_elasticsearch
+    summarize_contra_indications, summarize_dosing, summarize_warnings, summarize_description, summarize_all, \
+    summarize_packed_meta_descriptions, get_packed_meta_descriptions_prompt
+from scripts.similarity_engine import run_similarity_job
+from scripts.streaming_pipeline import iter_json_array, run_streaming
+from llm_cache import get_llm_cache
+from openai_client import close_openai_client
+from rate_limiter import rate_limiter_report, known_models
+from llm_call import llm_call_report
+from singleflight import singleflight_report
+from run_ledger import start_run_ledger, stop_run_ledger, in_ledger_scope, DEFAULT_LEDGER_PATH
+from batch_executor import start_batch_executor, stop_batch_executor, DEFAULT_BATCH_DIR
+from request_packer import enable_request_packing, request_packer_report, get_request_packer
+from model_router import enable_model_routing, model_router_report, routing_config, DEFAULT_SMALL_MODEL, \
+    DEFAULT_TOKEN_THRESHOLD
+from table_converter import enable_local_conversion, local_conversion_report
+from scripts.checkpoint_store import CheckpointStore, DEFAULT_CHECKPOINT_PATH, run_stage
+from scripts.label_fingerprints import section_fingerprints, stage_fingerprint, changed_sections, STAGE_INPUTS
+from scripts.stage_graph import StageGraph
+from scripts.html_pool import start_html_pool, run_html, shutdown_html_pool
+from scripts.html_normalizer import normalize_item
+from scripts.artifact_writer import ArtifactWriter, ArtifactReader, DEFAULT_ARTIFACT_PATH
+from scripts.sink_fanout import SinkFanout
+from scripts.pipeline_sinks import create_pipeline_sinks
 
 # Load environment variables from .env file in the parent directory (project root)
 load_dotenv('../.env')
@@ -28,53 +47,140 @@ project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, project_root)
 
 
-async def process_single_item(item):
+# Label sections rewritten by enhance_content before the summary and tag stages
+ENHANCED_SECTIONS = [
+    'description',
+    'indicationsAndUsage',
+    'dosageAndAdministration',
+    'dosageFormsAndStrengths',
+    'contraindications',
+    'warningsAndPrecautions',
+    'adverseReactions',
+]
+
+# Summary and tag stages; the sections each one reads are declared in STAGE_INPUTS
+LLM_STAGES = {
+    'summary:metaDescription': summarize_meta_description,
+    'summary:description': summarize_description,
+    'summary:useAndConditions': summarize_use_and_conditions,
+    'summary:contraIndications': summarize_contra_indications,
+    'summary:warnings': summarize_warnings,
+    'summary:dosing': summarize_dosing,
+    'tags:condition': extract_condition_tags,
+    'tags:substance': extract_substance_tags,
+    'tags:indications': extract_indication_tags,
+    'tags:strengthsConcentrations': extract_strengths_and_concentrations_tags,
+    'tags:population': extract_population_tags,
+}
+
+# Start order among ready stages when --stage-concurrency limits them (lower first)
+STAGE_PRIORITIES = {
+    'enhance': 0,
+    'summary': 1,
+    'tags': 2,
+}
+
+
+def stage_config(stage: str) -> dict:
+    """Settings of this run that change a stage's output, folded into its incremental fingerprint."""
+    config = {'models': routing_config()}
+    if stage.split(':')[0] == 'enhance':
+        config['enhance'] = enhance_config()
+    else:
+        config['packing'] = [name for name in ('metaDescription', 'tags') if get_request_packer(name) is not None]
+    return config
+
+
+async def process_single_item(
+        item,
+        checkpoint: CheckpointStore = None,
+        stage_concurrency: int = None,
+        consolidated_summaries: bool = False,
+        separate_tag_calls: bool = False,
+):
     """
     Process a single item from the JSON array.
     This function handles all the async operations for one item.
+    When a checkpoint store is given, every stage output is recorded as soon as it
+    finishes and stages already recorded for the active run are not executed again.
+    In incremental mode, stages whose raw input sections are unchanged since the
+    previous run reuse the previous outputs instead of calling the LLM.
+    Stages run on a dependency graph, so each summary or tag stage starts as soon as
+    the sections it reads are enhanced rather than after every enhance call.
+    With consolidated_summaries, the six summaries come from a single structured-output
+    call (summary:all), falling back to per-field calls for fields that fail validation.
+    Tags of every category are extracted with one call (tags:all) unless separate_tag_calls is set.
     """
-    print(f'Processing {item["drugName"]}...')
+    set_id = item['setId']
 
-    # Clean and fix the item
-    item = clean_json_html(item)
-    item = fix_html_syntax(item)
-
-    # Run all enhance_content calls in parallel
-    description, indications_and_usage, dosage_and_administration, dosage_forms_and_strengths, contraindications, warnings_and_precautions, adverse_reactions = await asyncio.gather(
-        enhance_content(item['label']['description']),
-        enhance_content(item['label']['indicationsAndUsage']),
-        enhance_content(item['label']['dosageAndAdministration']),
-        enhance_content(item['label']['dosageFormsAndStrengths']),
-        enhance_content(item['label']['contraindications']),
-        enhance_content(item['label']['warningsAndPrecautions']),
-        enhance_content(item['label']['adverseReactions'])
-    )
+    print(f'Processing {item["drugName"]}...')
 
-    item['label']['description'] = description
-    item['label']['indicationsAndUsage'] = indications_and_usage
-    item['label']['dosageAndAdministration'] = dosage_and_administration
-    item['label']['dosageFormsAndStrengths'] = dosage_forms_and_strengths
-    item['label']['contraindications'] = contraindications
-    item['label']['warningsAndPrecautions'] = warnings_and_precautions
-    item['label']['adverseReactions'] = adverse_reactions
-
-    # structured_item = structure_json_html(item)
-    q_item = prepare_item_for_vector_search(item)
-
-    # Run all summarize functions in parallel
-    summary, description, use_and_conditions, contra_indications_warnings, warnings, dosing, tags_condition, tags_substance, tags_indication, tags_strengths_concentrations, tags_population = await asyncio.gather(
-        summarize_meta_description(q_item),
-        summarize_description(q_item),
-        summarize_use_and_conditions(q_item),
-        summarize_contra_indications(q_item),
-        summarize_warnings(q_item),
-        summarize_dosing(q_item),
-        extract_condition_tags(q_item),
-        extract_substance_tags(q_item),
-        extract_indication_tags(q_item),
-        extract_strengths_and_concentrations_tags(q_item),
-        extract_population_tags(q_item),
-    )
+    # Fingerprint the raw sections so unchanged stages can be detected
+    fingerprints = section_fingerprints(item)
+    if checkpoint is not None and checkpoint.incremental:
+        previous = checkpoint.get_label_fingerprints(set_id)
+        if previous is not None:
+            print(f'{item["drugName"]} changed sections: {changed_sections(previous, fingerprints) or "none"}')
+
+    drug_name = item['drugName']
+
+    def stage(name, create):
+        # LLM calls made by the stage are attributed to this drug and stage in the run ledger
+        create = in_ledger_scope(create, set_id=set_id, drug=drug_name, stage=name)
+        fingerprint = stage_fingerprint(name, fingerprints, stage_config(name), stage_config('enhance'))
+        return run_stage(checkpoint, set_id, name, create, fingerprint)
+
+    # Clean and fix the item (on the HTML process pool when enabled). Sections rewritten by
+    # enhance_content are prepared for vector search later; the text view of everything else
+    # comes from the same parse as the cleaned HTML
+    item, q_item = await run_html(normalize_item, item, ENHANCED_SECTIONS)
+
+    def enhance_stage(section):
+        async def run():
+            enhanced = await stage(f'enhance:{section}', lambda: enhance_content(item['label'][section]))
+            item['label'][section] = enhanced
+            q_item['label'][section] = await run_html(prepare_item_for_vector_search, enhanced)
+            return enhanced
+        return run
+
+    # Each summary/tag stage starts as soon as the sections it reads have been enhanced
+    graph = StageGraph(max_concurrency=stage_concurrency)
+    for section in ENHANCED_SECTIONS:
+        graph.add(f'enhance:{section}', enhance_stage(section), priority=STAGE_PRIORITIES['enhance'])
+
+    stages = dict(LLM_STAGES)
+    if consolidated_summaries:
+        stages = {name: run for name, run in stages.items() if not name.startswith('summary:')}
+        stages['summary:all'] = summarize_all
+    if not separate_tag_calls:
+        stages = {name: run for name, run in stages.items() if not name.startswith('tags:')}
+        stages['tags:all'] = extract_all_tags
+
+    for name, summarize in stages.items():
+        graph.add(
+            name,
+            partial(stage, name, partial(summarize, q_item)),
+            depends_on=[f'enhance:{section}' for section in STAGE_INPUTS[name]],
+            priority=STAGE_PRIORITIES[name.split(':')[0]],
+        )
+
+    results = await graph.run()
+    if 'summary:all' in results:
+        results.update({f'summary:{field}': value for field, value in results.pop('summary:all').items()})
+    if 'tags:all' in results:
+        results.update({f'tags:{category}': tags for category, tags in results.pop('tags:all').items()})
+
+    summary = results['summary:metaDescription']
+    description = results['summary:description']
+    use_and_conditions = results['summary:useAndConditions']
+    contra_indications_warnings = results['summary:contraIndications']
+    warnings = results['summary:warnings']
+    dosing = results['summary:dosing']
+    tags_condition = results['tags:condition']
+    tags_substance = results['tags:substance']
+    tags_indication = results['tags:indications']
+    tags_strengths_concentrations = results['tags:strengthsConcentrations']
+    tags_population = results['tags:population']
 
     q_item['metaDescription'] = summary
     item['label']['metaDescription'] = summary
@@ -111,56 +217,262 @@ async def process_single_item(item):
         'dosing': dosing
     }
 
-    view_blocks = structure_json_html(view_blocks)
+    view_blocks = await run_html(structure_json_html, view_blocks)
+    # Stored and served in the compact format decoded by the app's renderBlocks
+    view_blocks = encode_view_blocks(view_blocks)
+
+    if checkpoint is not None:
+        checkpoint.save_label_fingerprints(set_id, item['label'].get('effectiveTime'), fingerprints)
 
     print(f'Completed {item["drugName"]}.')
 
     return item, q_item, view_blocks
 
 
-async def main():
-    print("Testing process_unstructured_drug_information function...")
+def parse_args():
+    parser = argparse.ArgumentParser(description="Process drug labels and load them into the data stores.")
+    parser.add_argument("--input", default="./data/Labels.json", help="Path of the labels JSON array")
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream labels through a bounded pipeline instead of processing all of them at once")
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="Number of labels processed at the same time in streaming mode")
+    parser.add_argument("--queue-size", type=int, default=0,
+                        help="Capacity of the queues between pipeline stages (defaults to --concurrency)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue the latest unfinished run, skipping stages that already completed")
+    parser.add_argument("--checkpoint-path", default=DEFAULT_CHECKPOINT_PATH,
+                        help="SQLite file where per-item stage outputs are checkpointed")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Reuse previous outputs of stages whose input label sections are unchanged")
+    parser.add_argument("--stage-concurrency", type=int, default=None,
+                        help="Maximum number of LLM stages running at once per label (unlimited by default)")
+    parser.add_argument("--consolidated-summaries", action="store_true",
+                        help="Request all six summaries of a label in one structured-output call")
+    parser.add_argument("--separate-tag-calls", action="store_true",
+                        help="Extract each tag category with its own call instead of one merged call")
+    parser.add_argument("--html-workers", type=int, default=0,
+                        help="Processes running the BeautifulSoup transforms (0 runs them on the event loop)")
+    parser.add_argument("--artifact-path", default=DEFAULT_ARTIFACT_PATH,
+                        help="zstd-compressed JSONL file receiving one record per processed item")
+    parser.add_argument("--sinks-from-artifact", action="store_true",
+                        help="Skip processing and re-run the sinks from the records stored in --artifact-path")
+    parser.add_argument("--set-id", action="append", default=[],
+                        help="With --sinks-from-artifact, only re-run the sinks for this setId (repeatable)")
+    parser.add_argument("--sink-batch-size", type=int, default=16,
+                        help="Maximum number of items written to a data store at once")
+    parser.add_argument("--sink-flush-interval", type=float, default=5.0,
+                        help="Seconds after which a partial sink batch is written")
+    parser.add_argument("--sink-retries", type=int, default=5,
+                        help="Attempts per sink batch before it is reported as failed")
+    parser.add_argument("--batch", action="store_true",
+                        help="Send LLM requests through the OpenAI Batch API (for backfills; processes all labels at once)")
+    parser.add_argument("--batch-dir", default=DEFAULT_BATCH_DIR,
+                        help="Directory receiving the request and result JSONL files of each batch")
+    parser.add_argument("--batch-poll-interval", type=float, default=30.0,
+                        help="Seconds between batch status checks")
+    parser.add_argument("--batch-idle-seconds", type=float, default=2.0,
+                        help="A batch is submitted once no new LLM request has arrived for this long")
+    parser.add_argument("--pack-short-requests", action="store_true",
+                        help="Answer the tag and meta description requests of several short labels in one call")
+    parser.add_argument("--pack-max-item-tokens", type=int, default=400,
+                        help="Inputs up to this many tokens are packed with other labels")
+    parser.add_argument("--pack-token-budget", type=int, default=4000,
+                        help="Maximum input tokens of one packed request")
+    parser.add_argument("--pack-max-items", type=int, default=10,
+                        help="Maximum labels in one packed request")
+    parser.add_argument("--route-models", action="store_true",
+                        help="Send small LLM inputs to a cheaper model and keep gpt-4o for large or table-heavy ones")
+    parser.add_argument("--router-small-model", default=DEFAULT_SMALL_MODEL, choices=known_models(),
+                        help="Model receiving inputs under the token threshold")
+    parser.add_argument("--router-token-threshold", type=int, default=DEFAULT_TOKEN_THRESHOLD,
+                        help="Inputs up to this many tokens go to the small model")
+    parser.add_argument("--router-max-small-tables", type=int, default=0,
+                        help="Inputs with more tables than this always go to gpt-4o")
+    parser.add_argument("--local-tables", action="store_true",
+                        help="Convert sections with only simple tables locally and enhance the rest with the LLM")
+    parser.add_argument("--ledger-path", default=DEFAULT_LEDGER_PATH,
+                        help="SQLite ledger recording the tokens, latency and retries of every LLM call")
+    return parser.parse_args()
+
+
+def create_sink_fanout(args, on_written=None) -> SinkFanout:
+    # Elasticsearch, ChromaDB and Postgres each get their own queue, micro-batches and retries
+    fanout = SinkFanout(create_pipeline_sinks(
+        batch_size=args.sink_batch_size,
+        flush_interval=args.sink_flush_interval,
+        max_retries=args.sink_retries,
+    ), on_written=on_written)
+    fanout.start()
+    return fanout
+
+
+async def run_sinks_from_artifact(args):
+    """Re-runs the sinks from stored artifact records, reading only the requested items when --set-id is given."""
+    reader = ArtifactReader(args.artifact_path)
+    if args.set_id:
+        records = (record for record in (reader.get(set_id) for set_id in args.set_id) if record is not None)
+    else:
+        records = iter(reader)
+
+    fanout = create_sink_fanout(args)
+    drugs = []
+    for record in records:
+        await fanout.submit(record)
+        drugs.append((record['setId'], record['item']['drugName']))
+    await fanout.close()
+
+    print(f"Re-ran sinks for {len(drugs)} items from {args.artifact_path}")
+    # One read of the similarity collection ranks every processed drug
+    run_similarity_job(drugs)
 
-    items = []
-    structured_items_json_array = []
-    q_items = []
-    all_view_blocks = []
 
-    with open("./data/Labels.json", "r", encoding="utf-8") as f:
-        json_array = json.load(f)
-
-        # Filter items if needed (uncomment the line below if you want to process only specific items)
-        # json_array = [item for item in json_array if item['drugName'] in 'Ebglyss']
-
-        # Process all items in parallel
-        print(f"Processing {len(json_array)} items in parallel...")
-        results = await asyncio.gather(*[process_single_item(item) for item in json_array])
-
-        # Collect results
-        for item, q_item, view_blocks in results:
-            items.append(item)
-            structured_items_json_array.append(item)
-            q_items.append(q_item)
-            all_view_blocks.append(view_blocks)
+async def main():
+    args = parse_args()
 
-    with open("./data/items.json", "w", encoding="utf-8") as outfile:
-        json.dump(items, outfile, ensure_ascii=False, indent=2)
+    if args.sinks_from_artifact:
+        await run_sinks_from_artifact(args)
+        return
 
-    # Save the array to a JSON file in the data folder
-    with open("./data/structured_items.json", "w", encoding="utf-8") as outfile:
-        json.dump(structured_items_json_array, outfile, ensure_ascii=False, indent=2)
+    print("Testing process_unstructured_drug_information function...")
 
-    with open("./data/q_items.json", "w", encoding="utf-8") as outfile:
-        json.dump(q_items, outfile, ensure_ascii=False, indent=2)
+    # CPU-heavy HTML transforms run on pre-warmed worker processes so the event loop keeps driving LLM calls
+    start_html_pool(args.html_workers)
+
+    # Stage outputs are checkpointed as they finish so a crash only loses in-flight work
+    checkpoint = CheckpointStore(args.checkpoint_path, incremental=args.incremental)
+    checkpoint.start_run(resume=args.resume)
+    # Every LLM call is recorded under the checkpoint run id, by drug and stage
+    ledger = start_run_ledger(args.ledger_path, checkpoint.run_id)
+    process_item = partial(
+        process_single_item,
+        checkpoint=checkpoint,
+        stage_concurrency=args.stage_concurrency,
+        consolidated_summaries=args.consolidated_summaries,
+        separate_tag_calls=args.separate_tag_calls,
+    )
 
-    upsert_items_to_elasticsearch(q_items)
-    upsert_q_items_to_chromadb(q_items)
-    upsert_items_to_postgres(q_items, structured_items_json_array, all_view_blocks)
+    # Every finished item is appended to the artifact right away, with a setId index for random access
+    artifact = ArtifactWriter(args.artifact_path, append=args.resume)
 
-    for q_item in q_items:
-        similar_items = find_similar_drugs_by_name(q_item['drugName'])
-        update_vector_similar_ranking(q_item['setId'], similar_items)
-        print(f'{q_item["drugName"]} has {len(similar_items)} similar items: {similar_items}')
+    # Finished items are written to the data stores while the rest of the corpus is still processing.
+    # An item counts as completed for --resume only once it is in the artifact and every store
+    fanout = create_sink_fanout(
+        args, on_written=lambda record: checkpoint.mark_item_completed(record['setId'], record)
+    )
+    drugs = []
+
+    # In batch mode every LLM cache miss is queued for the Batch API; enhance requests go in the
+    # first batch and the summary/tag requests they unlock in the next ones
+    batch = None
+    if args.batch:
+        batch = start_batch_executor(
+            directory=args.batch_dir,
+            idle_seconds=args.batch_idle_seconds,
+            poll_interval=args.batch_poll_interval,
+        )
+
+    # Each request is routed by input size; every model keeps its own rate limiter
+    if args.route_models:
+        enable_model_routing(
+            small_model=args.router_small_model,
+            token_threshold=args.router_token_threshold,
+            max_small_tables=args.router_max_small_tables,
+        )
+
+    # Simple tables and tag cleanup are done locally; complex tables still go to the LLM
+    if args.local_tables:
+        enable_local_conversion()
+
+    # Short tag and meta description inputs of concurrent labels share one request, keyed by setId.
+    # Each drug's answer is cached under its own input, the packed prompt and the models
+    if args.pack_short_requests:
+        packed = (
+            ('tags', extract_packed_tags, get_extract_packed_tags_prompt({})),
+            ('metaDescription', summarize_packed_meta_descriptions, get_packed_meta_descriptions_prompt({})),
+        )
+        for name, run_pack, prompt in packed:
+            enable_request_packing(
+                name,
+                run_pack,
+                max_item_tokens=args.pack_max_item_tokens,
+                token_budget=args.pack_token_budget,
+                max_items=args.pack_max_items,
+                cache_scope={'prompt': prompt, 'models': routing_config()},
+            )
+
+    def pending_items(items):
+        # Items the resumed run already wrote to the artifact and every sink are not emitted again
+        for item in items:
+            if checkpoint.item_completed(item['setId']):
+                print(f'Skipping {item["drugName"]}, already completed.')
+                drugs.append((item['setId'], item['drugName']))
+                continue
+            yield item
+
+    async def collect_result(result):
+        item, q_item, view_blocks = result
+        record = {'setId': item['setId'], 'item': item, 'q_item': q_item, 'view_blocks': view_blocks}
+        artifact.write(item['setId'], record)
+        await fanout.submit(record)
+        drugs.append((item['setId'], item['drugName']))
+
+    if args.stream and not args.batch:
+        # Labels are read one at a time and only `concurrency` of them are in flight
+        print(f"Streaming items with concurrency {args.concurrency}...")
+        await run_streaming(
+            pending_items(iter_json_array(args.input)),
+            process_item,
+            collect_result,
+            concurrency=args.concurrency,
+            queue_size=args.queue_size,
+        )
+    else:
+        with open(args.input, "r", encoding="utf-8") as f:
+            json_array = list(pending_items(json.load(f)))
+
+            # Filter items if needed (uncomment the line below if you want to process only specific items)
+            # json_array = [item for item in json_array if item['drugName'] in 'Ebglyss']
+
+            # Process all items in parallel
+            print(f"Processing {len(json_array)} items in parallel...")
+            # A failed item is reported and skipped; its finished stages stay checkpointed for --resume
+            results = await asyncio.gather(*[process_item(item) for item in json_array], return_exceptions=True)
+
+            # Collect results
+            for item, result in zip(json_array, results):
+                if isinstance(result, BaseException):
+                    print(f"Failed to process {item.get('drugName')}: {result}")
+                    continue
+                await collect_result(result)
+
+    artifact.close()
+    print(f"Wrote {artifact.count} items to {args.artifact_path}")
+    print(get_llm_cache().report())
+    print(singleflight_report())
+    print(checkpoint.report())
+    print(rate_limiter_report())
+    print(llm_call_report())
+    if args.pack_short_requests:
+        print(request_packer_report())
+    if args.route_models:
+        print(model_router_report())
+    if args.local_tables:
+        print(local_conversion_report())
+    if batch is not None:
+        print(batch.report())
+        await stop_batch_executor()
+    print(ledger.report())
+    stop_run_ledger()
+
+    await fanout.close()
+
+    # One read of the similarity collection ranks every processed drug
+    run_similarity_job(drugs)
+
+    checkpoint.finish_run()
+    checkpoint.close()
+    shutdown_html_pool()
+    await close_openai_client()
 
     print("Function executed successfully!")
 
@@ -1,29 +1,213 @@
-from aiolimiter import AsyncLimiter
-from asyncio_throttle import Throttler
-
-# Store rate limiters per model
-_rate_limiters = {
-    "gpt-4o": Throttler(rate_limit=100, period=60),
-    "gpt-4o-mini": Throttler(rate_limit=100, period=60),
-    "gpt-4": Throttler(rate_limit=100, period=60)
-}
+import math
+import time
+import asyncio
+from typing import Any, Dict, Iterable, List, Optional
+
+from token_counter import count_message_tokens
 
-# Token limits per model (tokens per minute)
-_model_token_limits = {
-    "gpt-4o": AsyncLimiter(max_rate=30000, time_period=60),
-    "gpt-4o-mini": AsyncLimiter(max_rate=30000, time_period=60),
-    "gpt-4": AsyncLimiter(max_rate=30000, time_period=60)
+# Requests and tokens per minute allowed for each model
+_model_limits = {
+    "gpt-4o": {"rpm": 100, "tpm": 30000},
+    "gpt-4o-mini": {"rpm": 100, "tpm": 30000},
+    "gpt-4": {"rpm": 100, "tpm": 30000},
 }
 
+# Weight of the newest response in the running average of completion tokens per request kind
+_COMPLETION_AVERAGE_WEIGHT = 0.2
 
-def get_rate_limiter(model: str) -> Throttler:
-    if model not in _rate_limiters:
+# One limiter per model, created on first use
+_rate_limiters: Dict[str, "ModelRateLimiter"] = {}
+
+
+class _Bucket:
+    """Continuously refilled bucket; the level may go negative when a request used more than it reserved."""
+
+    def __init__(self, capacity: float, period: float):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.level = capacity
+        self.updated_at = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        self.refill()
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def adjust(self, amount: float):
+        self.refill()
+        self.level = min(self.capacity, self.level + amount)
+
+
+class Reservation:
+    """Tokens reserved for one request, settled against the usage reported by the API."""
+
+    def __init__(self, limiter: "ModelRateLimiter", tokens: int, kind: Optional[str] = None):
+        self.limiter = limiter
+        self.tokens = tokens
+        self.kind = kind
+        self.settled = False
+
+    def reconcile(self, usage: Any):
+        """
+        Refunds unused tokens or charges the overshoot once the response is known.
+
+        Args:
+            usage: The response.usage object (or a dict) with total_tokens and completion_tokens
+        """
+        if self.settled or usage is None:
+            return
+        get = usage.get if isinstance(usage, dict) else lambda name: getattr(usage, name, None)
+        total_tokens = get("total_tokens")
+        if total_tokens is None:
+            return
+        if self.kind is not None and get("completion_tokens") is not None:
+            self.limiter.observe_completion(self.kind, get("completion_tokens"))
+        self.limiter.tokens.adjust(self.tokens - total_tokens)
+        self.limiter.stats["reserved_tokens"] += self.tokens
+        self.limiter.stats["used_tokens"] += total_tokens
+        self.settled = True
+
+    def release(self):
+        """Returns the reserved tokens of a request that failed before producing a response."""
+        if not self.settled:
+            self.limiter.tokens.adjust(self.tokens)
+            self.settled = True
+
+
+class ModelRateLimiter:
+    """
+    Enforces both requests per minute and tokens per minute for one model.
+
+    Each request reserves its prompt tokens plus the completion tokens it expects
+    before it is sent, waiting until both buckets have room. Once the response
+    arrives the reservation is reconciled against response.usage, so the bucket
+    tracks what the API actually counted instead of the estimate. The expected
+    completion is the running average of what earlier requests of the same kind
+    used, with max_tokens only as its upper bound.
+    """
+
+    def __init__(self, model: str, rpm: int, tpm: int, period: float = 60.0):
+        self.model = model
+        self.requests = _Bucket(rpm, period)
+        self.tokens = _Bucket(tpm, period)
+        self.completion_averages: Dict[str, float] = {}
+        self._lock = asyncio.Lock()
+        self.stats = {"requests": 0, "reserved_tokens": 0, "used_tokens": 0, "waited_seconds": 0.0}
+
+    async def acquire(self, tokens: int, kind: Optional[str] = None) -> Reservation:
+        """
+        Waits until a request of the given size fits in both limits and reserves it.
+
+        Args:
+            tokens: Estimated prompt + completion tokens
+            kind: Request kind whose completion average the reported usage updates
+
+        Returns:
+            A Reservation to reconcile with the response usage
+        """
+        # Oversized requests would never fit; let them through once the bucket is full
+        tokens = min(tokens, int(self.tokens.capacity))
+
+        # The lock keeps waiters in FIFO order so large requests are not starved
+        async with self._lock:
+            while True:
+                wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+                if wait <= 0:
+                    break
+                self.stats["waited_seconds"] += wait
+                await asyncio.sleep(wait)
+
+            self.requests.adjust(-1)
+            self.tokens.adjust(-tokens)
+            self.stats["requests"] += 1
+
+        return Reservation(self, tokens, kind)
+
+    def reserve(
+            self,
+            messages: Iterable[dict],
+            max_tokens: int,
+            expected_completion_tokens: Optional[int] = None,
+            kind: Optional[str] = None,
+    ) -> "_PendingReservation":
+        """
+        Reserves capacity for a chat completion, for use as `async with limiter.reserve(...) as reservation`.
+
+        Args:
+            messages: Chat messages sent to the model
+            max_tokens: max_tokens of the request
+            expected_completion_tokens: Completion tokens to reserve; defaults to the running
+                average of the request kind, or max_tokens before its first response
+            kind: Request kind (e.g. the pipeline stage) sharing one completion average
+
+        Returns:
+            An async context manager yielding the Reservation
+        """
+        if expected_completion_tokens is None:
+            expected_completion_tokens = self.expected_completion_tokens(kind, max_tokens)
+        prompt_tokens = count_message_tokens(messages, self.model)
+        return _PendingReservation(self, prompt_tokens + expected_completion_tokens, kind)
+
+    def expected_completion_tokens(self, kind: Optional[str], max_tokens: int) -> int:
+        """Average completion tokens of earlier requests of this kind, capped at max_tokens."""
+        average = self.completion_averages.get(kind) if kind is not None else None
+        if average is None:
+            return max_tokens
+        return min(max_tokens, math.ceil(average))
+
+    def observe_completion(self, kind: str, completion_tokens: int):
+        """Folds the completion tokens reported for a request into the average of its kind."""
+        average = self.completion_averages.get(kind)
+        if average is None:
+            self.completion_averages[kind] = float(completion_tokens)
+        else:
+            self.completion_averages[kind] = average + _COMPLETION_AVERAGE_WEIGHT * (completion_tokens - average)
+
+    def report(self) -> str:
+        return (
+            f"[{self.model}] {self.stats['requests']} requests, {self.stats['used_tokens']} tokens used "
+            f"of {self.stats['reserved_tokens']} reserved, waited {self.stats['waited_seconds']:.1f}s for capacity"
+        )
+
+
+class _PendingReservation:
+    def __init__(self, limiter: ModelRateLimiter, tokens: int, kind: Optional[str] = None):
+        self.limiter = limiter
+        self.tokens = tokens
+        self.kind = kind
+        self.reservation: Optional[Reservation] = None
+
+    async def __aenter__(self) -> Reservation:
+        self.reservation = await self.limiter.acquire(self.tokens, self.kind)
+        return self.reservation
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.reservation.release()
+        return False
+
+
+def known_models() -> List[str]:
+    """Models with configured limits, i.e. the models get_rate_limiter accepts."""
+    return sorted(_model_limits)
+
+
+def get_rate_limiter(model: str) -> ModelRateLimiter:
+    if model not in _model_limits:
         raise ValueError(f"Rate limiter for model {model} not found")
 
+    if model not in _rate_limiters:
+        limits = _model_limits[model]
+        _rate_limiters[model] = ModelRateLimiter(model, rpm=limits["rpm"], tpm=limits["tpm"])
+
     return _rate_limiters[model]
 
-def get_token_bucket_rate_limiter(model: str) -> AsyncLimiter:
-    if model not in _model_token_limits:
-        raise ValueError(f"Rate limiter for model {model} not found")
 
-    return _model_token_limits[model]
+def rate_limiter_report() -> str:
+    return "\n".join(limiter.report() for limiter in _rate_limiters.values())
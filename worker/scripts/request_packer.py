@@ -0,0 +1,146 @@
+import json
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from run_ledger import ledger_scope
+from llm_cache import get_llm_cache, make_answer_cache_key
+
+# Packers by request kind ('tags', 'metaDescription'), registered when packing is enabled
+_request_packers: Dict[str, "RequestPacker"] = {}
+
+
+class RequestPacker:
+    """
+    Groups short per-drug LLM requests of one kind into a single request keyed by setId.
+
+    Drugs are processed concurrently, so their short requests arrive close together.
+    Each submission waits up to linger_seconds for others; a pack is sent as soon as
+    the next input would exceed token_budget or max_items is reached. run_pack answers
+    a whole pack at once and returns the results it could match to a setId; every drug
+    missing from that answer (or a pack that failed entirely) falls back to its own
+    per-drug request.
+
+    Which drugs share a pack changes from run to run, so the LLM cache key of a packed
+    request is never seen twice. Each drug's answer is therefore cached on its own,
+    keyed by its input and cache_scope, and looked up before the drug joins a pack.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            run_pack: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+            max_item_tokens: int = 400,
+            token_budget: int = 4000,
+            max_items: int = 10,
+            linger_seconds: float = 1.0,
+            cache_scope: Any = None,
+    ):
+        self.name = name
+        self.run_pack = run_pack
+        self.max_item_tokens = max_item_tokens
+        self.token_budget = token_budget
+        self.max_items = max_items
+        self.linger_seconds = linger_seconds
+        self.cache_scope = cache_scope
+        self._pending: List[tuple] = []
+        self._pending_tokens = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+        self.stats = {"packs": 0, "packed": 0, "fallbacks": 0, "cached": 0}
+
+    def fits(self, tokens: int) -> bool:
+        """Whether an input is short enough to be packed with others."""
+        return tokens <= self.max_item_tokens
+
+    async def submit(self, set_id: str, payload: Any, tokens: int, fallback: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Adds a drug's input to the next pack and waits for its result.
+
+        Args:
+            set_id: setId of the drug, used to match the packed answer
+            payload: Input passed to run_pack for this drug
+            tokens: Token count of the input, from count_tokens
+            fallback: Coroutine function running the drug's own request
+
+        Returns:
+            The drug's result, from the pack or from the fallback
+        """
+        cached = get_llm_cache().get(self._cache_key(payload))
+        if cached is not None:
+            self.stats["cached"] += 1
+            return json.loads(cached)
+
+        loop = asyncio.get_running_loop()
+        if self._pending and (
+                self._pending_tokens + tokens > self.token_budget or len(self._pending) >= self.max_items):
+            self._flush()
+
+        future = loop.create_future()
+        self._pending.append((set_id, payload, future))
+        self._pending_tokens += tokens
+        if len(self._pending) == 1:
+            self._timer = loop.call_later(self.linger_seconds, self._flush)
+        if len(self._pending) >= self.max_items:
+            self._flush()
+
+        found, result = await future
+        if not found:
+            self.stats["fallbacks"] += 1
+            return await fallback()
+        return result
+
+    def _cache_key(self, payload: Any) -> str:
+        return make_answer_cache_key(f"packed:{self.name}", payload, self.cache_scope)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        entries, self._pending, self._pending_tokens = self._pending, [], 0
+        if not entries:
+            return
+
+        task = asyncio.create_task(self._run(entries))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, entries: List[tuple]):
+        results: Dict[str, Any] = {}
+        # A pack of one is just the drug's own request
+        if len(entries) > 1:
+            try:
+                # The packed call belongs to no single drug
+                with ledger_scope(set_id=None, drug=None, stage=f"{self.name}:packed"):
+                    results = await self.run_pack({set_id: payload for set_id, payload, _ in entries})
+                self.stats["packs"] += 1
+                self.stats["packed"] += sum(1 for set_id, _, _ in entries if set_id in results)
+                cache = get_llm_cache()
+                for set_id, payload, _ in entries:
+                    if set_id in results:
+                        cache.set(self._cache_key(payload), f"packed:{self.name}", json.dumps(results[set_id], ensure_ascii=False))
+            except Exception as e:
+                print(f"[{self.name}] Packed request for {len(entries)} drugs failed: {e}")
+
+        for set_id, _, future in entries:
+            if not future.done():
+                future.set_result((set_id in results, results.get(set_id)))
+
+    def report(self) -> str:
+        return (
+            f"[{self.name}] {self.stats['packed']} drugs answered in {self.stats['packs']} packed requests, "
+            f"{self.stats['cached']} answered from the cache, {self.stats['fallbacks']} per-drug fallbacks"
+        )
+
+
+def enable_request_packing(name: str, run_pack: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]], **kwargs) -> RequestPacker:
+    """Registers the packer used for requests of the given kind."""
+    _request_packers[name] = RequestPacker(name, run_pack, **kwargs)
+    return _request_packers[name]
+
+
+def get_request_packer(name: str) -> Optional[RequestPacker]:
+    return _request_packers.get(name)
+
+
+def request_packer_report() -> str:
+    return "\n".join(packer.report() for packer in _request_packers.values())
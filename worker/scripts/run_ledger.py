@@ -0,0 +1,259 @@
+import os
+import time
+import sqlite3
+import argparse
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, astuple
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+# Default location of the ledger database, next to the pipeline data files
+DEFAULT_LEDGER_PATH = "./data/llm_ledger.sqlite"
+
+# Rows are written in groups of this size (and when the ledger is closed)
+_FLUSH_EVERY = 100
+
+# Drug and stage the LLM calls of the current task are attributed to
+_scope: ContextVar[Dict[str, Optional[str]]] = ContextVar("llm_ledger_scope", default={})
+
+# Record of the LLM call in progress, annotated by the cache, retry and usage hooks
+_current_call: ContextVar[Optional["CallRecord"]] = ContextVar("llm_ledger_call", default=None)
+
+# Active ledger when process_data records the run
+_run_ledger: Optional["RunLedger"] = None
+
+
+@dataclass
+class CallRecord:
+    """
+    One LLM request as seen by a pipeline stage.
+
+    source is 'api' for a live call, 'batch' for a Batch API answer, 'cache' for an LLM
+    cache hit, and 'joined'/'reused' when an identical request of the run answered it.
+    Tokens come from the response usage, so they are 0 for requests that cost nothing.
+    """
+    set_id: Optional[str]
+    drug: Optional[str]
+    stage: Optional[str]
+    model: str
+    source: str = "api"
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    retries: int = 0
+    latency: float = 0.0
+    error: Optional[str] = None
+
+
+@contextmanager
+def ledger_scope(**fields: Optional[str]) -> Iterator[None]:
+    """Attributes the LLM calls made inside the block to the given set_id, drug and/or stage."""
+    token = _scope.set({**_scope.get(), **fields})
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def in_ledger_scope(create: Callable[[], Awaitable[Any]], **fields: Optional[str]) -> Callable[[], Awaitable[Any]]:
+    """Wraps a coroutine function so the LLM calls it makes are attributed to the given scope."""
+
+    async def run() -> Any:
+        with ledger_scope(**fields):
+            return await create()
+
+    return run
+
+
+def current_stage() -> Optional[str]:
+    """Stage the LLM calls of the current task are attributed to, if any."""
+    return _scope.get().get("stage")
+
+
+@contextmanager
+def track_call(model: str) -> Iterator[CallRecord]:
+    """Records one LLM request, with its latency and outcome, in the active ledger."""
+    scope = _scope.get()
+    record = CallRecord(scope.get("set_id"), scope.get("drug"), scope.get("stage"), model)
+    token = _current_call.set(record)
+    started = time.monotonic()
+    try:
+        yield record
+    except BaseException as e:
+        record.error = type(e).__name__
+        raise
+    finally:
+        record.latency = time.monotonic() - started
+        _current_call.reset(token)
+        if _run_ledger is not None:
+            _run_ledger.record(record)
+
+
+def annotate_call(**fields: Any):
+    """Sets fields of the LLM call in progress (e.g. source='cache'); no-op outside track_call."""
+    record = _current_call.get()
+    if record is not None:
+        for name, value in fields.items():
+            setattr(record, name, value)
+
+
+def record_usage(usage: Any):
+    """Adds the prompt and completion tokens of a response.usage object (or dict) to the call in progress."""
+    record = _current_call.get()
+    if record is None or usage is None:
+        return
+    get = usage.get if isinstance(usage, dict) else lambda name: getattr(usage, name, None)
+    record.prompt_tokens += get("prompt_tokens") or 0
+    record.completion_tokens += get("completion_tokens") or 0
+
+
+def record_retry():
+    record = _current_call.get()
+    if record is not None:
+        record.retries += 1
+
+
+class RunLedger:
+    """
+    SQLite table of every LLM request of a run, by drug and stage.
+
+    Used to find the stages and drugs that dominate token spend and wall-clock time.
+    """
+
+    def __init__(self, path: str = DEFAULT_LEDGER_PATH, run_id: Optional[int] = None):
+        self.path = path
+        self.run_id = run_id
+        self._rows: List[tuple] = []
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS llm_calls (
+                run_id INTEGER,
+                set_id TEXT,
+                drug TEXT,
+                stage TEXT,
+                model TEXT NOT NULL,
+                source TEXT NOT NULL,
+                prompt_tokens INTEGER NOT NULL,
+                completion_tokens INTEGER NOT NULL,
+                retries INTEGER NOT NULL,
+                latency REAL NOT NULL,
+                error TEXT,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_llm_calls_run ON llm_calls (run_id, stage);
+            """
+        )
+        self._conn.commit()
+
+    def record(self, call: CallRecord):
+        self._rows.append((self.run_id, *astuple(call), time.time()))
+        if len(self._rows) >= _FLUSH_EVERY:
+            self.flush()
+
+    def flush(self):
+        if not self._rows:
+            return
+        self._conn.executemany(
+            """
+            INSERT INTO llm_calls (
+                run_id, set_id, drug, stage, model, source, prompt_tokens, completion_tokens,
+                retries, latency, error, created_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            self._rows,
+        )
+        self._conn.commit()
+        self._rows = []
+
+    def latest_run_id(self) -> Optional[int]:
+        row = self._conn.execute("SELECT run_id FROM llm_calls ORDER BY rowid DESC LIMIT 1").fetchone()
+        return row[0] if row is not None else None
+
+    def report(self, run_id: Optional[int] = None, top_drugs: int = 10) -> str:
+        """
+        Summarizes the calls of a run per stage and for the most expensive drugs.
+
+        Args:
+            run_id: The run to report on (default: this ledger's run)
+            top_drugs: Number of drugs listed, by total tokens
+
+        Returns:
+            The report as printable lines
+        """
+        self.flush()
+        run_id = self.run_id if run_id is None else run_id
+        columns = """
+            COUNT(*), SUM(source = 'api' OR source = 'batch'), SUM(source = 'cache'),
+            SUM(source = 'joined' OR source = 'reused'), SUM(prompt_tokens), SUM(completion_tokens),
+            SUM(retries), SUM(error IS NOT NULL), SUM(latency), MAX(latency)
+        """
+        lines = [f"LLM ledger (run {run_id}, {self.path}):"]
+        header = (f"  {'':<34} {'calls':>6} {'sent':>6} {'cache':>6} {'dedup':>6} {'prompt':>10} "
+                  f"{'completion':>10} {'retry':>6} {'fail':>5} {'time(s)':>9} {'max(s)':>7}")
+
+        def row(name, values) -> str:
+            calls, sent, cache, dedup, prompt, completion, retries, failed, latency, slowest = values
+            return (f"  {(name or '-')[:34]:<34} {calls:>6} {sent:>6} {cache:>6} {dedup:>6} {prompt:>10} "
+                    f"{completion:>10} {retries:>6} {failed:>5} {latency:>9.1f} {slowest:>7.1f}")
+
+        lines.append("By stage:")
+        lines.append(header)
+        for stage, *values in self._conn.execute(
+                f"SELECT stage, {columns} FROM llm_calls WHERE run_id IS ? GROUP BY stage "
+                f"ORDER BY SUM(prompt_tokens + completion_tokens) DESC",
+                (run_id,),
+        ):
+            lines.append(row(stage, values))
+
+        lines.append(f"Top {top_drugs} drugs by tokens:")
+        lines.append(header)
+        for drug, *values in self._conn.execute(
+                f"SELECT drug, {columns} FROM llm_calls WHERE run_id IS ? GROUP BY set_id, drug "
+                f"ORDER BY SUM(prompt_tokens + completion_tokens) DESC LIMIT ?",
+                (run_id, top_drugs),
+        ):
+            lines.append(row(drug, values))
+        return "\n".join(lines)
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+
+def start_run_ledger(path: str = DEFAULT_LEDGER_PATH, run_id: Optional[int] = None) -> RunLedger:
+    """Records every tracked LLM call in the ledger at path until stop_run_ledger() is called."""
+    global _run_ledger
+
+    _run_ledger = RunLedger(path, run_id)
+    return _run_ledger
+
+
+def get_run_ledger() -> Optional[RunLedger]:
+    return _run_ledger
+
+
+def stop_run_ledger():
+    global _run_ledger
+
+    if _run_ledger is not None:
+        _run_ledger.close()
+        _run_ledger = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print the per-stage and per-drug LLM usage of a pipeline run.")
+    parser.add_argument("--ledger-path", default=DEFAULT_LEDGER_PATH, help="Path of the ledger database")
+    parser.add_argument("--run-id", type=int, default=None, help="Run to report on (default: the latest)")
+    parser.add_argument("--top-drugs", type=int, default=10, help="Number of drugs listed")
+    args = parser.parse_args()
+
+    ledger = RunLedger(args.ledger_path)
+    print(ledger.report(args.run_id if args.run_id is not None else ledger.latest_run_id(), args.top_drugs))
+    ledger.close()
@@ -0,0 +1,141 @@
+from dataclasses import dataclass
+from typing import List, Optional
+
+from bs4 import BeautifulSoup, NavigableString, Tag
+
+from token_counter import count_tokens
+
+# Input HTML tokens per enhance part; sections up to this size are sent whole
+DEFAULT_MAX_PART_TOKENS = 2000
+
+HEADING_TAGS = ('h1', 'h2', 'h3', 'h4', 'h5', 'h6')
+
+# Wrappers that are descended into when they hold the whole section
+_WRAPPER_TAGS = ('html', 'body', 'section', 'div')
+
+
+@dataclass
+class SectionPart:
+    """A run of consecutive top-level blocks of a section, enhanced with one call."""
+    html: str
+    tokens: int
+    # Shallowest heading level inside the part, or None when it has no heading
+    heading_level: Optional[int]
+    # Level of the last heading before the part, or None at the start of the section
+    context_level: Optional[int]
+
+
+def heading_level(tag: Tag) -> int:
+    return int(tag.name[1])
+
+
+def _top_level_blocks(html: str) -> List[str]:
+    soup = BeautifulSoup(html, "html.parser")
+    root = soup
+    # Descend through a single wrapping <section>/<div> so its children can be split
+    while True:
+        children = [child for child in root.children if not (isinstance(child, NavigableString) and not child.strip())]
+        if len(children) == 1 and isinstance(children[0], Tag) and children[0].name in _WRAPPER_TAGS:
+            root = children[0]
+        else:
+            break
+    # Loose text keeps its escaping (and comments their markers) so the parts join back to the input
+    return [child.output_ready() if isinstance(child, NavigableString) else str(child) for child in children]
+
+
+def _is_heading(block: str) -> bool:
+    return block[:3].lower() in tuple(f"<{name}" for name in HEADING_TAGS)
+
+
+def _is_table(block: str) -> bool:
+    return block[:6].lower() == "<table"
+
+
+def _units(blocks: List[str]) -> List[List[str]]:
+    # A heading opens a new unit, and a table is a unit of its own (with the text after it)
+    units: List[List[str]] = []
+    for block in blocks:
+        if not units or _is_heading(block) or _is_table(block):
+            units.append([])
+        units[-1].append(block)
+    return units
+
+
+def split_html_section(html: str, max_tokens: int = DEFAULT_MAX_PART_TOKENS, model: str = "gpt-4o") -> List[SectionPart]:
+    """
+    Splits a label section into parts of at most max_tokens on heading and table boundaries.
+
+    Consecutive units (a heading or table with the blocks that follow it) are packed
+    greedily into parts; a unit larger than the budget is split between its top-level
+    blocks, and a single block larger than the budget becomes a part of its own.
+
+    Args:
+        html: The cleaned HTML of the section
+        max_tokens: Token budget of one part
+        model: The model whose tokenizer counts the tokens
+
+    Returns:
+        The parts in document order; one part holding the whole section when it fits the budget
+    """
+    total = count_tokens(html, model)
+    if total <= max_tokens:
+        return [SectionPart(html, total, _heading_level_of(html), None)]
+
+    pieces: List[List[str]] = []
+    for unit in _units(_top_level_blocks(html)):
+        if count_tokens("".join(unit), model) <= max_tokens:
+            pieces.append(unit)
+        else:
+            pieces.extend([block] for block in unit)
+
+    parts: List[SectionPart] = []
+    current: List[str] = []
+    current_tokens = 0
+    context_level: Optional[int] = None
+    part_context: Optional[int] = None
+    for piece in pieces:
+        piece_tokens = count_tokens("".join(piece), model)
+        if current and current_tokens + piece_tokens > max_tokens:
+            parts.append(_make_part(current, current_tokens, part_context))
+            current, current_tokens = [], 0
+        if not current:
+            part_context = context_level
+        current.extend(piece)
+        current_tokens += piece_tokens
+        for block in piece:
+            if _is_heading(block):
+                context_level = int(block[2])
+    if current:
+        parts.append(_make_part(current, current_tokens, part_context))
+    return parts
+
+
+def _make_part(blocks: List[str], tokens: int, context_level: Optional[int]) -> SectionPart:
+    html = "".join(blocks)
+    return SectionPart(html, tokens, _heading_level_of(html), context_level)
+
+
+def _heading_level_of(html: str) -> Optional[int]:
+    soup = BeautifulSoup(html, "html.parser")
+    levels = [heading_level(tag) for tag in soup.find_all(HEADING_TAGS)]
+    return min(levels) if levels else None
+
+
+def align_heading_levels(soup: BeautifulSoup, part: SectionPart):
+    """
+    Shifts the headings of an enhanced part so they nest like the part's input headings.
+
+    The shallowest output heading is moved to the input's shallowest level, or below the
+    heading preceding the part when the input has none, keeping the stitched section's
+    outline consistent however each sub-call chose its levels.
+    """
+    headings = soup.find_all(HEADING_TAGS)
+    if not headings:
+        return
+    if part.heading_level is not None:
+        target = part.heading_level
+    else:
+        target = min(6, (part.context_level or 1) + 1)
+    shift = target - min(heading_level(tag) for tag in headings)
+    for tag in headings:
+        tag.name = f"h{max(1, min(6, heading_level(tag) + shift))}"
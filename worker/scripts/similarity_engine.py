@@ -0,0 +1,163 @@
+import os
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import chromadb
+import numpy as np
+
+from update_vector_similar_ranking import bulk_update_vector_similar_ranking
+
+
+def fetch_similarity_embeddings(
+        collection_name: str = "drug_similar_data",
+        page_size: int = 5000,
+) -> Tuple[np.ndarray, List[dict]]:
+    """
+    Reads every chunk embedding of the similarity collection in a single pass.
+
+    Args:
+        collection_name: Name of the Chroma collection
+        page_size: Number of chunks fetched per request
+
+    Returns:
+        A (embeddings, metadatas) tuple; embeddings is a float32 matrix with one row per chunk
+    """
+    chroma_host = os.getenv("CHROMA_HOST", "localhost")
+    chroma_port = os.getenv("CHROMA_PORT", "8000")
+
+    print(f'Starting Chroma DB similarity job {chroma_host}:{chroma_port}')
+
+    client = chromadb.HttpClient(
+        host=chroma_host,
+        port=int(chroma_port),
+        ssl=False
+    )
+    # Only stored embeddings are read, so the embedding model is not loaded
+    collection = client.get_collection(name=collection_name)
+
+    rows = []
+    metadatas = []
+    offset = 0
+    while True:
+        page = collection.get(include=["embeddings", "metadatas"], limit=page_size, offset=offset)
+        if len(page["ids"]) == 0:
+            break
+        rows.append(np.asarray(page["embeddings"], dtype=np.float32))
+        metadatas.extend(page["metadatas"])
+        offset += len(page["ids"])
+
+    if not rows:
+        return np.empty((0, 0), dtype=np.float32), []
+    return np.vstack(rows), metadatas
+
+
+def compute_similar_rankings(
+        embeddings: np.ndarray,
+        metadatas: List[dict],
+        drug_names: Optional[Iterable[str]] = None,
+        top_k: int = 5,
+        chunk_size: int = 256,
+) -> Dict[str, List[Tuple[str, int]]]:
+    """
+    Ranks similar drugs for every drug from its mean chunk embedding.
+
+    Matches find_similar_drugs_by_name: the top_k * 3 chunks nearest to a drug's
+    centroid (L2 distance, Chroma's default space) are taken, chunks of the drug
+    itself are dropped and the remaining slugs are ranked by how often they appear.
+    Centroids are scored against all chunks with one matrix product per block of
+    chunk_size drugs, which bounds memory to chunk_size x number of chunks.
+
+    Args:
+        embeddings: Chunk embeddings, one row per chunk
+        metadatas: Chunk metadata with 'name' and 'slug'
+        drug_names: Drugs to rank; all drugs in the collection when None
+        top_k: Number of top similar drugs to return per drug
+        chunk_size: Number of drugs scored per matrix product
+
+    Returns:
+        A dict mapping drug names to ranked lists of (slug, match count)
+    """
+    names = [m.get("name") for m in metadatas]
+    slugs = [m.get("slug") for m in metadatas]
+
+    chunk_rows: Dict[str, List[int]] = {}
+    for row, name in enumerate(names):
+        chunk_rows.setdefault(name, []).append(row)
+
+    if drug_names is None:
+        targets = [name for name in chunk_rows if name]
+    else:
+        targets = []
+        for name in dict.fromkeys(drug_names):
+            if name in chunk_rows:
+                targets.append(name)
+            else:
+                print(f"No embeddings found for drugName: {name}")
+
+    if not targets:
+        return {}
+
+    centroids = np.stack([embeddings[chunk_rows[name]].mean(axis=0) for name in targets])
+
+    # argmin ||c - x||^2 == argmax (c.x - ||x||^2 / 2), so the centroid norm can be dropped
+    half_norms = 0.5 * np.einsum("ij,ij->i", embeddings, embeddings)
+    n_results = min(top_k * 3, len(metadatas))
+
+    rankings = {}
+    for start in range(0, len(targets), chunk_size):
+        block = centroids[start:start + chunk_size]
+        scores = block @ embeddings.T - half_norms
+        nearest = np.argpartition(-scores, n_results - 1, axis=1)[:, :n_results]
+
+        for offset, rows in enumerate(nearest):
+            name = targets[start + offset]
+            rows = rows[np.argsort(-scores[offset, rows], kind="stable")]
+            similar_names = [slugs[row] for row in rows if names[row] and names[row] != name]
+            rankings[name] = Counter(similar_names).most_common(top_k)
+
+    return rankings
+
+
+def run_similarity_job(
+        drugs: Optional[List[Tuple[str, str]]] = None,
+        collection_name: str = "drug_similar_data",
+        top_k: int = 5,
+        chunk_size: int = 256,
+) -> Dict[str, List[Tuple[str, int]]]:
+    """
+    Computes similar-drug rankings from one read of the collection and stores them in a single bulk update.
+
+    Args:
+        drugs: (setId, drugName) pairs to update; every drug in the collection when None
+        collection_name: Name of the Chroma collection
+        top_k: Number of top similar drugs per drug
+        chunk_size: Number of drugs scored per matrix product
+
+    Returns:
+        A dict mapping setIds to their ranked similar drugs
+    """
+    embeddings, metadatas = fetch_similarity_embeddings(collection_name)
+    print(f"Loaded {len(metadatas)} similarity chunks")
+
+    if drugs is None:
+        drugs = list({m.get("setId"): m.get("name") for m in metadatas if m.get("setId")}.items())
+
+    by_name = compute_similar_rankings(
+        embeddings,
+        metadatas,
+        drug_names=[drug_name for _, drug_name in drugs],
+        top_k=top_k,
+        chunk_size=chunk_size,
+    )
+
+    rankings = {set_id: by_name[drug_name] for set_id, drug_name in drugs if drug_name in by_name}
+    for set_id, drug_name in drugs:
+        if set_id in rankings:
+            print(f'{drug_name} has {len(rankings[set_id])} similar items: {rankings[set_id]}')
+
+    bulk_update_vector_similar_ranking(rankings)
+    return rankings
+
+
+if __name__ == "__main__":
+    run_similarity_job()
@@ -0,0 +1,115 @@
+import os
+import re
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from llm_cache import make_cache_key
+from run_ledger import annotate_call
+
+# Completed responses remembered for the rest of the run
+DEFAULT_MEMO_ENTRIES = 10_000
+
+_WHITESPACE = re.compile(r"\s+")
+
+_singleflight: Optional["SingleFlight"] = None
+
+
+def normalize_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Collapses whitespace runs in message contents so inputs differing only in spacing share a key.
+
+    Whitespace between tags is kept as one space rather than removed: `<b>a</b> <i>b</i>`
+    renders differently from `<b>a</b><i>b</i>` and must not share a response.
+    """
+    normalized = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            content = _WHITESPACE.sub(" ", content).strip()
+        normalized.append({**message, "content": content})
+    return normalized
+
+
+def make_dedup_key(
+        model: str,
+        messages: List[Dict[str, Any]],
+        temperature: float,
+        max_tokens: int,
+        response_format: Any = None,
+) -> str:
+    """Builds the key of a request from its normalized messages; see make_cache_key."""
+    return make_cache_key(model, normalize_messages(messages), temperature, max_tokens, response_format)
+
+
+class SingleFlight:
+    """
+    Coalesces identical LLM requests within a run.
+
+    The first request for a key runs; requests arriving while it is in flight wait for
+    its result instead of calling the API, and later requests for the same key reuse
+    the remembered response (the max_entries most recent). A failed call is not
+    remembered, so the next request for its key tries again.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MEMO_ENTRIES):
+        self.max_entries = max_entries
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self._done: "OrderedDict[str, Any]" = OrderedDict()
+        self.stats = {"requests": 0, "calls": 0, "joined": 0, "reused": 0}
+
+    async def do(self, key: str, create: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Args:
+            key: Dedup key of the request, from make_dedup_key
+            create: Coroutine function producing the response when no identical request is running
+
+        Returns:
+            The response, shared by every request with the same key
+        """
+        self.stats["requests"] += 1
+        if key in self._done:
+            self.stats["reused"] += 1
+            annotate_call(source="reused")
+            self._done.move_to_end(key)
+            return self._done[key]
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.stats["joined"] += 1
+            annotate_call(source="joined")
+        else:
+            self.stats["calls"] += 1
+            # The call runs in its own task so cancelling one waiter does not cancel the others
+            task = asyncio.ensure_future(create())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda finished: self._finish(key, finished))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Task):
+        self._in_flight.pop(key, None)
+        if task.cancelled() or task.exception() is not None or task.result() is None:
+            return
+        self._done[key] = task.result()
+        while len(self._done) > self.max_entries:
+            self._done.popitem(last=False)
+
+    def report(self) -> str:
+        saved = self.stats["joined"] + self.stats["reused"]
+        return (
+            f"Request dedup: {self.stats['requests']} requests, {self.stats['calls']} calls, "
+            f"{saved} saved ({self.stats['joined']} joined an in-flight call, {self.stats['reused']} reused a response)"
+        )
+
+
+def get_singleflight() -> SingleFlight:
+    """Returns the worker-wide request coalescer, configured from the environment: LLM_DEDUP_MAX_ENTRIES."""
+    global _singleflight
+
+    if _singleflight is None:
+        _singleflight = SingleFlight(max_entries=int(os.getenv("LLM_DEDUP_MAX_ENTRIES", DEFAULT_MEMO_ENTRIES)))
+    return _singleflight
+
+
+def singleflight_report() -> str:
+    return get_singleflight().report()
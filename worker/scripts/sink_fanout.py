@@ -0,0 +1,181 @@
+import random
+import asyncio
+from typing import Any, Callable, Dict, List, Optional
+
+# Sentinel telling a sink worker that no more records will arrive
+_CLOSE = object()
+
+
+class SinkWorker:
+    """
+    Writes records to one data store in micro-batches from its own bounded queue.
+
+    A batch is flushed when it reaches batch_size or flush_interval seconds after its
+    first record arrived, so finished items reach the store shortly after their LLM
+    stages complete. write_batch is a synchronous function (the store clients are blocking)
+    and runs in a thread; failed batches are retried with jittered exponential backoff.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            write_batch: Callable[[List[Any]], Any],
+            batch_size: int = 16,
+            flush_interval: float = 5.0,
+            max_retries: int = 5,
+            base_delay: float = 1.0,
+            max_delay: float = 60.0,
+            queue_size: int = 256,
+            open_sink: Optional[Callable[[], Any]] = None,
+            close_sink: Optional[Callable[[], Any]] = None,
+    ):
+        self.name = name
+        self.write_batch = write_batch
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.open_sink = open_sink
+        self.close_sink = close_sink
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.stats = {"written": 0, "batches": 0, "retries": 0, "failed": 0}
+        self.failed_records: List[Any] = []
+        # Set by SinkFanout to learn which records this store acknowledged or gave up on
+        self.on_written: Optional[Callable[[List[Any]], None]] = None
+        self.on_failed: Optional[Callable[[List[Any]], None]] = None
+
+    async def _flush(self, batch: List[Any]):
+        attempt = 0
+        while True:
+            try:
+                await asyncio.to_thread(self.write_batch, batch)
+                self.stats["written"] += len(batch)
+                self.stats["batches"] += 1
+                if self.on_written is not None:
+                    self.on_written(batch)
+                return
+            except Exception as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    print(f"[{self.name}] Giving up on a batch of {len(batch)} records: {e}")
+                    self._fail(batch)
+                    return
+                delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+                print(f"[{self.name}] Batch failed ({e}), retrying in {delay:.1f}s (attempt {attempt}/{self.max_retries})")
+                self.stats["retries"] += 1
+                await asyncio.sleep(delay)
+
+    def _fail(self, records: List[Any]):
+        self.stats["failed"] += len(records)
+        self.failed_records.extend(records)
+        if self.on_failed is not None:
+            self.on_failed(records)
+
+    async def _drain(self):
+        # The store is unreachable: keep consuming so producers never block on this sink
+        while True:
+            record = await self.queue.get()
+            if record is _CLOSE:
+                return
+            self._fail([record])
+
+    async def run(self):
+        if self.open_sink is not None:
+            try:
+                await asyncio.to_thread(self.open_sink)
+            except Exception as e:
+                print(f"[{self.name}] Could not open sink: {e}")
+                await self._drain()
+                return
+
+        loop = asyncio.get_running_loop()
+        try:
+            batch: List[Any] = []
+            batch_started = 0.0
+            closed = False
+            while not closed:
+                # An open batch is flushed at most flush_interval seconds after its first record
+                timeout = None
+                if batch:
+                    timeout = max(0.0, self.flush_interval - (loop.time() - batch_started))
+
+                try:
+                    record = await asyncio.wait_for(self.queue.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    record = None
+
+                if record is _CLOSE:
+                    closed = True
+                elif record is not None:
+                    if not batch:
+                        batch_started = loop.time()
+                    batch.append(record)
+
+                if batch and (closed or record is None or len(batch) >= self.batch_size):
+                    await self._flush(batch)
+                    batch = []
+        finally:
+            if self.close_sink is not None:
+                await asyncio.to_thread(self.close_sink)
+
+    def report(self) -> str:
+        return (
+            f"[{self.name}] {self.stats['written']} records in {self.stats['batches']} batches, "
+            f"{self.stats['retries']} retries, {self.stats['failed']} failed"
+        )
+
+
+class SinkFanout:
+    """
+    Fans every finished item out to several SinkWorkers running concurrently.
+
+    Each sink has an independent queue and retry policy, so a slow or failing store
+    does not hold back the others until its own queue is full. on_written is called
+    with a record once every sink has written it; a record any sink gave up on is
+    never reported.
+    """
+
+    def __init__(self, sinks: List[SinkWorker], on_written: Optional[Callable[[Any], None]] = None):
+        self.sinks = sinks
+        self.on_written = on_written
+        self._tasks: List[asyncio.Task] = []
+        # Sinks still to acknowledge each submitted record, keyed by id(record)
+        self._pending: Dict[int, list] = {}
+        for sink in sinks:
+            sink.on_written = self._acknowledge
+            sink.on_failed = self._forget
+
+    def start(self):
+        self._tasks = [asyncio.create_task(sink.run()) for sink in self.sinks]
+
+    def _acknowledge(self, records: List[Any]):
+        for record in records:
+            entry = self._pending.get(id(record))
+            if entry is None:
+                continue
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._pending[id(record)]
+                if self.on_written is not None:
+                    self.on_written(record)
+
+    def _forget(self, records: List[Any]):
+        for record in records:
+            self._pending.pop(id(record), None)
+
+    async def submit(self, record: Any):
+        if self.on_written is not None:
+            # Holding the record keeps its id() unique until every sink is done with it
+            self._pending[id(record)] = [record, len(self.sinks)]
+        for sink in self.sinks:
+            await sink.queue.put(record)
+
+    async def close(self) -> Dict[str, dict]:
+        """Flushes the remaining records, waits for every sink and returns their stats."""
+        for sink in self.sinks:
+            await sink.queue.put(_CLOSE)
+        await asyncio.gather(*self._tasks)
+        for sink in self.sinks:
+            print(sink.report())
+        return {sink.name: sink.stats for sink in self.sinks}
@@ -0,0 +1,112 @@
+import heapq
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+
+class StageGraph:
+    """
+    Small DAG executor for the per-item LLM stages.
+
+    Every stage declares the stages it depends on and starts as soon as all of them
+    have finished, instead of waiting for a whole group of stages (asyncio.gather)
+    to complete. When max_concurrency is set, ready stages are started in priority
+    order (lower value first) while the running slots are full.
+    """
+
+    def __init__(self, max_concurrency: Optional[int] = None):
+        self.max_concurrency = max_concurrency
+        self._stages: Dict[str, dict] = {}
+
+    def add(
+            self,
+            name: str,
+            run: Callable[[], Awaitable[Any]],
+            depends_on: Iterable[str] = (),
+            priority: int = 0,
+    ):
+        """
+        Registers a stage.
+
+        Args:
+            name: Unique stage name
+            run: Coroutine function executing the stage
+            depends_on: Names of the stages that must finish before this one starts
+            priority: Start order among ready stages when concurrency is limited (lower first)
+        """
+        if name in self._stages:
+            raise ValueError(f"Stage {name} is already registered")
+        self._stages[name] = {"run": run, "depends_on": list(depends_on), "priority": priority}
+
+    def _validate(self):
+        for name, stage in self._stages.items():
+            for dependency in stage["depends_on"]:
+                if dependency not in self._stages:
+                    raise ValueError(f"Stage {name} depends on unknown stage {dependency}")
+
+        # Kahn's algorithm; anything left over is part of a cycle
+        remaining = {name: len(stage["depends_on"]) for name, stage in self._stages.items()}
+        ready = [name for name, count in remaining.items() if count == 0]
+        visited = 0
+        while ready:
+            current = ready.pop()
+            visited += 1
+            for name, stage in self._stages.items():
+                if current in stage["depends_on"]:
+                    remaining[name] -= 1
+                    if remaining[name] == 0:
+                        ready.append(name)
+        if visited != len(self._stages):
+            raise ValueError("Stage graph contains a cycle")
+
+    async def run(self) -> Dict[str, Any]:
+        """
+        Executes every stage respecting dependencies.
+
+        Returns:
+            A dict mapping stage names to their results
+
+        Raises:
+            The first exception raised by a stage; the other running stages are cancelled.
+        """
+        self._validate()
+
+        results: Dict[str, Any] = {}
+        pending = {name: set(stage["depends_on"]) for name, stage in self._stages.items()}
+        dependents: Dict[str, List[str]] = {name: [] for name in self._stages}
+        for name, stage in self._stages.items():
+            for dependency in stage["depends_on"]:
+                dependents[dependency].append(name)
+
+        ready: List[tuple] = []
+        order = 0
+        for name, deps in pending.items():
+            if not deps:
+                heapq.heappush(ready, (self._stages[name]["priority"], order, name))
+                order += 1
+
+        running: Dict[asyncio.Task, str] = {}
+        limit = self.max_concurrency or len(self._stages) or 1
+
+        try:
+            while ready or running:
+                while ready and len(running) < limit:
+                    _, _, name = heapq.heappop(ready)
+                    task = asyncio.create_task(self._stages[name]["run"]())
+                    running[task] = name
+
+                done, _ = await asyncio.wait(running.keys(), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name = running.pop(task)
+                    results[name] = task.result()
+                    for dependent in dependents[name]:
+                        pending[dependent].discard(name)
+                        if not pending[dependent]:
+                            heapq.heappush(ready, (self._stages[dependent]["priority"], order, dependent))
+                            order += 1
+        except BaseException:
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running.keys(), return_exceptions=True)
+            raise
+
+        return results
@@ -0,0 +1,224 @@
+import re
+import json
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, Iterator, List, Optional, Union
+
+# Sentinel placed on a queue to tell the consumer side there is nothing more to read
+_DONE = object()
+
+# Characters that decide where a JSON value ends, outside strings, inside them, and after a bare scalar
+_STRUCTURE = re.compile(r'["{}\[\]]')
+_STRING_END = re.compile(r'["\\]')
+_SCALAR_END = re.compile(r'[\s,\]}]')
+_WHITESPACE = re.compile(r'\s*')
+
+
+class _ValueScanner:
+    """
+    Finds where one JSON value ends in text that arrives in chunks.
+
+    The state (nesting depth, inside a string, after a backslash) carries over
+    between chunks, so every character is looked at once however many chunks
+    the value spans.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.scalar: Optional[bool] = None
+
+    def feed(self, text: str, pos: int = 0) -> int:
+        """Returns the index just past the value in text, or -1 when it continues in the next chunk."""
+        if self.scalar is None:
+            self.scalar = text[pos] not in '{["'
+        if self.scalar:
+            # Numbers, true, false and null end at the next separator
+            match = _SCALAR_END.search(text, pos)
+            return match.start() if match else -1
+
+        while pos < len(text):
+            if self.escaped:
+                self.escaped = False
+                pos += 1
+                continue
+            if self.in_string:
+                match = _STRING_END.search(text, pos)
+                if match is None:
+                    return -1
+                pos = match.end()
+                if match.group() == "\\":
+                    self.escaped = True
+                    continue
+                self.in_string = False
+                if self.depth == 0:
+                    return pos
+                continue
+
+            match = _STRUCTURE.search(text, pos)
+            if match is None:
+                return -1
+            pos = match.end()
+            char = match.group()
+            if char == '"':
+                self.in_string = True
+            elif char in "{[":
+                self.depth += 1
+            else:
+                self.depth -= 1
+                if self.depth == 0:
+                    return pos
+        return -1
+
+
+def iter_json_array(path: str, chunk_size: int = 1 << 16) -> Iterator[Any]:
+    """
+    Lazily yields the elements of a top-level JSON array stored in a file.
+
+    Only one element (plus one read chunk) is held in memory at a time, so the
+    size of the input file does not dictate the memory used by the pipeline.
+    Chunks are scanned once for the end of the current element, which is
+    decoded a single time when complete, so reading stays linear in the file
+    size however many chunks an element spans.
+
+    Args:
+        path: Path of a file containing a JSON array (e.g. data/Labels.json)
+        chunk_size: Number of characters read from the file at a time
+
+    Returns:
+        An iterator over the decoded array elements
+    """
+    decoder = json.JSONDecoder()
+    chunk = ""
+    pos = 0
+    started = False
+    scanner: Optional[_ValueScanner] = None
+    # Pieces of the current element read in earlier chunks
+    parts: List[str] = []
+
+    with open(path, "r", encoding="utf-8") as f:
+        while True:
+            if scanner is None:
+                # Skip whitespace and separators between elements
+                pos = _WHITESPACE.match(chunk, pos).end()
+                if pos == len(chunk):
+                    chunk, pos = f.read(chunk_size), 0
+                    if not chunk:
+                        if not started:
+                            raise ValueError(f"{path} does not contain a JSON array")
+                        raise ValueError(f"{path} ends before its JSON array is closed")
+                    continue
+
+                char = chunk[pos]
+                if not started:
+                    if char != "[":
+                        raise ValueError(f"{path} does not contain a JSON array")
+                    started = True
+                    pos += 1
+                    continue
+                if char == ",":
+                    pos += 1
+                    continue
+                if char == "]":
+                    return
+                scanner = _ValueScanner()
+
+            end = scanner.feed(chunk, pos)
+            if end < 0:
+                # The element is split across chunks; keep this part and scan the next chunk
+                parts.append(chunk[pos:])
+                chunk, pos = f.read(chunk_size), 0
+                if not chunk:
+                    text = "".join(parts)
+                    raise json.JSONDecodeError("Unterminated array element", text, len(text))
+                continue
+
+            parts.append(chunk[pos:end])
+            element, _ = decoder.raw_decode("".join(parts))
+            parts, scanner, pos = [], None, end
+            yield element
+
+
+async def run_streaming(
+        items: Union[Iterable[Any], AsyncIterator[Any]],
+        process_item: Callable[[Any], Awaitable[Any]],
+        on_result: Callable[[Any], Union[Awaitable[None], None]],
+        concurrency: int = 4,
+        queue_size: int = 0,
+) -> dict:
+    """
+    Runs process_item over items with a bounded number of items in flight.
+
+    The pipeline has three stages connected by bounded queues:
+    a producer feeding the input queue, `concurrency` workers running
+    process_item, and a single consumer handing results to on_result.
+    When any queue is full the upstream stage waits, so memory and open
+    connections are bounded by the concurrency setting instead of the corpus size.
+
+    Args:
+        items: Iterable (or async iterable) of items to process
+        process_item: Coroutine function that processes one item
+        on_result: Callback (sync or async) invoked with each result, in completion order
+        concurrency: Maximum number of items processed at the same time
+        queue_size: Capacity of the queues between stages (defaults to concurrency)
+
+    Returns:
+        A dict with the number of processed and failed items
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+
+    queue_size = queue_size or concurrency
+    input_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    output_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    stats = {"processed": 0, "failed": 0}
+
+    async def produce():
+        if hasattr(items, "__aiter__"):
+            async for item in items:
+                await input_queue.put(item)
+        else:
+            for item in items:
+                await input_queue.put(item)
+        for _ in range(concurrency):
+            await input_queue.put(_DONE)
+
+    async def work():
+        while True:
+            item = await input_queue.get()
+            if item is _DONE:
+                await output_queue.put(_DONE)
+                return
+            try:
+                result = await process_item(item)
+            except Exception as e:
+                name = item.get("drugName") if isinstance(item, dict) else item
+                print(f"Error processing {name}: {e}")
+                stats["failed"] += 1
+                continue
+            await output_queue.put(result)
+
+    async def consume():
+        finished_workers = 0
+        while finished_workers < concurrency:
+            result = await output_queue.get()
+            if result is _DONE:
+                finished_workers += 1
+                continue
+            outcome = on_result(result)
+            if asyncio.iscoroutine(outcome):
+                await outcome
+            stats["processed"] += 1
+
+    tasks = [asyncio.create_task(produce()), asyncio.create_task(consume())]
+    tasks += [asyncio.create_task(work()) for _ in range(concurrency)]
+
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+    print(f"Streaming pipeline finished: {stats['processed']} processed, {stats['failed']} failed")
+    return stats
@@ -1,9 +1,163 @@
-from bs4 import BeautifulSoup, NavigableString, Comment, Tag
+import re
+from html.parser import HTMLParser
+from typing import Collection, Optional
+
+from bs4 import NavigableString, Comment, Tag
+
+# Block types the app's renderBlocks knows how to render; other tags are unwrapped
+ALLOWED_BLOCK_TAGS = frozenset({
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'ul', 'ol', 'li', 'a', 'strong', 'em', 'code', 'mark',
+    'sup', 'table', 'thead', 'tbody', 'tfoot', 'caption', 'tr', 'th', 'td', 'embed-medication',
+})
+# Tags dropped together with their content
+DROPPED_TAGS = frozenset({'script', 'style'})
+
+# Tags without content or end tag (BeautifulSoup's empty-element tags)
+VOID_TAGS = frozenset({
+    'area', 'base', 'basefont', 'bgsound', 'br', 'col', 'command', 'embed', 'frame', 'hr', 'image',
+    'img', 'input', 'isindex', 'keygen', 'link', 'menuitem', 'meta', 'nextid', 'param', 'source',
+    'spacer', 'track', 'wbr',
+})
+# Attributes BeautifulSoup splits into lists of values, by tag ('*' for every tag)
+LIST_ATTRIBUTES = {
+    '*': {'class', 'accesskey', 'dropzone'},
+    'a': {'rel', 'rev'},
+    'link': {'rel', 'rev'},
+    'td': {'headers'},
+    'th': {'headers'},
+    'form': {'accept-charset'},
+    'object': {'archive'},
+    'area': {'rel'},
+    'icon': {'sizes'},
+    'iframe': {'sandbox'},
+    'output': {'for'},
+}
+_NON_WHITESPACE = re.compile(r'\S+')
+
+
+class BlockBuilder(HTMLParser):
+    """
+    Builds view blocks from tokenizer events, without a document tree.
+
+    Produces the {"type", "contents", "attrs"} structure parse_element_to_dict gives for
+    a BeautifulSoup html.parser tree (same nesting of unclosed and stray tags), while
+    unwrapping tags outside allowed_tags and dropping comments and script/style content.
+    """
+
+    def __init__(self, allowed_tags: Optional[Collection[str]] = ALLOWED_BLOCK_TAGS):
+        super().__init__(convert_charrefs=True)
+        self.allowed_tags = allowed_tags
+        self.root = {"type": "[document]", "contents": [], "attrs": {}}
+        # Open tags as (name, block); block is None for unwrapped tags
+        self._open = []
+        self._containers = [self.root]
+        self._text = []
+        self._dropping = 0
+        self._closed_void_tags = []
+
+    def _flush_text(self):
+        if self._text:
+            text = "".join(self._text).strip()
+            if text and not self._dropping:
+                self._containers[-1]["contents"].append(text)
+            self._text = []
+
+    def handle_starttag(self, tag, attrs):
+        self._open_tag(tag, attrs)
+        if tag in VOID_TAGS:
+            self._close_tag(tag)
+            # A later </br> closes nothing
+            self._closed_void_tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self._open_tag(tag, attrs)
+        self._close_tag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self._closed_void_tags:
+            self._closed_void_tags.remove(tag)
+        else:
+            self._close_tag(tag)
+
+    def _open_tag(self, tag, attrs):
+        self._flush_text()
+        block = None
+        if tag in DROPPED_TAGS:
+            self._dropping += 1
+        elif self.allowed_tags is None or tag in self.allowed_tags:
+            block = {"type": tag, "contents": [], "attrs": self._attributes(tag, attrs)}
+            self._containers[-1]["contents"].append(block)
+            self._containers.append(block)
+        self._open.append((tag, block))
+
+    def _close_tag(self, tag):
+        self._flush_text()
+        # Like BeautifulSoup, close the most recent open tag of that name and the tags
+        # opened inside it; an end tag without an open tag is ignored
+        if not any(name == tag for name, _ in self._open):
+            return
+        while True:
+            name, block = self._open.pop()
+            if block is not None:
+                self._containers.pop()
+            elif name in DROPPED_TAGS:
+                self._dropping -= 1
+            if name == tag:
+                return
+
+    @staticmethod
+    def _attributes(tag, attrs) -> dict:
+        if not attrs:
+            return {}
+        # Valueless attributes become "", and a repeated attribute keeps its last value
+        result = {name: "" if value is None else value for name, value in attrs}
+        for name in LIST_ATTRIBUTES['*'].union(LIST_ATTRIBUTES.get(tag, ())).intersection(result):
+            result[name] = _NON_WHITESPACE.findall(result[name])
+        return result
+
+    def handle_data(self, data):
+        self._text.append(data)
+
+    # Comments, doctypes, CDATA and processing instructions end a text run but are not content
+    def handle_comment(self, data):
+        self._flush_text()
+
+    def handle_decl(self, decl):
+        self._flush_text()
+
+    def unknown_decl(self, data):
+        self._flush_text()
+
+    def handle_pi(self, data):
+        self._flush_text()
+
+    def close(self):
+        super().close()
+        self._flush_text()
+
+
+def build_blocks(html: str, allowed_tags: Optional[Collection[str]] = ALLOWED_BLOCK_TAGS) -> dict:
+    """
+    Converts an HTML string to its view block in a single pass over the tokenizer.
+
+    Args:
+        html: The HTML string
+        allowed_tags: Tags kept as blocks; others are unwrapped (None keeps every tag)
+
+    Returns:
+        The "[document]" block with the nested blocks and stripped text of the string
+    """
+    builder = BlockBuilder(allowed_tags)
+    builder.feed(html)
+    builder.close()
+    return builder.root
 
 def parse_element_to_dict(element):
     """
     Recursively parses a Beautiful Soup element and its children
     into a Python dictionary structure.
+
+    Reference for build_blocks, which produces the same structure without the tree.
     """
     if isinstance(element, NavigableString):
         # Ignore comments and empty strings
@@ -45,7 +199,7 @@ def parse_element_to_dict(element):
 
 def structure_json_html(obj):
     """
-    Recursively processes a JSON dictionary and calls parse_element_to_dict
+    Recursively processes a JSON dictionary and calls build_blocks
     for each value, replacing it with the result.
     """
     if not isinstance(obj, dict):
@@ -76,9 +230,7 @@ def structure_json_html(obj):
                 elif isinstance(item, str):
                     # Try to parse string items as HTML
                     try:
-                        soup = BeautifulSoup(item, 'html.parser')
-                        parsed_item = parse_element_to_dict(soup)
-                        processed_list.append(parsed_item)
+                        processed_list.append(build_blocks(item))
                     except (AttributeError, TypeError):
                         processed_list.append(item)
                 else:
@@ -87,10 +239,8 @@ def structure_json_html(obj):
         elif isinstance(value, str):
             # If the value is a string, try to parse it as HTML
             try:
-                # Parse the string as HTML using BeautifulSoup
-                soup = BeautifulSoup(value, 'html.parser')
-                parsed_value = parse_element_to_dict(soup)
-                result[key] = [parsed_value]
+                # Build the blocks straight from the tokenizer events
+                result[key] = [build_blocks(value)]
             except (AttributeError, TypeError):
                 # If parsing fails, keep the original string value
                 result[key] = [value]
@@ -1,12 +1,21 @@
+"""
+Summaries of the enhanced label sections. Every request goes to the model chosen by
+model_router.route_model for its input, through llm_call.chat_completion.
+"""
 import os
+import re
+import json
 import sys
 import asyncio
-from typing import Dict, Any
-from openai import AsyncOpenAI
+from functools import partial
+from typing import Dict, Any, List
 from dotenv import load_dotenv
-from rate_limiter import get_rate_limiter
-from scripts.rate_limiter import get_token_bucket_rate_limiter
+from pydantic import BaseModel, ValidationError
+from openai import LengthFinishReasonError
 from token_counter import count_tokens
+from llm_call import chat_completion
+from request_packer import get_request_packer
+from model_router import route_model, is_blank
 
 # Load environment variables from .env file in the parent directory (project root)
 load_dotenv('../.env')
@@ -16,21 +25,20 @@ project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, project_root)
 
 
-async def summarize_meta_description(q_item: Dict[str, Any]) -> str:
+async def summarize_meta_description(q_item: Dict[str, Any], pack: bool = True) -> str:
     """
-    Summarizes the description content from a q_item dictionary using GPT-4
+    Summarizes the description content from a q_item dictionary
     without hallucinating or adding information not present in the original text.
+    When request packing is enabled, short descriptions are sent together with other drugs'.
     
     Args:
         q_item: A dictionary containing item data with description content
+        pack: Whether the request may be packed with other drugs
         
     Returns:
         A summarized version of the description content
     """
 
-    # Initialize OpenAI client
-    client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-
     # Extract description content from q_item
     # Only grab the label.description value
     description_content = ""
@@ -40,9 +48,18 @@ async def summarize_meta_description(q_item: Dict[str, Any]) -> str:
             description_content = q_item['label']['description']
 
     # If no label.description found, return empty string
-    if not description_content:
+    if is_blank(description_content):
         return ""
 
+    packer = get_request_packer('metaDescription') if pack else None
+    if packer is not None:
+        tokens = count_tokens(description_content)
+        if packer.fits(tokens):
+            return await packer.submit(
+                q_item['setId'], description_content, tokens,
+                fallback=partial(summarize_meta_description, q_item, pack=False),
+            )
+
     # Create a prompt that emphasizes summarization without hallucination
     prompt = f"""
 Please summarize the following content accurately and concisely.
@@ -74,37 +91,31 @@ Strict Limitations:
     try:
         print(f'Summarizing {q_item["drugName"]}...')
         
-        # Get rate limiter for the model
-        model = "gpt-4o"
-        rate_limiter = get_rate_limiter(model)
+        model = route_model('summary:metaDescription', description_content)
         
-        # Use rate limiter before making the API call
-        async with rate_limiter:
-            # Use GPT-4 for the best summarization quality
-            response = await client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": "You are a precise summarization assistant. Your task is to create accurate, concise summaries that contain only information explicitly stated in the source text. Never add facts, details, or information that is not present in the original content. Focus on extracting and condensing the key information while maintaining factual accuracy."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.1,  # Low temperature for more deterministic output
-                max_tokens=500,  # Reasonable limit for summaries
-            )
+        messages = [
+            {"role": "system", "content": "You are a precise summarization assistant. Your task is to create accurate, concise summaries that contain only information explicitly stated in the source text. Never add facts, details, or information that is not present in the original content. Focus on extracting and condensing the key information while maintaining factual accuracy."},
+            {"role": "user", "content": prompt}
+        ]
+        temperature = 0.1  # Low temperature for more deterministic output
+        max_tokens = 500  # Reasonable limit for summaries
+
+        content = await chat_completion(model, messages, temperature, max_tokens)
 
         print(f'Summarized {q_item["drugName"]}...')
 
-        summary = response.choices[0].message.content.strip()
+        summary = content.strip()
         return summary
 
     except Exception as e:
         print(f"Error during summarization: {e}")
-        # Return a fallback summary or the original content
-        return f"Error in summarization: {str(e)}"
+        # Never store an error message as a summary; the item is retried on the next run
+        raise
 
 
 async def summarize_description(q_item: Dict[str, Any]) -> str:
     """
-    Summarizes the description content from a q_item dictionary using GPT-4
+    Summarizes the description content from a q_item dictionary
     without hallucinating or adding information not present in the original text.
 
     Args:
@@ -114,9 +125,6 @@ async def summarize_description(q_item: Dict[str, Any]) -> str:
         A summarized version of the description content
     """
 
-    # Initialize OpenAI client
-    client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-
     # Extract description content from q_item
     # Only grab the label.description value
     description_content = ""
@@ -126,7 +134,7 @@ async def summarize_description(q_item: Dict[str, Any]) -> str:
             description_content = q_item['label']['description']
 
     # If no label.description found, return empty string
-    if not description_content:
+    if is_blank(description_content):
         return ""
 
     # Create a prompt that emphasizes summarization without hallucination
@@ -159,37 +167,31 @@ Strict Limitations:
     try:
         print(f'Summarizing {q_item["drugName"]}...')
 
-        # Get rate limiter for the model
-        model = "gpt-4o"
-        rate_limiter = get_rate_limiter(model)
-
-        # Use rate limiter before making the API call
-        async with rate_limiter:
-            # Use GPT-4 for the best summarization quality
-            response = await client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": "You are a precise summarization assistant. Your task is to create accurate, concise summaries that contain only information explicitly stated in the source text. Never add facts, details, or information that is not present in the original content. Focus on extracting and condensing the key information while maintaining factual accuracy."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.1,  # Low temperature for more deterministic output
-                max_tokens=500,  # Reasonable limit for summaries
-            )
+        model = route_model('summary:description', description_content)
+
+        messages = [
+            {"role": "system", "content": "You are a precise summarization assistant. Your task is to create accurate, concise summaries that contain only information explicitly stated in the source text. Never add facts, details, or information that is not present in the original content. Focus on extracting and condensing the key information while maintaining factual accuracy."},
+            {"role": "user", "content": prompt}
+        ]
+        temperature = 0.1  # Low temperature for more deterministic output
+        max_tokens = 500  # Reasonable limit for summaries
+
+        content = await chat_completion(model, messages, temperature, max_tokens)
 
         print(f'Summarized {q_item["drugName"]}...')
 
-        summary = response.choices[0].message.content.strip()
+        summary = content.strip()
         return summary
 
     except Exception as e:
         print(f"Error during summarization: {e}")
-        # Return a fallback summary or the original content
-        return f"Error in summarization: {str(e)}"
+        # Never store an error message as a summary; the item is retried on the next run
+        raise
 
 
 async def summarize_use_and_conditions(q_item: Dict[str, Any]) -> str:
     """
-    Summarizes the description content from a q_item dictionary using GPT-4
+    Summarizes the description content from a q_item dictionary
     without hallucinating or adding information not present in the original text.
 
     Args:
@@ -199,14 +201,11 @@ async def summarize_use_and_conditions(q_item: Dict[str, Any]) -> str:
         A summarized version of the description content
     """
 
-    # Initialize OpenAI client
-    client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-
     content = q_item['label']['indicationsAndUsage']
     content += q_item['label']['dosageAndAdministration']
 
     # If no label.description found, return empty string
-    if not content:
+    if is_blank(content):
         return ""
 
     # Create a prompt that emphasizes summarization without hallucination
@@ -247,36 +246,30 @@ Clinical Guidelines:
     try:
         print(f'Summarizing Uses and Conditions {q_item["drugName"]}...')
         
-        # Get rate limiter for the model
-        model = "gpt-4o"
-        rate_limiter = get_rate_limiter(model)
+        model = route_model('summary:useAndConditions', content)
         
-        # Use rate limiter before making the API call
-        async with rate_limiter:
-            # Use GPT-4 for the best summarization quality
-            response = await client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": prompt},
-                ],
-                temperature=0.1,  # Low temperature for more deterministic output
-                max_tokens=500,
-            )
+        messages = [
+            {"role": "system", "content": prompt},
+        ]
+        temperature = 0.1  # Low temperature for more deterministic output
+        max_tokens = 500
+
+        content = await chat_completion(model, messages, temperature, max_tokens)
 
         print(f'Summarized Uses and Conditions {q_item["drugName"]}...')
 
-        summary = response.choices[0].message.content.strip()
+        summary = content.strip()
         return summary
 
     except Exception as e:
         print(f"Error during summarization: {e}")
-        # Return a fallback summary or the original content
-        return f"Error in summarization: {str(e)}"
+        # Never store an error message as a summary; the item is retried on the next run
+        raise
 
 
 async def summarize_contra_indications(q_item: Dict[str, Any]) -> str:
     """
-    Summarizes the description content from a q_item dictionary using GPT-4
+    Summarizes the description content from a q_item dictionary
     without hallucinating or adding information not present in the original text.
 
     Args:
@@ -286,14 +279,11 @@ async def summarize_contra_indications(q_item: Dict[str, Any]) -> str:
         A summarized version of the description content
     """
 
-    # Initialize OpenAI client
-    client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-
     content = q_item['label']['contraindications']
     # content += q_item['label']['warningsAndPrecautions']
 
     # If no label.description found, return empty string
-    if not content:
+    if is_blank(content):
         return ""
 
     # Create a prompt that emphasizes summarization without hallucination
@@ -337,35 +327,29 @@ Clinical Guidelines:
     try:
         print(f'Summarizing Uses and Conditions {q_item["drugName"]}...')
         
-        # Get rate limiter for the model
-        model = "gpt-4o"
-        rate_limiter = get_rate_limiter(model)
+        model = route_model('summary:contraIndications', content)
         
-        # Use rate limiter before making the API call
-        async with rate_limiter:
-            # Use GPT-4 for the best summarization quality
-            response = await client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": prompt},
-                ],
-                temperature=0.1,  # Low temperature for more deterministic output
-                max_tokens=500,
-            )
+        messages = [
+            {"role": "system", "content": prompt},
+        ]
+        temperature = 0.1  # Low temperature for more deterministic output
+        max_tokens = 500
+
+        content = await chat_completion(model, messages, temperature, max_tokens)
 
         print(f'Summarized Uses and Conditions {q_item["drugName"]}...')
 
-        summary = response.choices[0].message.content.strip()
+        summary = content.strip()
         return summary
 
     except Exception as e:
         print(f"Error during summarization: {e}")
-        # Return a fallback summary or the original content
-        return f"Error in summarization: {str(e)}"
+        # Never store an error message as a summary; the item is retried on the next run
+        raise
 
 async def summarize_warnings(q_item: Dict[str, Any]) -> str:
     """
-    Summarizes the description content from a q_item dictionary using GPT-4
+    Summarizes the description content from a q_item dictionary
     without hallucinating or adding information not present in the original text.
 
     Args:
@@ -375,13 +359,10 @@ async def summarize_warnings(q_item: Dict[str, Any]) -> str:
         A summarized version of the description content
     """
 
-    # Initialize OpenAI client
-    client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-
     content = q_item['label']['warningsAndPrecautions']
 
     # If no label.description found, return empty string
-    if not content:
+    if is_blank(content):
         return ""
 
     # Create a prompt that emphasizes summarization without hallucination
@@ -420,36 +401,30 @@ Clinical Guidelines:
     try:
         print(f'Summarizing Uses and Conditions {q_item["drugName"]}...')
         
-        # Get rate limiter for the model
-        model = "gpt-4o"
-        rate_limiter = get_rate_limiter(model)
+        model = route_model('summary:warnings', content)
         
-        # Use rate limiter before making the API call
-        async with rate_limiter:
-            # Use GPT-4 for the best summarization quality
-            response = await client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": prompt},
-                ],
-                temperature=0.1,  # Low temperature for more deterministic output
-                max_tokens=500,
-            )
+        messages = [
+            {"role": "system", "content": prompt},
+        ]
+        temperature = 0.1  # Low temperature for more deterministic output
+        max_tokens = 500
+
+        content = await chat_completion(model, messages, temperature, max_tokens)
 
         print(f'Summarized Uses and Conditions {q_item["drugName"]}...')
 
-        summary = response.choices[0].message.content.strip()
+        summary = content.strip()
         return summary
 
     except Exception as e:
         print(f"Error during summarization: {e}")
-        # Return a fallback summary or the original content
-        return f"Error in summarization: {str(e)}"
+        # Never store an error message as a summary; the item is retried on the next run
+        raise
 
 
 async def summarize_dosing(q_item: Dict[str, Any]) -> str:
     """
-    Summarizes the description content from a q_item dictionary using GPT-4
+    Summarizes the description content from a q_item dictionary
     without hallucinating or adding information not present in the original text.
 
     Args:
@@ -459,14 +434,11 @@ async def summarize_dosing(q_item: Dict[str, Any]) -> str:
         A summarized version of the description content
     """
 
-    # Initialize OpenAI client
-    client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-
     content = q_item['label']['dosageAndAdministration']
     content += q_item['label']['dosageFormsAndStrengths']
 
     # If no label.description found, return an empty string
-    if not content:
+    if is_blank(content):
         return ""
 
     # Create a prompt that emphasizes summarization without hallucination
@@ -507,39 +479,237 @@ Clinical Guidelines:
 
     try:
         print(f'Summarizing Dosing {q_item["drugName"]}...')
-        
-        # Count tokens in the prompt
-        prompt_tokens = count_tokens(prompt, "gpt-4o")
 
-        # Get rate limiter for the model
-        model = "gpt-4o"
-        # rate_limiter = get_rate_limiter(model)
-        rate_limiter = get_token_bucket_rate_limiter(model)
+        model = route_model('summary:dosing', content)
         
-        # Use rate limiter before making the API call
-        await rate_limiter.acquire(prompt_tokens)
-
-        # Use GPT-4 for the best summarization quality
-        response = await client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": prompt},
-            ],
-            temperature=0.1,  # Low temperature for more deterministic output
-            max_tokens=700,
-        )
+        messages = [
+            {"role": "system", "content": prompt},
+        ]
+        temperature = 0.1  # Low temperature for more deterministic output
+        max_tokens = 700
+
+        content = await chat_completion(model, messages, temperature, max_tokens)
 
         print(f'Summarized Dosing {q_item["drugName"]}...')
-        
-        # Count tokens in the response
-        summary = response.choices[0].message.content.strip()
-        response_tokens = count_tokens(summary, "gpt-4o")
-        print(f'Response tokens: {response_tokens}')
-        print(f'Total tokens used: {prompt_tokens + response_tokens}')
-        
-        return summary
+
+        return content.strip()
 
     except Exception as e:
         print(f"Error during summarization: {e}")
-        # Return a fallback summary or the original content
-        return f"Error in summarization: {str(e)}"
+        # Never store an error message as a summary; the item is retried on the next run
+        raise
+
+
+class DrugSummaries(BaseModel):
+    metaDescription: str
+    description: str
+    useAndConditions: str
+    contraIndications: str
+    warnings: str
+    dosing: str
+
+
+# Label sections each summary field is written from, as in the per-field functions
+SUMMARY_SOURCES = {
+    'metaDescription': ['description'],
+    'description': ['description'],
+    'useAndConditions': ['indicationsAndUsage', 'dosageAndAdministration'],
+    'contraIndications': ['contraindications'],
+    'warnings': ['warningsAndPrecautions'],
+    'dosing': ['dosageAndAdministration', 'dosageFormsAndStrengths'],
+}
+
+# Per-field functions used when the consolidated answer for a field is missing or invalid
+SUMMARY_FALLBACKS = {
+    'metaDescription': summarize_meta_description,
+    'description': summarize_description,
+    'useAndConditions': summarize_use_and_conditions,
+    'contraIndications': summarize_contra_indications,
+    'warnings': summarize_warnings,
+    'dosing': summarize_dosing,
+}
+
+SUMMARY_INSTRUCTIONS = {
+    'metaDescription': "A summary of the description of at most 160 characters.",
+    'description': "An accurate, concise summary of the description.",
+    'useAndConditions': "The therapeutic uses of the drug and the medical conditions it treats: approved indications, "
+                        "conditional or accelerated approvals and off-label uses only if explicitly stated, with "
+                        "treatment context (line of therapy, target population) when present. Exclude dosage and "
+                        "pharmacokinetics unless stated within an indication.",
+    'contraIndications': "The contraindications (conditions or factors where use of the drug is prohibited), preserving "
+                         "severity or condition-specific language. If none are explicitly stated, exactly "
+                         "<p>No contraindications</p>.",
+    'warnings': "The warnings and precautions (safety considerations, boxed warnings, monitoring needs, risk factors), "
+                "preserving severity or condition-specific language.",
+    'dosing': "The dosing information: adult and pediatric dosing, initial and maintenance doses, frequency, route and "
+              "duration, and dose adjustments for renal/hepatic impairment or other conditions. Preserve exact values "
+              "and qualifiers. Exclude indications and side effects unless directly tied to dosing.",
+}
+
+_ALLOWED_SUMMARY_TAGS = {'p', 'ul', 'li', 'h3'}
+
+
+def _summary_sources(q_item: Dict[str, Any], field: str) -> str:
+    label = q_item.get('label') or {}
+    return "".join(label.get(section) or "" for section in SUMMARY_SOURCES[field])
+
+
+def is_valid_summary(value: str) -> bool:
+    """Checks that a summary is non-empty HTML using only the allowed tags and no code fences."""
+    if not value or not value.strip() or '```' in value:
+        return False
+    tags = {tag.lower() for tag in re.findall(r'</?\s*([a-zA-Z0-9]+)', value)}
+    return tags <= _ALLOWED_SUMMARY_TAGS
+
+
+async def summarize_all(q_item: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Writes the six summaries of a drug with one structured-output call instead of six.
+
+    Every label section is sent once, with the formatting rules stated once, and the
+    response is validated against DrugSummaries. Fields that fail validation (or all of
+    them, when the response does not match the schema) are produced by the per-field
+    summarize_* functions instead.
+
+    Args:
+        q_item: A dictionary containing item data with the enhanced label sections
+
+    Returns:
+        A dict with the metaDescription, description, useAndConditions, contraIndications,
+        warnings and dosing summaries
+    """
+
+    # Fields without source content are empty, as in the per-field functions
+    fields = [field for field in SUMMARY_FALLBACKS if not is_blank(_summary_sources(q_item, field))]
+    summaries = {field: "" for field in SUMMARY_FALLBACKS}
+    if not fields:
+        return summaries
+
+    sections = []
+    for section in dict.fromkeys(name for field in fields for name in SUMMARY_SOURCES[field]):
+        content = q_item['label'].get(section)
+        if content:
+            sections.append(f"## BEGIN {section}:\n{content}\n## END {section}")
+    source_content = "\n\n".join(sections)
+
+    instructions = "\n".join(
+        f"- {field} (from {', '.join(SUMMARY_SOURCES[field])}): {SUMMARY_INSTRUCTIONS[field]}" for field in fields
+    )
+    prompt = f"""
+You are a clinical documentation specialist. Using only the drug label sections below, write the following summaries and return them as the fields of a JSON object. Return an empty string for any field not listed.
+
+{instructions}
+
+IMPORTANT:
+- Only include information explicitly stated in the source sections. Do not add, infer or reword facts, and do not use external sources or general medical knowledge.
+
+Output Formatting Rules (every field):
+- Raw HTML using only <p>, <ul>, <li> and <h3> (for section labels). Use <ul>/<li> for lists.
+- No triple backticks, code block annotations or explanatory text outside the HTML.
+- No other tags (e.g. <b>, <strong>, <em>, <span>, <div>, <br>, <sup>, <sub>, <table>, <ol>), attributes, classes, styles or HTML entities.
+- Do not place <p> tags inside <li> elements, or header tags inside <p> elements.
+
+{source_content}
+"""
+
+    try:
+        print(f'Summarizing all fields of {q_item["drugName"]}...')
+
+        model = route_model('summary:all', source_content)
+
+        messages = [
+            {"role": "system", "content": prompt},
+        ]
+        temperature = 0.1  # Low temperature for more deterministic output
+        max_tokens = 3200  # Sum of the per-field limits
+
+        content = await chat_completion(model, messages, temperature, max_tokens, response_format=DrugSummaries)
+        result = DrugSummaries.model_validate_json(content).model_dump()
+        invalid = [field for field in fields if not is_valid_summary(result[field])]
+        for field in fields:
+            if field not in invalid:
+                summaries[field] = result[field].strip()
+
+    except (ValidationError, ValueError, LengthFinishReasonError) as e:
+        print(f"Consolidated summary of {q_item['drugName']} did not match the schema: {e}")
+        invalid = fields
+
+    if invalid:
+        print(f'Falling back to per-field summaries for {q_item["drugName"]}: {invalid}')
+        fallbacks = await asyncio.gather(*[SUMMARY_FALLBACKS[field](q_item) for field in invalid])
+        summaries.update(zip(invalid, fallbacks))
+
+    print(f'Summarized all fields of {q_item["drugName"]}...')
+
+    return summaries
+
+
+class DrugMetaDescription(BaseModel):
+    setId: str
+    metaDescription: str
+
+
+class PackedMetaDescriptions(BaseModel):
+    drugs: List[DrugMetaDescription]
+
+
+def get_packed_meta_descriptions_prompt(descriptions: Dict[str, str]) -> str:
+    drugs = "\n\n".join(
+        f"## BEGIN setId {set_id}:\n{content}\n### END setId {set_id}" for set_id, content in descriptions.items()
+    )
+    return f"""
+Please summarize each of the following drug descriptions accurately and concisely. Return a JSON object with a "drugs" array holding one entry per description: its setId exactly as given and its metaDescription.
+
+IMPORTANT:
+- Only include information explicitly stated in that drug's original text.
+- Do NOT add any facts, details, or information not present in the source material.
+- Do NOT infer, interpret, or reword content beyond what is directly stated.
+- Each summary must be a maximum of 160 characters.
+
+Output Formatting Rules (each metaDescription):
+- Return only raw HTML using the allowed tags: <p>, <ul>, and <li>.
+- Do not wrap the output in triple backticks or any code block annotations.
+- Use <p> if needed to wrap the entire summary. Do not use any other tags.
+- Do not use HTML entities (e.g., &nbsp;, &copy;). Use plain characters only.
+- Do not include tag attributes, classes, or styles.
+
+## Original content:
+{drugs}
+"""
+
+
+async def summarize_packed_meta_descriptions(descriptions: Dict[str, str]) -> Dict[str, str]:
+    """
+    Writes the meta descriptions of several drugs with short descriptions in one structured-output call.
+
+    Entries are matched back by setId and validated one by one, so a malformed or
+    missing entry only sends that drug to its own request.
+
+    Args:
+        descriptions: Maps each setId to its description content
+
+    Returns:
+        A dict mapping the setIds that were answered to their meta description
+    """
+    prompt = get_packed_meta_descriptions_prompt(descriptions)
+    model = route_model('summary:metaDescription:packed', "".join(descriptions.values()))
+
+    messages = [
+        {"role": "system", "content": prompt},
+    ]
+    temperature = 0.1  # Low temperature for more deterministic output
+    max_tokens = min(16000, 200 * len(descriptions))
+
+    content = await chat_completion(model, messages, temperature, max_tokens, response_format=PackedMetaDescriptions)
+
+    results = {}
+    entries = json.loads(content).get("drugs")
+    for entry in entries if isinstance(entries, list) else []:
+        try:
+            drug = DrugMetaDescription.model_validate(entry)
+        except ValidationError:
+            continue
+        set_id = drug.setId.strip()
+        if set_id in descriptions and set_id not in results and is_valid_summary(drug.metaDescription):
+            results[set_id] = drug.metaDescription.strip()
+    return results
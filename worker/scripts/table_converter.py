@@ -0,0 +1,285 @@
+import re
+import json
+import argparse
+from collections import Counter
+from typing import List, Optional, Tuple
+
+from bs4 import BeautifulSoup, NavigableString, Tag
+
+# Tags enhance_content may return (tables are spelled out as text)
+ALLOWED_TAGS = frozenset({'p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'ul', 'ol', 'li'})
+# Formatting and layout tags replaced by their text
+UNWRAPPED_TAGS = frozenset({
+    'span', 'div', 'section', 'article', 'aside', 'a', 'b', 'strong', 'i', 'em', 'u', 'sub',
+    'small', 'font', 'mark', 'code',
+})
+# Tags removed with their content (footnote markers and scripts)
+DROPPED_TAGS = frozenset({'sup', 'script', 'style'})
+TABLE_TAGS = frozenset({'table', 'caption', 'colgroup', 'col', 'thead', 'tbody', 'tfoot', 'tr', 'td', 'th'})
+# Block content a table cell may not hold to be spelled out on one line
+_CELL_BLOCK_TAGS = ('ul', 'ol', 'li', 'table', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6')
+
+# Sections without tables and with more text than this are free-form prose the LLM rewrites
+DEFAULT_MAX_PROSE_CHARS = 1500
+
+_WHITESPACE_RUN = re.compile(r'\s+')
+_TAG = re.compile(r'<[^>]*>')
+_DIGIT = re.compile(r'\d')
+
+# Active converter when process_data runs with --local-tables
+_local_converter: Optional["LocalConverter"] = None
+
+
+class ComplexSection(Exception):
+    """The section needs the LLM; the message says why (e.g. 'rowspan/colspan')."""
+
+
+def _text(element: Tag) -> str:
+    return _WHITESPACE_RUN.sub(' ', element.get_text(' ')).strip()
+
+
+def _span(cell: Tag, name: str) -> int:
+    try:
+        return int(cell.get(name, 1))
+    except ValueError:
+        raise ComplexSection(name)
+
+
+def _table_rows(table: Tag) -> Tuple[List[List[Tag]], List[List[Tag]], Optional[List[Tag]]]:
+    """
+    Splits a table into body rows (thead and tbody, in order), footer rows and the header.
+
+    Raises:
+        ComplexSection: If the table is not a simple rectangular table with a header row
+    """
+    if table.find('table'):
+        raise ComplexSection('nested table')
+
+    body, footer, header = [], [], None
+    for row in table.find_all('tr'):
+        cells = row.find_all(['td', 'th'], recursive=False)
+        if not cells:
+            continue
+        if any(_span(cell, 'rowspan') > 1 for cell in cells):
+            raise ComplexSection('rowspan/colspan')
+        if any(cell.find(_CELL_BLOCK_TAGS) for cell in cells):
+            raise ComplexSection('block content in cell')
+        section = row.find_parent(['thead', 'tbody', 'tfoot', 'table'])
+        (footer if section.name == 'tfoot' else body).append(cells)
+        if section.name == 'thead':
+            if header is not None:
+                raise ComplexSection('multi-row header')
+            header = cells
+
+    rows = [cells for cells in body + footer if len(cells) > 1 or _span(cells[0], 'colspan') == 1]
+    width = max((len(cells) for cells in rows), default=0)
+    for cells in body + footer:
+        # Rows spanning the whole table (titles, group labels, footnotes) become paragraphs
+        if len(cells) == 1 and _span(cells[0], 'colspan') >= width:
+            continue
+        if any(_span(cell, 'colspan') > 1 for cell in cells):
+            raise ComplexSection('rowspan/colspan')
+        if len(cells) != width:
+            raise ComplexSection('irregular rows')
+    if width < 2:
+        raise ComplexSection('single-column table')
+
+    data = [cells for cells in body if len(cells) == width]
+    if header is None and data:
+        first = data[0]
+        if all(cell.name == 'th' for cell in first):
+            header = first
+        # Without <thead>/<th>, the first row is the header when its labels hold no values
+        # (no digits, only the row-label column may be empty) and the rows below do
+        elif all(_text(cell) and not _DIGIT.search(_text(cell)) for cell in first[1:]) \
+                and not _DIGIT.search(_text(first[0])) \
+                and any(_DIGIT.search(_text(cell)) for cells in data[1:] for cell in cells):
+            header = first
+    if header is None:
+        raise ComplexSection('no header row')
+    return body, footer, header
+
+
+def _spell_out_table(soup: BeautifulSoup, table: Tag):
+    """Replaces a simple table with its caption, one list item per row and its footnotes."""
+    body, footer, header = _table_rows(table)
+    labels = [_text(cell) for cell in header]
+
+    blocks = []
+    caption = table.find('caption')
+    if caption is not None and _text(caption):
+        blocks.append(('p', _text(caption)))
+    for cells in body + footer:
+        if cells is header:
+            continue
+        values = [_text(cell) for cell in cells]
+        if len(cells) != len(labels):
+            if values[0]:
+                blocks.append(('p', values[0]))
+            continue
+        pairs = [f"{label}: {value}" if label else value
+                 for label, value in zip(labels, values) if value]
+        # A blank first heading marks a row-label column: "Mild – eGFR: ...; Recommendation: ..."
+        if not labels[0] and values[0] and len(pairs) > 1:
+            pairs = [f"{pairs[0]} – {pairs[1]}", *pairs[2:]]
+        if pairs:
+            blocks.append(('li', "; ".join(pairs)))
+
+    fragment = []
+    for name, text in blocks:
+        if name == 'li':
+            if not fragment or fragment[-1].name != 'ul':
+                fragment.append(soup.new_tag('ul'))
+            item = soup.new_tag('li')
+            item.string = text
+            fragment[-1].append(item)
+        else:
+            paragraph = soup.new_tag('p')
+            paragraph.string = text
+            fragment.append(paragraph)
+
+    for element in fragment:
+        table.insert_before(element)
+    table.decompose()
+
+
+def convert_section(html: str) -> str:
+    """
+    Applies the mechanical part of the enhance_content prompt without the LLM.
+
+    Simple rectangular tables are spelled out with their column labels, <sup> is removed
+    with its content and formatting tags are replaced by their text, so only the allowed
+    tags remain. Heading levels are left to enhance_content's demotion pass.
+
+    Args:
+        html: A cleaned label section (or part of one)
+
+    Returns:
+        The converted HTML
+
+    Raises:
+        ComplexSection: If the section has complex tables (rowspan/colspan, nested tables,
+            no header row) or tags other than the allowed, table and formatting ones
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    for element in soup.find_all(DROPPED_TAGS):
+        element.decompose()
+
+    for element in soup.find_all(True):
+        if element.name not in ALLOWED_TAGS | UNWRAPPED_TAGS | TABLE_TAGS:
+            raise ComplexSection(f"<{element.name}>")
+
+    for table in soup.find_all('table'):
+        # Tables were checked for nesting, so each one is still in the tree here
+        _spell_out_table(soup, table)
+
+    for element in soup.find_all(UNWRAPPED_TAGS):
+        element.unwrap()
+    for element in soup.find_all(TABLE_TAGS):
+        raise ComplexSection(f"<{element.name}> outside a table")
+
+    # Loose text between blocks becomes a paragraph; smooth() first joins the strings
+    # left by unwrapped inline tags, so one sentence stays one paragraph
+    soup.smooth()
+    for child in list(soup.contents):
+        if isinstance(child, NavigableString) and child.strip():
+            paragraph = soup.new_tag('p')
+            paragraph.string = child.strip()
+            child.replace_with(paragraph)
+
+    return str(soup)
+
+
+class LocalConverter:
+    """
+    Converts the simple enhance_content inputs locally and counts what goes to the LLM.
+
+    Each input (a section, or one part of a split section) is either converted by
+    convert_section or left to the LLM, with the reason logged and counted for the report.
+    Inputs without tables holding more than max_prose_chars of text are free-form prose
+    and always go to the LLM.
+    """
+
+    def __init__(self, max_prose_chars: int = DEFAULT_MAX_PROSE_CHARS):
+        self.max_prose_chars = max_prose_chars
+        self.decisions = Counter()
+
+    def convert(self, html: str) -> Optional[str]:
+        """
+        Returns:
+            The converted HTML, or None when the input has to be enhanced by the LLM
+        """
+        tables = html.count('<table')
+        if not tables and len(_WHITESPACE_RUN.sub(' ', _TAG.sub(' ', html)).strip()) > self.max_prose_chars:
+            print("[local] enhance: 0 tables, long prose -> llm")
+            self.decisions["llm (long prose)"] += 1
+            return None
+        try:
+            converted = convert_section(html)
+        except ComplexSection as e:
+            print(f"[local] enhance: {tables} tables, {e} -> llm")
+            self.decisions[f"llm ({e})"] += 1
+            return None
+        print(f"[local] enhance: {tables} tables -> local")
+        self.decisions["local (tables)" if tables else "local (no tables)"] += 1
+        return converted
+
+    def report(self) -> str:
+        total = sum(self.decisions.values())
+        if not total:
+            return "Local conversion: no inputs"
+        local = sum(count for decision, count in self.decisions.items() if decision.startswith("local"))
+        return f"Local conversion: {local}/{total} enhance inputs ({100 * local / total:.0f}%) converted locally; " + \
+            ", ".join(f"{decision}: {count}" for decision, count in sorted(self.decisions.items()))
+
+
+def enable_local_conversion(max_prose_chars: int = DEFAULT_MAX_PROSE_CHARS) -> LocalConverter:
+    """Converts simple enhance_content inputs locally until the process exits."""
+    global _local_converter
+
+    _local_converter = LocalConverter(max_prose_chars)
+    return _local_converter
+
+
+def convert_locally(html: str) -> Optional[str]:
+    """Returns the local conversion of an enhance input, or None when it goes to the LLM (or conversion is off)."""
+    if _local_converter is None:
+        return None
+    return _local_converter.convert(html)
+
+
+def local_conversion_config() -> Optional[dict]:
+    """Settings of the active converter, for stage fingerprints; None when conversion is off."""
+    if _local_converter is None:
+        return None
+    return {'max_prose_chars': _local_converter.max_prose_chars}
+
+
+def local_conversion_report() -> str:
+    return _local_converter.report() if _local_converter is not None else ""
+
+
+if __name__ == "__main__":
+    from html_normalizer import clean_html
+
+    parser = argparse.ArgumentParser(description="Report which enhanced label sections the local converter handles.")
+    parser.add_argument("--input", default="./data/Labels.json", help="Path of the labels JSON array")
+    parser.add_argument("--show", help="Print the local conversion of this section of every label (e.g. dosageFormsAndStrengths)")
+    args = parser.parse_args()
+
+    # Sections process_data enhances (ENHANCED_SECTIONS)
+    sections = ['description', 'indicationsAndUsage', 'dosageAndAdministration', 'dosageFormsAndStrengths',
+                'contraindications', 'warningsAndPrecautions', 'adverseReactions']
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        items = json.load(f)
+
+    converter = enable_local_conversion()
+    for item in items:
+        for name in sections:
+            value = item.get("label", {}).get(name)
+            if isinstance(value, str) and value.strip():
+                converted = converter.convert(clean_html(value))
+                if converted is not None and name == args.show:
+                    print(f"{item.get('drugName')} {name}:\n{converted}\n")
+    print(converter.report())
@@ -1,21 +1,64 @@
+from functools import lru_cache
+from typing import Iterable
+
 import tiktoken
 
+# Fixed overhead of the chat format: per message, and for priming the assistant reply
+_TOKENS_PER_MESSAGE = 3
+_TOKENS_PER_REPLY = 3
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str = "gpt-4o") -> tiktoken.Encoding:
+    """
+    Returns the tiktoken encoding of a model, loaded once per model.
+
+    Args:
+        model: The model name (default: gpt-4o)
+
+    Returns:
+        The encoding, falling back to o200k_base for unknown models
+    """
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
 
 def count_tokens(text: str, model: str = "gpt-4o") -> int:
     """
     Count tokens in text using tiktoken (offline tokenizer)
-    
+
     Args:
         text: The text to count tokens for
         model: The model name to use for tokenization (default: gpt-4o)
-        
+
     Returns:
         Number of tokens in the text
     """
     try:
-        encoding = tiktoken.encoding_for_model(model)
+        encoding = get_encoding(model)
         return len(encoding.encode(text))
     except Exception as e:
         print(f"Error counting tokens: {e}")
         # Fallback: rough estimation (1 token ≈ 4 characters for English text)
-        return len(text) // 4 
\ No newline at end of file
+        return len(text) // 4
+
+
+def count_message_tokens(messages: Iterable[dict], model: str = "gpt-4o") -> int:
+    """
+    Count the prompt tokens of a list of chat messages, including the chat format overhead.
+
+    Args:
+        messages: Chat messages with 'role' and 'content'
+        model: The model name to use for tokenization (default: gpt-4o)
+
+    Returns:
+        Estimated number of prompt tokens
+    """
+    total = _TOKENS_PER_REPLY
+    for message in messages:
+        total += _TOKENS_PER_MESSAGE
+        total += count_tokens(message.get("role", ""), model)
+        total += count_tokens(message.get("content") or "", model)
+    return total
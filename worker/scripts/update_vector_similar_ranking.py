@@ -1,7 +1,7 @@
 import os
 import json
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -76,4 +76,51 @@ def update_vector_similar_ranking(medication_id: str, similar_items: list):
         if cursor:
             cursor.close()
         if conn:
-            conn.close() 
\ No newline at end of file
+            conn.close()
+
+def bulk_update_vector_similar_ranking(rankings: dict):
+    """
+    Update the vector_similar_ranking field of many medications with a single UPDATE ... FROM (VALUES ...) statement.
+
+    Args:
+        rankings: Dict mapping medication IDs to lists of tuples containing (drug_name, similarity_score)
+
+    Returns:
+        The number of medications updated
+    """
+    if not rankings:
+        return 0
+
+    rows = [
+        (medication_id, json.dumps({slug: int(score) for slug, score in similar_items}))
+        for medication_id, similar_items in rankings.items()
+    ]
+
+    db_params = {
+        'host': os.getenv('POSTGRES_HOST', 'localhost'),
+        'port': os.getenv('POSTGRES_PORT', '5432'),
+        'database': os.getenv('POSTGRES_DB', 'drugs_db'),
+        'user': os.getenv('POSTGRES_USER', 'postgres'),
+        'password': os.getenv('POSTGRES_PASSWORD', 'postgres')
+    }
+
+    conn = psycopg2.connect(**db_params)
+    try:
+        with conn:
+            with conn.cursor() as cursor:
+                execute_values(
+                    cursor,
+                    """
+                    UPDATE drugs AS d
+                    SET vector_similar_ranking = v.ranking::jsonb, updated_at = NOW()
+                    FROM (VALUES %s) AS v (id, ranking)
+                    WHERE d.id = v.id;
+                    """,
+                    rows,
+                    page_size=len(rows),
+                )
+                updated = cursor.rowcount
+        print(f"Updated vector_similar_ranking for {updated} of {len(rows)} medications")
+        return updated
+    finally:
+        conn.close()
@@ -7,31 +7,30 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv('../.env')
 
-def upsert_items_to_postgres(q_items, structured_items_json_array, view_blocks_array):
-    """
-    Upsert items to PostgreSQL database.
-    
-    Args:
-        q_items: List of items prepared for Qdrant/vector database
-        structured_items_json_array: List of structured JSON items
-        view_blocks_array: List of view_blocks for each item
-    """
+def get_postgres_params() -> dict:
     # PostgreSQL connection parameters with default values
-    db_params = {
+    return {
         'host': os.getenv('POSTGRES_HOST', 'localhost'),
         'port': os.getenv('POSTGRES_PORT', '5432'),
         'database': os.getenv('POSTGRES_DB', 'drugs_db'),
         'user': os.getenv('POSTGRES_USER', 'postgres'),
         'password': os.getenv('POSTGRES_PASSWORD', 'postgres')
     }
-    
-    # Create PostgreSQL connection
-    conn = None
-    cursor = None
+
+
+def upsert_items_with_connection(conn, q_items, structured_items_json_array, view_blocks_array):
+    """
+    Upserts items in a single transaction on an open connection.
+    Errors are raised after rolling back, so callers can retry the batch.
+
+    Args:
+        conn: Open psycopg2 connection
+        q_items: List of items prepared for Qdrant/vector database
+        structured_items_json_array: List of structured JSON items
+        view_blocks_array: List of view_blocks for each item
+    """
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
     try:
-        conn = psycopg2.connect(**db_params)
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
         # Start transaction
         conn.autocommit = False
         
@@ -324,19 +323,34 @@ def upsert_items_to_postgres(q_items, structured_items_json_array, view_blocks_a
         # Commit the entire transaction
         conn.commit()
         print(f"Successfully inserted/updated {len(structured_items_json_array)} drug records")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def upsert_items_to_postgres(q_items, structured_items_json_array, view_blocks_array):
+    """
+    Upsert items to PostgreSQL database.
+    
+    Args:
+        q_items: List of items prepared for Qdrant/vector database
+        structured_items_json_array: List of structured JSON items
+        view_blocks_array: List of view_blocks for each item
+    """
+    # Create PostgreSQL connection
+    conn = None
+    try:
+        conn = psycopg2.connect(**get_postgres_params())
+        upsert_items_with_connection(conn, q_items, structured_items_json_array, view_blocks_array)
 
     except psycopg2.Error as e:
         print(f"Error connecting to PostgreSQL: {e}")
-        if conn:
-            conn.rollback()
         return
     except Exception as e:
         print(f"Unexpected error: {e}")
-        if conn:
-            conn.rollback()
         return
     finally:
-        if cursor:
-            cursor.close()
         if conn:
             conn.close()
\ No newline at end of file
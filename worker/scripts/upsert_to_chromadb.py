@@ -54,13 +54,16 @@ def spacy_chunk_text(text: str, max_tokens: int = 300, overlap_tokens: int = 30)
 
     return chunks
 
-def upsert_q_items_to_chromadb(q_items: list[dict], collection_name: str = "drug_data", similar_collection_name: str = "drug_similar_data"):
+def create_chroma_collections(collection_name: str = "drug_data", similar_collection_name: str = "drug_similar_data"):
     """
-    Upsert q_items to ChromaDB with embeddings for each field separately.
-    
+    Connects to ChromaDB and returns the drug and similarity collections.
+
     Args:
-        q_items: List of processed items to upsert
         collection_name: Name of the ChromaDB collection
+        similar_collection_name: Name of the collection used for similarity ranking
+
+    Returns:
+        A (collection, collection_similar) tuple sharing one client and embedding model
     """
 
     # Initialize ChromaDB client
@@ -92,6 +95,208 @@ def upsert_q_items_to_chromadb(q_items: list[dict], collection_name: str = "drug
     )
 
     print(f"Collection ready: {collection_name}")
+
+    return collection, collection_similar
+
+
+def build_chroma_records(item: dict):
+    """
+    Builds the chunks and metadata stored in ChromaDB for a q_item.
+
+    Returns:
+        A (chunks, chunks_similar, metadata) tuple
+    """
+    # Concatenate relevant fields into one variable
+    # Add tag-based sentences to help with chunking and similarities
+    tag_sentences = []
+    drug_name = item.get('drugName', '')
+    
+    # Helper function to safely get tags
+    def get_safe_tags(tag_field):
+        if tag_field is None:
+            return []
+        tags_data = tag_field.get('tags') if isinstance(tag_field, dict) else None
+        return tags_data if tags_data is not None else []
+    
+    # Indications tags
+    indications_tags = get_safe_tags(item.get('tags_indications'))
+    for tag in indications_tags:
+        tag_sentences.append(f"{drug_name} is indicated for {tag}")
+        tag_sentences.append(f"{drug_name} is prescribed for {tag}")
+        tag_sentences.append(f"{drug_name} is used to treat {tag}")
+        tag_sentences.append(f"{drug_name} is effective for {tag}")
+        tag_sentences.append(f"{drug_name} is recommended for {tag}")
+    
+    # Conditions tags
+    conditions_tags = get_safe_tags(item.get('tags_condition'))
+    for tag in conditions_tags:
+        tag_sentences.append(f"{drug_name} is used to treat {tag}")
+        tag_sentences.append(f"{drug_name} is indicated for {tag}")
+        tag_sentences.append(f"{drug_name} is prescribed for {tag}")
+        tag_sentences.append(f"{drug_name} is effective against {tag}")
+        tag_sentences.append(f"{drug_name} is recommended for {tag}")
+        tag_sentences.append(f"{drug_name} helps manage {tag}")
+    
+    # Substances tags
+    substances_tags = get_safe_tags(item.get('tags_substance'))
+    for tag in substances_tags:
+        tag_sentences.append(f"{drug_name} contains {tag}")
+        tag_sentences.append(f"{drug_name} includes {tag}")
+        tag_sentences.append(f"{drug_name} is composed of {tag}")
+        tag_sentences.append(f"{drug_name} has {tag} as an ingredient")
+        tag_sentences.append(f"{drug_name} contains the substance {tag}")
+    
+    # Strengths/Concentrations tags
+    strengths_tags = get_safe_tags(item.get('tags_strengths_concentrations'))
+    for tag in strengths_tags:
+        tag_sentences.append(f"{drug_name} is available in {tag}")
+        tag_sentences.append(f"{drug_name} comes in {tag}")
+        tag_sentences.append(f"{drug_name} is offered in {tag}")
+        tag_sentences.append(f"{drug_name} is manufactured in {tag}")
+        tag_sentences.append(f"{drug_name} is available as {tag}")
+        tag_sentences.append(f"{drug_name} has strength {tag}")
+    
+    # Populations tags
+    populations_tags = get_safe_tags(item.get('tags_population'))
+    for tag in populations_tags:
+        tag_sentences.append(f"{drug_name} is used in {tag}")
+        tag_sentences.append(f"{drug_name} is prescribed for {tag}")
+        tag_sentences.append(f"{drug_name} is indicated for {tag}")
+        tag_sentences.append(f"{drug_name} is suitable for {tag}")
+        tag_sentences.append(f"{drug_name} is recommended for {tag}")
+        tag_sentences.append(f"{drug_name} is approved for {tag}")
+    
+    # Contraindications tags
+    # contraindications_tags = get_safe_tags(item.get('tags_contraindications'))
+    # for tag in contraindications_tags:
+    #     tag_sentences.append(f"{drug_name} is contraindicated in {tag}")
+    #     tag_sentences.append(f"{drug_name} should not be used in {tag}")
+    #     tag_sentences.append(f"{drug_name} is not recommended for {tag}")
+    #     tag_sentences.append(f"{drug_name} is not suitable for {tag}")
+    #     tag_sentences.append(f"{drug_name} should be avoided in {tag}")
+    #     tag_sentences.append(f"{drug_name} is not indicated for {tag}")
+    
+    concatenated_text = " ".join([
+        str(item['label'].get('indicationsAndUsage', '')).strip(),
+        str(item['label'].get('dosageAndAdministration', '')).strip(),
+        str(item['label'].get('dosageFormsAndStrengths', '')).strip(),
+        str(item['label'].get('warningsAndPrecautions', '')).strip(),
+        str(item['label'].get('adverseReactions', '')).strip(),
+        str(item['label'].get('clinicalPharmacology', '')).strip(),
+        str(item['label'].get('clinicalStudies', '')).strip(),
+        str(item['label'].get('howSupplied', '')).strip(),
+        str(item['label'].get('useInSpecificPopulations', '')).strip(),
+        str(item['label'].get('description', '')).strip(),
+        str(item['label'].get('nonclinicalToxicology', '')).strip(),
+        str(item['label'].get('instructionsForUse', '')).strip(),
+        str(item['label'].get('mechanismOfAction', '')).strip(),
+        str(item['label'].get('contraindications', '')).strip(),
+        str(item['label'].get('boxedWarning', '')).strip(),
+        str(item.get('useAndConditions', '')).strip(),
+        str(item.get('contraIndications', '')).strip(),
+        str(item.get('metaDescription', '')).strip(),
+        str(item.get('dosing', '')).strip(),
+        str(item.get('warnings', '')).strip(),
+        str(item['label'].get('highlights', {}).get('dosageAndAdministration', '')).strip(),
+        " ".join(tag_sentences)
+    ])
+
+    
+
+    similar_check_text = " ".join([
+        str(item['label'].get('indicationsAndUsage', '')).strip(),
+        str(item['label'].get('dosageAndAdministration', '')).strip(),
+        str(item['label'].get('mechanismOfAction', '')).strip(),
+    ])
+
+    # Prepare metadata
+    metadata = {}
+    if item.get('setId') is not None:
+        metadata["item_id"] = item.get('setId')
+        metadata["setId"] = item.get('setId') # TODO: use this over 'item_id'.
+        metadata['name'] = item.get('drugName')
+        metadata['drugName'] = item.get('drugName') # TODO: use this over 'name'.
+        metadata['slug'] = item.get('slug')
+    for key in [
+        # "indicationsAndUsage",
+        # "dosageAndAdministration",
+        # "dosageFormsAndStrengths",
+        # "warningsAndPrecautions",
+        # "adverseReactions",
+        # "clinicalPharmacology",
+        # "clinicalStudies",
+        # "howSupplied",
+        # "useInSpecificPopulations",
+        # "description",
+        # "nonclinicalToxicology",
+        # "instructionsForUse",
+        # "mechanismOfAction",
+        # "contraindications",
+        # "boxedWarning"
+    ]:
+        value = item['label'].get(key, None)
+        if value is not None:
+            metadata[key] = value
+    
+    # Chunk the concatenated text
+    # chunks = chunk_text(concatenated_text, MAX_TOKENS)
+    chunks = spacy_chunk_text(concatenated_text, max_tokens=MAX_TOKENS, overlap_tokens=30)
+    chunks_similar = spacy_chunk_text(similar_check_text, max_tokens=MAX_TOKENS, overlap_tokens=30)
+
+    return chunks, chunks_similar, metadata
+
+
+def upsert_batch_to_chromadb(collection, collection_similar, q_items: list[dict]) -> int:
+    """
+    Upserts a micro-batch of q_items into both collections with one request each.
+
+    Args:
+        collection: Drug data collection
+        collection_similar: Similarity collection
+        q_items: Items to upsert
+
+    Returns:
+        The number of upserted chunks
+    """
+    ids = []
+    ids_similar = []
+    documents = []
+    documents_similar = []
+    metadatas = []
+    metadatas_similar = []
+
+    for item in q_items:
+        chunks, chunks_similar, metadata = build_chroma_records(item)
+
+        # Add each chunk with the same id and metadata
+        for idx, chunk in enumerate(chunks):
+            ids.append(f"{item['setId']}:chunk:{idx}")
+            documents.append(chunk)
+            metadatas.append(metadata)
+
+        for idx, chunk in enumerate(chunks_similar):
+            ids_similar.append(f"{item['setId']}:chunk:{idx}")
+            documents_similar.append(chunk)
+            metadatas_similar.append(metadata)
+
+    if ids:
+        collection.upsert(ids=ids, documents=documents, metadatas=metadatas)
+    if ids_similar:
+        collection_similar.upsert(ids=ids_similar, documents=documents_similar, metadatas=metadatas_similar)
+
+    return len(ids)
+
+
+def upsert_q_items_to_chromadb(q_items: list[dict], collection_name: str = "drug_data", similar_collection_name: str = "drug_similar_data"):
+    """
+    Upsert q_items to ChromaDB with embeddings for each field separately.
+    
+    Args:
+        q_items: List of processed items to upsert
+        collection_name: Name of the ChromaDB collection
+    """
+
+    collection, collection_similar = create_chroma_collections(collection_name, similar_collection_name)
     
     # Prepare data for ChromaDB
     total_chunks = 0
@@ -103,142 +308,7 @@ def upsert_q_items_to_chromadb(q_items: list[dict], collection_name: str = "drug
     metadatas_similar = []
     
     for item in q_items:
-        # Concatenate relevant fields into one variable
-        # Add tag-based sentences to help with chunking and similarities
-        tag_sentences = []
-        drug_name = item.get('drugName', '')
-        
-        # Helper function to safely get tags
-        def get_safe_tags(tag_field):
-            if tag_field is None:
-                return []
-            tags_data = tag_field.get('tags') if isinstance(tag_field, dict) else None
-            return tags_data if tags_data is not None else []
-        
-        # Indications tags
-        indications_tags = get_safe_tags(item.get('tags_indications'))
-        for tag in indications_tags:
-            tag_sentences.append(f"{drug_name} is indicated for {tag}")
-            tag_sentences.append(f"{drug_name} is prescribed for {tag}")
-            tag_sentences.append(f"{drug_name} is used to treat {tag}")
-            tag_sentences.append(f"{drug_name} is effective for {tag}")
-            tag_sentences.append(f"{drug_name} is recommended for {tag}")
-        
-        # Conditions tags
-        conditions_tags = get_safe_tags(item.get('tags_condition'))
-        for tag in conditions_tags:
-            tag_sentences.append(f"{drug_name} is used to treat {tag}")
-            tag_sentences.append(f"{drug_name} is indicated for {tag}")
-            tag_sentences.append(f"{drug_name} is prescribed for {tag}")
-            tag_sentences.append(f"{drug_name} is effective against {tag}")
-            tag_sentences.append(f"{drug_name} is recommended for {tag}")
-            tag_sentences.append(f"{drug_name} helps manage {tag}")
-        
-        # Substances tags
-        substances_tags = get_safe_tags(item.get('tags_substance'))
-        for tag in substances_tags:
-            tag_sentences.append(f"{drug_name} contains {tag}")
-            tag_sentences.append(f"{drug_name} includes {tag}")
-            tag_sentences.append(f"{drug_name} is composed of {tag}")
-            tag_sentences.append(f"{drug_name} has {tag} as an ingredient")
-            tag_sentences.append(f"{drug_name} contains the substance {tag}")
-        
-        # Strengths/Concentrations tags
-        strengths_tags = get_safe_tags(item.get('tags_strengths_concentrations'))
-        for tag in strengths_tags:
-            tag_sentences.append(f"{drug_name} is available in {tag}")
-            tag_sentences.append(f"{drug_name} comes in {tag}")
-            tag_sentences.append(f"{drug_name} is offered in {tag}")
-            tag_sentences.append(f"{drug_name} is manufactured in {tag}")
-            tag_sentences.append(f"{drug_name} is available as {tag}")
-            tag_sentences.append(f"{drug_name} has strength {tag}")
-        
-        # Populations tags
-        populations_tags = get_safe_tags(item.get('tags_population'))
-        for tag in populations_tags:
-            tag_sentences.append(f"{drug_name} is used in {tag}")
-            tag_sentences.append(f"{drug_name} is prescribed for {tag}")
-            tag_sentences.append(f"{drug_name} is indicated for {tag}")
-            tag_sentences.append(f"{drug_name} is suitable for {tag}")
-            tag_sentences.append(f"{drug_name} is recommended for {tag}")
-            tag_sentences.append(f"{drug_name} is approved for {tag}")
-        
-        # Contraindications tags
-        # contraindications_tags = get_safe_tags(item.get('tags_contraindications'))
-        # for tag in contraindications_tags:
-        #     tag_sentences.append(f"{drug_name} is contraindicated in {tag}")
-        #     tag_sentences.append(f"{drug_name} should not be used in {tag}")
-        #     tag_sentences.append(f"{drug_name} is not recommended for {tag}")
-        #     tag_sentences.append(f"{drug_name} is not suitable for {tag}")
-        #     tag_sentences.append(f"{drug_name} should be avoided in {tag}")
-        #     tag_sentences.append(f"{drug_name} is not indicated for {tag}")
-        
-        concatenated_text = " ".join([
-            str(item['label'].get('indicationsAndUsage', '')).strip(),
-            str(item['label'].get('dosageAndAdministration', '')).strip(),
-            str(item['label'].get('dosageFormsAndStrengths', '')).strip(),
-            str(item['label'].get('warningsAndPrecautions', '')).strip(),
-            str(item['label'].get('adverseReactions', '')).strip(),
-            str(item['label'].get('clinicalPharmacology', '')).strip(),
-            str(item['label'].get('clinicalStudies', '')).strip(),
-            str(item['label'].get('howSupplied', '')).strip(),
-            str(item['label'].get('useInSpecificPopulations', '')).strip(),
-            str(item['label'].get('description', '')).strip(),
-            str(item['label'].get('nonclinicalToxicology', '')).strip(),
-            str(item['label'].get('instructionsForUse', '')).strip(),
-            str(item['label'].get('mechanismOfAction', '')).strip(),
-            str(item['label'].get('contraindications', '')).strip(),
-            str(item['label'].get('boxedWarning', '')).strip(),
-            str(item.get('useAndConditions', '')).strip(),
-            str(item.get('contraIndications', '')).strip(),
-            str(item.get('metaDescription', '')).strip(),
-            str(item.get('dosing', '')).strip(),
-            str(item.get('warnings', '')).strip(),
-            str(item['label'].get('highlights', {}).get('dosageAndAdministration', '')).strip(),
-            " ".join(tag_sentences)
-        ])
-
-        
-
-        similar_check_text = " ".join([
-            str(item['label'].get('indicationsAndUsage', '')).strip(),
-            str(item['label'].get('dosageAndAdministration', '')).strip(),
-            str(item['label'].get('mechanismOfAction', '')).strip(),
-        ])
-
-        # Prepare metadata
-        metadata = {}
-        if item.get('setId') is not None:
-            metadata["item_id"] = item.get('setId')
-            metadata["setId"] = item.get('setId') # TODO: use this over 'item_id'.
-            metadata['name'] = item.get('drugName')
-            metadata['drugName'] = item.get('drugName') # TODO: use this over 'name'.
-            metadata['slug'] = item.get('slug')
-        for key in [
-            # "indicationsAndUsage",
-            # "dosageAndAdministration",
-            # "dosageFormsAndStrengths",
-            # "warningsAndPrecautions",
-            # "adverseReactions",
-            # "clinicalPharmacology",
-            # "clinicalStudies",
-            # "howSupplied",
-            # "useInSpecificPopulations",
-            # "description",
-            # "nonclinicalToxicology",
-            # "instructionsForUse",
-            # "mechanismOfAction",
-            # "contraindications",
-            # "boxedWarning"
-        ]:
-            value = item['label'].get(key, None)
-            if value is not None:
-                metadata[key] = value
-        
-        # Chunk the concatenated text
-        # chunks = chunk_text(concatenated_text, MAX_TOKENS)
-        chunks = spacy_chunk_text(concatenated_text, max_tokens=MAX_TOKENS, overlap_tokens=30)
-        chunks_similar = spacy_chunk_text(similar_check_text, max_tokens=MAX_TOKENS, overlap_tokens=30)
+        chunks, chunks_similar, metadata = build_chroma_records(item)
 
         # Add each chunk with the same id and metadata
         for idx, chunk in enumerate(chunks):
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The scripts import each other as top-level modules (e.g. `from llm_cache import ...`)
+WORKER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [WORKER_DIR, os.path.join(WORKER_DIR, "scripts")]
@@ -0,0 +1,45 @@
+import io
+import json
+
+import zstandard
+
+from artifact_writer import ArtifactReader, ArtifactWriter
+
+
+def write_items(path, items, append=False):
+    writer = ArtifactWriter(path=path, append=append)
+    for set_id, record in items:
+        writer.write(set_id, record)
+    writer.close()
+
+
+def test_item_is_read_back_by_its_offset_index(tmp_path):
+    path = str(tmp_path / "items.jsonl.zst")
+    write_items(path, [("a", {"setId": "a", "drugName": "Alpha"}), ("b", {"setId": "b", "drugName": "Beta"})])
+
+    reader = ArtifactReader(path=path)
+    assert len(reader) == 2
+    assert reader.get("b") == {"setId": "b", "drugName": "Beta"}
+    assert reader.get("a") == {"setId": "a", "drugName": "Alpha"}
+    assert reader.get("missing") is None
+
+
+def test_resumed_run_appends_and_the_latest_record_wins(tmp_path):
+    path = str(tmp_path / "items.jsonl.zst")
+    write_items(path, [("a", {"setId": "a", "version": 1}), ("b", {"setId": "b", "version": 1})])
+    write_items(path, [("a", {"setId": "a", "version": 2})], append=True)
+
+    reader = ArtifactReader(path=path)
+    assert reader.get("a") == {"setId": "a", "version": 2}
+    # Iteration keeps the order items were first written in
+    assert list(reader) == [{"setId": "a", "version": 2}, {"setId": "b", "version": 1}]
+
+
+def test_artifact_is_a_plain_zstd_jsonl_stream(tmp_path):
+    path = str(tmp_path / "items.jsonl.zst")
+    write_items(path, [("a", {"setId": "a"}), ("b", {"setId": "b"})])
+
+    with open(path, "rb") as f:
+        reader = zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True)
+        lines = io.TextIOWrapper(reader, encoding="utf-8").read().splitlines()
+    assert [json.loads(line) for line in lines] == [{"setId": "a"}, {"setId": "b"}]
@@ -0,0 +1,82 @@
+import json
+import asyncio
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+from pydantic import BaseModel
+
+import llm_cache
+import openai_client
+import singleflight
+from batch_executor import start_batch_executor, stop_batch_executor, response_format_param
+from llm_cache import LLMCache
+from llm_call import chat_completion
+from openai_stub_server import StubHandler
+from singleflight import SingleFlight
+
+
+class TagList(BaseModel):
+    tags: list[str]
+
+
+class Drug(BaseModel):
+    setId: str
+    tags: TagList
+
+
+class PackedDrugs(BaseModel):
+    drugs: list[Drug]
+
+
+@pytest.fixture
+def stub_api(tmp_path, monkeypatch):
+    """Points the worker at openai_stub_server on a free port, with an empty cache and dedup memo."""
+    server = ThreadingHTTPServer(("localhost", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("OPENAI_API_KEY", "stub")
+    monkeypatch.setenv("OPENAI_BASE_URL", f"http://localhost:{server.server_port}/v1")
+    monkeypatch.setattr(openai_client, "_openai_client", None)
+    monkeypatch.setattr(llm_cache, "_llm_cache", LLMCache(path=str(tmp_path / "cache.sqlite")))
+    monkeypatch.setattr(singleflight, "_singleflight", SingleFlight())
+    yield tmp_path
+    server.shutdown()
+
+
+def test_response_format_param_is_strict():
+    schema = response_format_param(PackedDrugs)["json_schema"]["schema"]
+
+    assert schema["additionalProperties"] is False
+    assert schema["required"] == ["drugs"]
+    for definition in schema["$defs"].values():
+        assert definition["additionalProperties"] is False
+        assert definition["required"] == list(definition["properties"])
+
+
+def test_batch_mode_answers_from_the_stub_server(stub_api):
+    messages = [{"role": "user", "content": "Enhance this"}]
+
+    async def run():
+        batch = start_batch_executor(directory=str(stub_api / "batches"), idle_seconds=0.1, poll_interval=0.1)
+        try:
+            results = await asyncio.gather(
+                chat_completion("gpt-4o", messages, 0.1, 100),
+                chat_completion("gpt-4o", messages, 0, 100, response_format=TagList),
+            )
+        finally:
+            await stop_batch_executor()
+            await openai_client.close_openai_client()
+        return batch, results
+
+    batch, (text, tags) = asyncio.run(run())
+
+    assert text == "<p>Stub response.</p>"
+    assert TagList.model_validate_json(tags).tags == []
+    assert batch.stats["batches"] == 1
+    assert batch.stats["requests"] == 2
+    assert batch.stats["fallbacks"] == 0
+
+    # The batch input carries the same strict schema the live .parse() call would send
+    [input_file] = (stub_api / "batches").glob("*.input.jsonl")
+    bodies = [json.loads(line)["body"] for line in input_file.read_text().splitlines()]
+    assert [body.get("response_format") for body in bodies] == [None, response_format_param(TagList)]
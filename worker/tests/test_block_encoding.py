@@ -0,0 +1,65 @@
+import os
+import re
+import json
+
+import pytest
+
+from block_encoding import (
+    BLOCK_FORMAT_VERSION, BLOCK_TAG_CODES, encode_block, encode_blocks, encode_view_blocks, decode_blocks,
+)
+
+RENDER_BLOCKS_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "app", "src", "utils", "renderBlocks.tsx")
+
+DOCUMENT = {
+    "type": "[document]",
+    "attrs": {},
+    "contents": [
+        {"type": "h3", "attrs": {}, "contents": ["Dosing"]},
+        {"type": "p", "attrs": {}, "contents": ["Take ", "two", " tablets"]},
+        {"type": "table", "attrs": {}, "contents": [
+            {"type": "tr", "attrs": {}, "contents": [{"type": "td", "attrs": {"colspan": "2"}, "contents": ["Adults"]}]},
+        ]},
+    ],
+}
+
+
+def test_encode_block_uses_codes_omits_empty_attrs_and_joins_text():
+    assert encode_block(DOCUMENT) == [0, [7, "Dosing"], [1, "Take two tablets"], [14, [19, [21, {"colspan": "2"}, "Adults"]]]]
+
+
+def test_round_trip_through_json():
+    encoded = json.loads(json.dumps(encode_blocks([DOCUMENT])))
+
+    assert encoded[0] == BLOCK_FORMAT_VERSION
+    [decoded] = decode_blocks(encoded)
+    assert decoded["contents"][1] == {"type": "p", "attrs": {}, "contents": ["Take two tablets"]}
+    assert decoded["contents"][2] == DOCUMENT["contents"][2]
+
+
+def test_unknown_types_keep_their_name():
+    block = {"type": "custom", "attrs": {}, "contents": ["x"]}
+    assert decode_blocks(encode_blocks([block])) == [block]
+
+
+def test_verbose_blocks_are_returned_unchanged():
+    assert decode_blocks([DOCUMENT]) == [DOCUMENT]
+    assert decode_blocks([]) == []
+
+
+def test_unsupported_version_is_rejected():
+    with pytest.raises(ValueError):
+        decode_blocks([BLOCK_FORMAT_VERSION + 1, [0, "text"]])
+
+
+def test_encode_view_blocks_leaves_other_values():
+    encoded = encode_view_blocks({"description": [DOCUMENT], "setId": "abc"})
+    assert encoded["description"][0] == BLOCK_FORMAT_VERSION
+    assert encoded["setId"] == "abc"
+
+
+def test_tag_codes_match_the_app():
+    with open(RENDER_BLOCKS_PATH, "r", encoding="utf-8") as f:
+        source = f.read()
+    codes = re.search(r"BLOCK_TAG_CODES = \[(.*?)\];", source, re.S).group(1)
+    assert tuple(re.findall(r"'([^']*)'", codes)) == BLOCK_TAG_CODES
+    assert f"BLOCK_FORMAT_VERSION = {BLOCK_FORMAT_VERSION};" in source
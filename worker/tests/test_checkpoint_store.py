@@ -0,0 +1,77 @@
+import asyncio
+
+from checkpoint_store import CheckpointStore
+
+
+def run_stage(store, set_id, stage, output, input_hash=None):
+    calls = []
+
+    async def create():
+        calls.append(stage)
+        return output
+
+    result = asyncio.run(store.run_stage(set_id, stage, create, input_hash))
+    return result, calls
+
+
+def test_resume_after_a_crash_before_the_artifact_reprocesses_the_item(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite")
+    store = CheckpointStore(path)
+    run_id = store.start_run()
+    run_stage(store, "a", "enhance:description", "<p>enhanced</p>")
+    run_stage(store, "b", "enhance:description", "<p>other</p>")
+    # Only b reached the artifact and every sink before the crash
+    store.mark_item_completed("b", {"setId": "b"})
+    store.close()
+
+    store = CheckpointStore(path)
+    assert store.start_run(resume=True) == run_id
+    assert not store.item_completed("a")
+    assert store.item_completed("b")
+    # The stages of a finished before the crash are not run again
+    assert run_stage(store, "a", "enhance:description", "<p>new</p>") == ("<p>enhanced</p>", [])
+    store.close()
+
+
+def test_completion_marker_stores_a_digest_only(tmp_path):
+    store = CheckpointStore(str(tmp_path / "checkpoints.sqlite"))
+    store.start_run()
+    store.mark_item_completed("a", {"setId": "a", "item": {"label": {"description": "x" * 1000}}})
+
+    (result,) = store._conn.execute("SELECT result FROM item_results").fetchone()
+    assert len(result) == 64
+    store.close()
+
+
+def test_incremental_run_reuses_outputs_with_unchanged_inputs(tmp_path):
+    store = CheckpointStore(str(tmp_path / "checkpoints.sqlite"), incremental=True)
+    store.start_run()
+    run_stage(store, "a", "summary:description", "<p>old</p>", input_hash="h1")
+    store.finish_run()
+
+    store.start_run()
+    assert run_stage(store, "a", "summary:description", "<p>new</p>", input_hash="h1") == ("<p>old</p>", [])
+    assert run_stage(store, "b", "summary:description", "<p>b</p>", input_hash="h2") == (
+        "<p>b</p>", ["summary:description"])
+    assert store.stats["unchanged_stages"] == 1
+    store.close()
+
+
+def test_finish_run_prunes_superseded_rows(tmp_path):
+    store = CheckpointStore(str(tmp_path / "checkpoints.sqlite"), incremental=True)
+    store.start_run()
+    run_stage(store, "a", "summary:description", "<p>first</p>", input_hash="h1")
+    run_stage(store, "b", "summary:description", "<p>b</p>", input_hash="h2")
+    store.mark_item_completed("a", {"setId": "a"})
+    store.finish_run()
+
+    second = store.start_run()
+    run_stage(store, "a", "summary:description", "<p>second</p>", input_hash="h3")
+    store.mark_item_completed("a", {"setId": "a"})
+    store.finish_run()
+
+    rows = store._conn.execute("SELECT run_id, set_id, output FROM stage_outputs ORDER BY set_id").fetchall()
+    # a's first output was superseded; b was not processed again and keeps its latest output
+    assert rows == [(second, "a", '"<p>second</p>"'), (second - 1, "b", '"<p>b</p>"')]
+    assert store._conn.execute("SELECT COUNT(*) FROM item_results").fetchone() == (0,)
+    store.close()
@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+from pydantic import ValidationError
+
+import extract_tags
+from extract_tags import TAG_RULES, TagCategories, extract_all_tags, get_extract_condition_tags_prompt
+
+
+def make_item(**sections):
+    label = {name: "" for name in ("indicationsAndUsage", "dosageAndAdministration", "description",
+                                    "dosageFormsAndStrengths")}
+    label.update(sections)
+    return {"setId": "set-1", "drugName": "Example", "label": label}
+
+
+@pytest.fixture
+def merged_call(monkeypatch):
+    calls = []
+
+    def install(answer):
+        async def fake_extract_tags(prompt, response_format, max_tokens, model):
+            calls.append({"prompt": prompt, "response_format": response_format, "model": model})
+            if isinstance(answer, Exception):
+                raise answer
+            return answer
+        monkeypatch.setattr(extract_tags, "extract_tags", fake_extract_tags)
+        return calls
+    return install
+
+
+def test_categories_are_extracted_with_one_call(merged_call):
+    calls = merged_call({"condition": ["Hypertension"], "substance": [], "indications": ["Hypertension"],
+                         "strengthsConcentrations": ["10 mg"], "population": ["Pediatric"]})
+    item = make_item(indicationsAndUsage="<p>Treats <b>hypertension</b></p>", dosageAndAdministration="<p> </p>")
+
+    results = asyncio.run(extract_all_tags(item, pack=False))
+
+    assert results == {"condition": {"tags": ["Hypertension"]}, "substance": {"tags": []},
+                       "indications": {"tags": ["Hypertension"]}, "strengthsConcentrations": {"tags": ["10 mg"]},
+                       "population": {"tags": ["Pediatric"]}}
+    assert len(calls) == 1 and calls[0]["response_format"] is TagCategories
+    prompt = calls[0]["prompt"]
+    # Only non-blank sections are sent, once each, with the rules of the categories they feed
+    assert prompt.count("<p>Treats <b>hypertension</b></p>") == 1
+    assert "dosageAndAdministration:" not in prompt and "### substance" not in prompt
+    assert TAG_RULES["population"] in prompt
+
+
+def test_schema_failure_falls_back_to_the_requested_categories(merged_call, monkeypatch):
+    merged_call(ValidationError.from_exception_data("TagCategories", []))
+    fallback_calls = []
+
+    def fallback(category):
+        async def run(q_item):
+            fallback_calls.append(category)
+            return {"tags": [category]}
+        return run
+
+    for category in extract_tags.TAG_FALLBACKS:
+        monkeypatch.setitem(extract_tags.TAG_FALLBACKS, category, fallback(category))
+
+    results = asyncio.run(extract_all_tags(make_item(description="<p>Metformin tablets</p>"), pack=False))
+
+    assert sorted(fallback_calls) == ["condition", "population", "strengthsConcentrations", "substance"]
+    assert results["indications"] == {"tags": []}
+    assert results["substance"] == {"tags": ["substance"]}
+
+
+def test_blank_label_makes_no_call(merged_call):
+    calls = merged_call({})
+
+    results = asyncio.run(extract_all_tags(make_item(description="<p>&nbsp;</p>"), pack=False))
+
+    assert calls == []
+    assert results == {category: {"tags": []} for category in extract_tags.TAG_SOURCES}
+
+
+def test_per_category_prompt_uses_the_shared_rules():
+    assert TAG_RULES["condition"] in get_extract_condition_tags_prompt("<p>content</p>")
@@ -0,0 +1,42 @@
+from label_fingerprints import section_fingerprints, stage_fingerprint, changed_sections
+
+ITEM = {'label': {'description': '<p>Tablets</p>', 'adverseReactions': '<p>Nausea</p>'}}
+
+
+def test_stage_fingerprint_follows_its_input_sections():
+    fingerprints = section_fingerprints(ITEM)
+    edited = section_fingerprints({'label': {**ITEM['label'], 'adverseReactions': '<p>Headache</p>'}})
+
+    assert changed_sections(fingerprints, edited) == ['adverseReactions']
+    assert stage_fingerprint('summary:description', fingerprints) == stage_fingerprint('summary:description', edited)
+    assert stage_fingerprint('enhance:adverseReactions', fingerprints) != \
+        stage_fingerprint('enhance:adverseReactions', edited)
+
+
+def test_stage_fingerprint_changes_with_the_configuration():
+    fingerprints = section_fingerprints(ITEM)
+    default = {'models': {'model': 'gpt-4o'}}
+    routed = {'models': {'small_model': 'gpt-4o-mini', 'large_model': 'gpt-4o',
+                         'token_threshold': 400, 'max_small_tables': 0}}
+
+    assert stage_fingerprint('summary:description', fingerprints, default) == \
+        stage_fingerprint('summary:description', fingerprints, dict(default))
+    assert stage_fingerprint('summary:description', fingerprints, default) != \
+        stage_fingerprint('summary:description', fingerprints, routed)
+
+
+def test_summary_and_tag_stages_follow_the_enhance_configuration():
+    fingerprints = section_fingerprints(ITEM)
+    models = {'models': {'model': 'gpt-4o'}}
+    enhance = {**models, 'enhance': {'prompt': 'Enhance:', 'max_part_tokens': 1500, 'local_tables': False}}
+    changed = {**models, 'enhance': {**enhance['enhance'], 'local_tables': True}}
+
+    for stage in ('summary:description', 'summary:all', 'tags:substance', 'tags:all'):
+        assert stage_fingerprint(stage, fingerprints, models, enhance) == \
+            stage_fingerprint(stage, fingerprints, models, dict(enhance))
+        assert stage_fingerprint(stage, fingerprints, models, enhance) != \
+            stage_fingerprint(stage, fingerprints, models, changed)
+    # Sections the stage does not read still leave it untouched
+    assert stage_fingerprint('summary:description', fingerprints, models, enhance) == \
+        stage_fingerprint('summary:description', section_fingerprints(
+            {'label': {**ITEM['label'], 'adverseReactions': '<p>Headache</p>'}}), models, enhance)
@@ -0,0 +1,72 @@
+import asyncio
+import time
+
+from extract_tags import TagList
+from llm_cache import LLMCache, make_answer_cache_key, make_cache_key
+
+MESSAGES = [{"role": "user", "content": "Summarize this label"}]
+
+
+def test_cache_key_changes_with_every_request_setting():
+    key = make_cache_key("gpt-4o", MESSAGES, 0.1, 100)
+
+    assert key == make_cache_key("gpt-4o", [dict(MESSAGES[0])], 0.1, 100)
+    assert key != make_cache_key("gpt-4o-mini", MESSAGES, 0.1, 100)
+    assert key != make_cache_key("gpt-4o", [{"role": "user", "content": "Summarize this"}], 0.1, 100)
+    assert key != make_cache_key("gpt-4o", MESSAGES, 0.2, 100)
+    assert key != make_cache_key("gpt-4o", MESSAGES, 0.1, 200)
+    assert key != make_cache_key("gpt-4o", MESSAGES, 0.1, 100, response_format=TagList)
+
+
+def test_answer_key_is_scoped_to_kind_and_settings():
+    key = make_answer_cache_key("packed:tags", {"drugName": "Example"}, scope={"model": "gpt-4o"})
+
+    assert key == make_answer_cache_key("packed:tags", {"drugName": "Example"}, scope={"model": "gpt-4o"})
+    assert key != make_answer_cache_key("packed:summary", {"drugName": "Example"}, scope={"model": "gpt-4o"})
+    assert key != make_answer_cache_key("packed:tags", {"drugName": "Example"}, scope={"model": "gpt-4o-mini"})
+
+
+def test_get_or_create_calls_through_only_on_a_miss(tmp_path):
+    cache = LLMCache(path=str(tmp_path / "cache.sqlite"))
+    calls = []
+
+    async def create():
+        calls.append(1)
+        return "<p>summary</p>"
+
+    async def run(max_tokens):
+        return await cache.get_or_create("gpt-4o", MESSAGES, 0.1, max_tokens, create)
+
+    assert asyncio.run(run(100)) == "<p>summary</p>"
+    assert asyncio.run(run(100)) == "<p>summary</p>"
+    assert len(calls) == 1
+    # A different request setting is a different key
+    asyncio.run(run(200))
+    assert len(calls) == 2
+    assert cache.stats == {"hits": 1, "misses": 2, "writes": 2, "evictions": 0}
+
+
+def test_entries_survive_reopening_the_database(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    key = make_cache_key("gpt-4o", MESSAGES, 0.1, 100)
+    cache = LLMCache(path=path)
+    cache.set(key, "gpt-4o", "<p>summary</p>")
+    cache.close()
+
+    assert LLMCache(path=path).get(key) == "<p>summary</p>"
+
+
+def test_expired_and_least_recently_used_entries_are_evicted(tmp_path):
+    cache = LLMCache(path=str(tmp_path / "cache.sqlite"), max_entries=2)
+    for key in ("a", "b", "c"):
+        cache.set(key, "gpt-4o", key)
+        time.sleep(0.01)
+    # Reading "a" makes "b" the least recently used entry
+    assert cache.get("a") == "a"
+
+    assert cache.evict() == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == "c"
+
+    cache.max_age_seconds = 0
+    assert cache.get("a") is None
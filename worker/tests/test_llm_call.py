@@ -0,0 +1,200 @@
+import asyncio
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import openai
+import pytest
+
+import llm_cache
+import llm_call
+import rate_limiter
+import singleflight
+import summarize_description
+from extract_tags import TagList
+from llm_cache import LLMCache
+from llm_call import AIMDWindow, CircuitBreaker, LLMCallController, LLMCallError
+from rate_limiter import ModelRateLimiter
+from singleflight import SingleFlight
+
+
+def test_rate_limit_wait_is_not_latency_and_holds_no_slot():
+    window = AIMDWindow(initial=1)
+    controller = LLMCallController("test-model", window=window)
+    slots_while_reserving = []
+
+    @asynccontextmanager
+    async def reserve():
+        # Stands in for a limiter that has to wait for capacity
+        slots_while_reserving.append(window.in_flight)
+        await asyncio.sleep(0.2)
+        yield "reservation"
+
+    async def create(reservation):
+        assert reservation == "reservation"
+        return "content"
+
+    assert asyncio.run(controller.call(create, reserve=reserve)) == "content"
+    assert slots_while_reserving == [0]
+    assert window.average_latency < 0.1
+    assert window.in_flight == 0
+
+
+def test_call_without_reservation():
+    controller = LLMCallController("test-model")
+
+    async def create():
+        return "content"
+
+    assert asyncio.run(controller.call(create)) == "content"
+    assert controller.window.in_flight == 0
+
+
+def test_waiting_for_capacity_past_the_deadline_is_not_a_breaker_failure():
+    controller = LLMCallController("test-model", breaker=CircuitBreaker(failure_threshold=1))
+
+    @asynccontextmanager
+    async def reserve():
+        await asyncio.sleep(1.0)
+        yield "reservation"
+
+    async def create(reservation):
+        return "content"
+
+    with pytest.raises(LLMCallError, match="waiting for capacity"):
+        asyncio.run(controller.call(create, deadline_seconds=0.05, reserve=reserve))
+    assert controller.breaker.failures == 0
+    assert controller.window.in_flight == 0
+
+
+def test_non_transient_error_leaves_the_breaker_unchanged():
+    controller = LLMCallController("test-model", base_delay=0.0)
+    controller.breaker.failures = 2
+
+    async def create():
+        raise ValueError("invalid response")
+
+    with pytest.raises(ValueError):
+        asyncio.run(controller.call(create))
+    assert controller.breaker.failures == 2
+
+
+def test_non_transient_error_only_releases_its_own_probe():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    controller = LLMCallController("test-model", breaker=breaker)
+
+    async def run():
+        in_flight = asyncio.Event()
+        fail_earlier_call = asyncio.Event()
+        release_probe = asyncio.Event()
+
+        async def earlier_call():
+            in_flight.set()
+            await fail_earlier_call.wait()
+            raise ValueError("invalid request")
+
+        async def probe():
+            await release_probe.wait()
+            return "content"
+
+        # A call sent before the circuit opened is still in flight when the probe starts
+        earlier = asyncio.create_task(controller.call(earlier_call))
+        await in_flight.wait()
+        breaker.failures = 1
+        probe_task = asyncio.create_task(controller.call(probe))
+        await asyncio.sleep(0)
+        assert breaker.probing
+
+        fail_earlier_call.set()
+        with pytest.raises(ValueError):
+            await earlier
+        # The earlier call's bad request does not let a second probe through
+        assert breaker.probing
+        release_probe.set()
+        return await probe_task
+
+    assert asyncio.run(run()) == "content"
+    assert not breaker.probing and breaker.failures == 0
+
+
+class _FakeCompletions:
+    def __init__(self, finish_reasons):
+        self.finish_reasons = list(finish_reasons)
+        self.calls = 0
+        self.max_tokens = []
+
+    async def create(self, **request):
+        self.calls += 1
+        self.max_tokens.append(request["max_tokens"])
+        return SimpleNamespace(
+            choices=[SimpleNamespace(
+                finish_reason=self.finish_reasons.pop(0),
+                message=SimpleNamespace(content="<p>content</p>"),
+            )],
+            usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5, total_tokens=15),
+        )
+
+
+class _TruncatingParse:
+    """Stands in for completions.parse, which raises for a truncated completion itself."""
+
+    async def parse(self, **request):
+        raise openai.LengthFinishReasonError(completion=SimpleNamespace(
+            choices=[SimpleNamespace(finish_reason="length", message=SimpleNamespace(content='{"tags": ['))],
+            usage=SimpleNamespace(prompt_tokens=50, completion_tokens=request["max_tokens"],
+                                  total_tokens=50 + request["max_tokens"]),
+        ))
+
+
+class _FakeLimiter:
+    @asynccontextmanager
+    async def reserve(self, messages, max_tokens, kind=None):
+        yield SimpleNamespace(reconcile=lambda usage: None)
+
+
+@pytest.fixture
+def fake_api(tmp_path, monkeypatch):
+    def install(finish_reasons):
+        completions = _FakeCompletions(finish_reasons)
+        monkeypatch.setattr(llm_call, "get_openai_client",
+                            lambda: SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+        monkeypatch.setattr(llm_call, "get_rate_limiter", lambda model: _FakeLimiter())
+        monkeypatch.setattr(llm_cache, "_llm_cache", LLMCache(path=str(tmp_path / "cache.sqlite")))
+        monkeypatch.setattr(singleflight, "_singleflight", SingleFlight())
+        return completions
+    return install
+
+
+def test_truncated_completion_is_raised_and_not_cached(fake_api):
+    completions = fake_api(["length", "stop"])
+    messages = [{"role": "user", "content": "Enhance this"}]
+
+    with pytest.raises(openai.LengthFinishReasonError):
+        asyncio.run(llm_call.chat_completion("gpt-4o", messages, 0.1, 100, retry_truncated=False))
+    # The retry reaches the API instead of a stored truncated answer
+    assert asyncio.run(llm_call.chat_completion("gpt-4o", messages, 0.1, 100)) == "<p>content</p>"
+    assert completions.calls == 2
+
+
+def test_truncated_summary_is_retried_with_a_larger_limit(fake_api):
+    completions = fake_api(["length", "stop"])
+    q_item = {"drugName": "Example", "label": {"warningsAndPrecautions": "<p>Risk of QT prolongation.</p>"}}
+
+    assert asyncio.run(summarize_description.summarize_warnings(q_item)) == "<p>content</p>"
+    assert completions.max_tokens == [500, 1000]
+
+
+def test_truncated_structured_output_is_charged_to_the_rate_limiter(fake_api, monkeypatch):
+    fake_api([])
+    monkeypatch.setattr(llm_call, "get_openai_client",
+                        lambda: SimpleNamespace(chat=SimpleNamespace(completions=_TruncatingParse())))
+    monkeypatch.setattr(rate_limiter, "count_message_tokens", lambda messages, model: 50)
+    limiter = ModelRateLimiter("gpt-4o", rpm=100, tpm=30000)
+    monkeypatch.setattr(llm_call, "get_rate_limiter", lambda model: limiter)
+    messages = [{"role": "user", "content": "Extract tags"}]
+
+    with pytest.raises(openai.LengthFinishReasonError):
+        asyncio.run(llm_call.chat_completion("gpt-4o", messages, 0, 500, response_format=TagList,
+                                             retry_truncated=False))
+    # The reservation is settled against the usage instead of being refunded
+    assert limiter.stats["used_tokens"] == 550
+    assert limiter.tokens.level == pytest.approx(30000 - 550, abs=5)
@@ -0,0 +1,54 @@
+import pytest
+
+import model_router
+from model_router import ModelRouter, is_blank, route_model, routing_config
+
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    # One token per word keeps the thresholds readable and avoids loading a tokenizer
+    monkeypatch.setattr(model_router, "count_tokens", lambda text, model: len(text.split()))
+    monkeypatch.setattr(model_router, "_model_router", None)
+
+
+@pytest.mark.parametrize("text, blank", [
+    (None, True),
+    ("", True),
+    ("<p> </p>", True),
+    ("<p>&nbsp;</p>\n<br/>", True),
+    ("<p>Take daily</p>", False),
+])
+def test_blank_inputs(text, blank):
+    assert is_blank(text) is blank
+
+
+def test_small_inputs_without_tables_use_the_small_model():
+    router = ModelRouter(token_threshold=3)
+
+    assert router.route("summary:dosing", "<p>one two</p>") == "gpt-4o-mini"
+    assert router.route("summary:dosing", "<p>one two three four</p>") == "gpt-4o"
+    assert router.route("enhance", "<table><tr><td>x</td></tr></table>") == "gpt-4o"
+
+    assert router.decisions == {("summary", "gpt-4o-mini"): 1, ("summary", "gpt-4o"): 1, ("enhance", "gpt-4o"): 1}
+    assert router.report() == "Model routing: enhance -> gpt-4o: 1, summary -> gpt-4o: 1, summary -> gpt-4o-mini: 1"
+
+
+def test_tables_allowed_on_the_small_model():
+    router = ModelRouter(token_threshold=10, max_small_tables=1)
+
+    assert router.route("enhance", "<table><tr><td>x</td></tr></table>") == "gpt-4o-mini"
+    assert router.route("enhance", "<TABLE><tr><td>x</td></tr></TABLE><table><tr></tr></table>") == "gpt-4o"
+
+
+def test_routing_is_off_until_enabled():
+    assert route_model("enhance", "<p>short</p>") == "gpt-4o"
+    assert route_model("enhance", "<p>short</p>", default="gpt-4o-mini") == "gpt-4o-mini"
+    assert routing_config() == {"model": "gpt-4o"}
+    assert model_router.model_router_report() == ""
+
+    model_router.enable_model_routing(token_threshold=5)
+    assert route_model("enhance", "<p>short</p>") == "gpt-4o-mini"
+    # The routing settings change the stage fingerprints
+    assert routing_config() == {
+        "small_model": "gpt-4o-mini", "large_model": "gpt-4o", "token_threshold": 5, "max_small_tables": 0,
+    }
@@ -0,0 +1,117 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import rate_limiter
+from rate_limiter import ModelRateLimiter, _Bucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    # Only the limiter's clock is faked; the event loop keeps the real one
+    monkeypatch.setattr(rate_limiter, "time", SimpleNamespace(monotonic=clock))
+    return clock
+
+
+def test_bucket_refills_continuously_up_to_capacity(clock):
+    bucket = _Bucket(capacity=60, period=60.0)
+    bucket.adjust(-60)
+    assert bucket.wait_time(30) == pytest.approx(30.0)
+
+    clock.now += 10
+    assert bucket.wait_time(30) == pytest.approx(20.0)
+
+    clock.now += 1000
+    assert bucket.wait_time(60) == 0.0
+    assert bucket.level == 60
+
+
+def test_bucket_goes_negative_on_overshoot(clock):
+    bucket = _Bucket(capacity=100, period=60.0)
+    bucket.adjust(-130)
+
+    assert bucket.level == -30
+    assert bucket.wait_time(10) == pytest.approx(40 / (100 / 60))
+
+
+def test_reservation_settles_against_usage(clock):
+    limiter = ModelRateLimiter("gpt-4o", rpm=10, tpm=1000)
+
+    reservation = asyncio.run(limiter.acquire(300))
+    assert limiter.tokens.level == 700
+    reservation.reconcile({"total_tokens": 120})
+    assert limiter.tokens.level == 880
+    # Settled once; later calls are ignored
+    reservation.reconcile({"total_tokens": 500})
+    reservation.release()
+    assert limiter.tokens.level == 880
+    assert limiter.stats["used_tokens"] == 120
+
+
+def test_failed_request_returns_its_reservation(clock, monkeypatch):
+    monkeypatch.setattr(rate_limiter, "count_message_tokens", lambda messages, model: 50)
+    limiter = ModelRateLimiter("gpt-4o", rpm=10, tpm=1000)
+
+    async def run():
+        async with limiter.reserve([{"role": "user", "content": "x"}], max_tokens=100):
+            raise ValueError("request failed")
+
+    with pytest.raises(ValueError):
+        asyncio.run(run())
+    assert limiter.tokens.level == 1000
+    assert limiter.requests.level == 9
+
+
+def test_reservation_expects_the_average_completion_of_its_kind(clock, monkeypatch):
+    monkeypatch.setattr(rate_limiter, "count_message_tokens", lambda messages, model: 50)
+    limiter = ModelRateLimiter("gpt-4o", rpm=10, tpm=30000)
+    messages = [{"role": "user", "content": "x"}]
+
+    async def request(completion_tokens):
+        async with limiter.reserve(messages, max_tokens=4000, kind="enhance:description") as reservation:
+            reserved = reservation.tokens
+            reservation.reconcile({"total_tokens": 50 + completion_tokens, "completion_tokens": completion_tokens})
+        return reserved
+
+    # Nothing observed yet: max_tokens is reserved
+    assert asyncio.run(request(800)) == 4050
+    assert asyncio.run(request(1300)) == 850
+    assert limiter.expected_completion_tokens("enhance:description", 4000) == 900
+    # max_tokens stays the upper bound; other kinds keep their own average
+    assert limiter.expected_completion_tokens("enhance:description", 500) == 500
+    assert limiter.expected_completion_tokens("tags:all", 1500) == 1500
+
+
+def test_acquire_waits_for_capacity(clock, monkeypatch):
+    sleeps = []
+
+    async def fake_sleep(seconds):
+        sleeps.append(seconds)
+        clock.now += seconds
+
+    monkeypatch.setattr(rate_limiter, "asyncio", SimpleNamespace(sleep=fake_sleep, Lock=asyncio.Lock))
+    limiter = ModelRateLimiter("gpt-4o", rpm=60, tpm=600)
+
+    async def run():
+        await limiter.acquire(600)
+        await limiter.acquire(300)
+
+    asyncio.run(run())
+    assert sleeps == [pytest.approx(30.0)]
+    assert limiter.stats["waited_seconds"] == pytest.approx(30.0)
+
+
+def test_unknown_model_is_rejected():
+    with pytest.raises(ValueError):
+        rate_limiter.get_rate_limiter("gpt-5")
+    assert "gpt-4o-mini" in rate_limiter.known_models()
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+import llm_cache
+from llm_cache import LLMCache
+from request_packer import RequestPacker
+
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path, monkeypatch):
+    cache = LLMCache(path=str(tmp_path / "cache.sqlite"))
+    monkeypatch.setattr(llm_cache, "_llm_cache", cache)
+    return cache
+
+
+def _fallback(set_id):
+    async def run():
+        return f"own:{set_id}"
+    return run
+
+
+def run_packer(packer, inputs):
+    """Submits (set_id, tokens) inputs concurrently and returns their results in order."""
+    async def run():
+        return await asyncio.gather(*[
+            packer.submit(set_id, f"payload:{set_id}", tokens, _fallback(set_id)) for set_id, tokens in inputs
+        ])
+    return asyncio.run(run())
+
+
+def test_concurrent_requests_share_one_pack():
+    packs = []
+
+    async def run_pack(payloads):
+        packs.append(sorted(payloads))
+        return {set_id: f"packed:{payload}" for set_id, payload in payloads.items()}
+
+    packer = RequestPacker("tags", run_pack, linger_seconds=0.01)
+    results = run_packer(packer, [("a", 10), ("b", 10), ("c", 10)])
+
+    assert results == ["packed:payload:a", "packed:payload:b", "packed:payload:c"]
+    assert packs == [["a", "b", "c"]]
+    assert packer.stats == {"packs": 1, "packed": 3, "fallbacks": 0, "cached": 0}
+
+
+def test_packs_respect_the_token_budget_and_item_limit():
+    packs = []
+
+    async def run_pack(payloads):
+        packs.append(sorted(payloads))
+        return dict(payloads)
+
+    run_packer(RequestPacker("tags", run_pack, token_budget=25, linger_seconds=0.01),
+               [("a", 10), ("b", 10), ("c", 10), ("d", 10)])
+    run_packer(RequestPacker("tags", run_pack, max_items=2, linger_seconds=0.01),
+               [("e", 1), ("f", 1), ("g", 1)])
+
+    assert packs == [["a", "b"], ["c", "d"], ["e", "f"]]
+
+
+def test_missing_answers_and_failed_packs_fall_back():
+    async def partial_pack(payloads):
+        return {"a": "packed"}
+
+    async def failing_pack(payloads):
+        raise ValueError("schema mismatch")
+
+    packer = RequestPacker("tags", partial_pack, linger_seconds=0.01)
+    assert run_packer(packer, [("a", 1), ("b", 1)]) == ["packed", "own:b"]
+    assert packer.stats["fallbacks"] == 1
+
+    packer = RequestPacker("tags", failing_pack, linger_seconds=0.01)
+    assert run_packer(packer, [("c", 1), ("d", 1)]) == ["own:c", "own:d"]
+    assert packer.stats == {"packs": 0, "packed": 0, "fallbacks": 2, "cached": 0}
+
+
+def test_packed_answers_are_cached_per_drug():
+    packs = []
+
+    async def run_pack(payloads):
+        packs.append(sorted(payloads))
+        return {set_id: {"tags": [payload]} for set_id, payload in payloads.items()}
+
+    run_packer(RequestPacker("tags", run_pack, linger_seconds=0.01, cache_scope="v1"), [("a", 1), ("b", 1)])
+    # A later run groups the drugs differently; only the drug never answered is packed again
+    packer = RequestPacker("tags", run_pack, linger_seconds=0.01, cache_scope="v1")
+    results = run_packer(packer, [("b", 1), ("c", 1)])
+
+    assert results == [{"tags": ["payload:b"]}, "own:c"]
+    assert packs == [["a", "b"]]
+    assert packer.stats["cached"] == 1
+    # A different prompt or model (cache_scope) does not reuse the answers
+    packer = RequestPacker("tags", run_pack, linger_seconds=0.01, cache_scope="v2")
+    run_packer(packer, [("a", 1), ("b", 1)])
+    assert packer.stats["cached"] == 0
+    assert packs[-1] == ["a", "b"]
+
+
+def test_single_request_is_not_packed():
+    async def run_pack(payloads):
+        raise AssertionError("a pack of one is sent as the drug's own request")
+
+    assert run_packer(RequestPacker("tags", run_pack, linger_seconds=0.01), [("a", 1)]) == ["own:a"]
+
+
+def test_fits():
+    packer = RequestPacker("tags", None, max_item_tokens=400)
+    assert packer.fits(400)
+    assert not packer.fits(401)
@@ -0,0 +1,90 @@
+import asyncio
+import sqlite3
+from types import SimpleNamespace
+
+import pytest
+
+import run_ledger
+from run_ledger import (
+    RunLedger, annotate_call, current_stage, in_ledger_scope, ledger_scope, record_retry, record_usage, track_call,
+)
+
+
+@pytest.fixture
+def ledger(tmp_path, monkeypatch):
+    monkeypatch.setattr(run_ledger, "_run_ledger", None)
+    ledger = run_ledger.start_run_ledger(str(tmp_path / "ledger.sqlite"), run_id=7)
+    yield ledger
+    run_ledger.stop_run_ledger()
+
+
+def ledger_rows(ledger):
+    ledger.flush()
+    return sqlite3.connect(ledger.path).execute(
+        "SELECT run_id, set_id, drug, stage, model, source, prompt_tokens, completion_tokens, retries, error "
+        "FROM llm_calls ORDER BY rowid"
+    ).fetchall()
+
+
+def test_calls_are_attributed_to_the_enclosing_scope(ledger):
+    with ledger_scope(set_id="set-1", drug="Example"):
+        with ledger_scope(stage="summary:dosing"):
+            assert current_stage() == "summary:dosing"
+            with track_call("gpt-4o"):
+                record_retry()
+                record_usage(SimpleNamespace(prompt_tokens=100, completion_tokens=20))
+        assert current_stage() is None
+        with track_call("gpt-4o-mini"):
+            annotate_call(source="cache")
+
+    assert ledger_rows(ledger) == [
+        (7, "set-1", "Example", "summary:dosing", "gpt-4o", "api", 100, 20, 1, None),
+        (7, "set-1", "Example", None, "gpt-4o-mini", "cache", 0, 0, 0, None),
+    ]
+
+
+def test_scope_follows_tasks_started_elsewhere(ledger):
+    async def create():
+        with track_call("gpt-4o"):
+            record_usage({"prompt_tokens": 5, "completion_tokens": 1})
+
+    async def run():
+        # A batched call runs in another task, so the scope is carried by the wrapped coroutine
+        await asyncio.create_task(in_ledger_scope(create, set_id="set-2", drug="Other", stage="tags")())
+
+    asyncio.run(run())
+    assert ledger_rows(ledger) == [(7, "set-2", "Other", "tags", "gpt-4o", "api", 5, 1, 0, None)]
+
+
+def test_failed_call_is_recorded_with_its_error(ledger):
+    with pytest.raises(TimeoutError):
+        with track_call("gpt-4o"):
+            raise TimeoutError()
+
+    assert ledger_rows(ledger)[0][-1] == "TimeoutError"
+
+
+def test_hooks_are_no_ops_outside_a_tracked_call():
+    annotate_call(source="cache")
+    record_usage({"prompt_tokens": 5})
+    record_retry()
+    with track_call("gpt-4o") as record:
+        pass
+    assert record.source == "api" and record.latency >= 0
+
+
+def test_report_groups_by_stage_and_drug(tmp_path):
+    ledger = RunLedger(str(tmp_path / "ledger.sqlite"), run_id=1)
+    for stage, drug, tokens in [("enhance", "Alpha", 900), ("tags", "Alpha", 50), ("enhance", "Beta", 300)]:
+        ledger.record(run_ledger.CallRecord(f"set-{drug}", drug, stage, "gpt-4o", prompt_tokens=tokens))
+    ledger.close()
+
+    ledger = RunLedger(str(tmp_path / "ledger.sqlite"))
+    assert ledger.latest_run_id() == 1
+    lines = ledger.report(run_id=1, top_drugs=1).splitlines()
+
+    assert lines[1] == "By stage:"
+    assert lines[3].split()[:2] == ["enhance", "2"] and lines[4].split()[:2] == ["tags", "1"]
+    assert lines[5] == "Top 1 drugs by tokens:"
+    assert lines[7].split()[:3] == ["Alpha", "2", "2"]
+    assert len(lines) == 8
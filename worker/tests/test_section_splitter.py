@@ -0,0 +1,61 @@
+import pytest
+from bs4 import BeautifulSoup
+
+import section_splitter
+from section_splitter import SectionPart, align_heading_levels, split_html_section
+
+
+@pytest.fixture(autouse=True)
+def character_tokens(monkeypatch):
+    # One token per character keeps the budgets readable and needs no tokenizer download
+    monkeypatch.setattr(section_splitter, "count_tokens", lambda text, model=None: len(text))
+
+
+def test_small_section_is_one_part():
+    html = "<h2>Dosing</h2><p>Take one.</p>"
+
+    assert split_html_section(html, max_tokens=100) == [SectionPart(html, len(html), 2, None)]
+
+
+def test_parts_break_on_headings_and_keep_order():
+    blocks = ["<h2>Adults</h2>", "<p>aaaaaaaaaa</p>", "<h3>Renal</h3>", "<p>bbbbbbbbbb</p>", "<h2>Children</h2>",
+              "<p>cccccccccc</p>"]
+    html = "<div>" + "".join(blocks) + "</div>"
+
+    parts = split_html_section(html, max_tokens=40)
+
+    assert "".join(part.html for part in parts) == "".join(blocks)
+    assert [part.html for part in parts] == [
+        "<h2>Adults</h2><p>aaaaaaaaaa</p>", "<h3>Renal</h3><p>bbbbbbbbbb</p>", "<h2>Children</h2><p>cccccccccc</p>",
+    ]
+    assert [(part.heading_level, part.context_level) for part in parts] == [(2, None), (3, 2), (2, 3)]
+    assert all(part.tokens <= 40 for part in parts)
+
+
+def test_table_starts_a_new_unit_and_oversized_blocks_stand_alone():
+    table = "<table><tr><td>" + "x" * 60 + "</td></tr></table>"
+    html = "<p>intro</p>" + table + "<p>after</p>"
+
+    parts = split_html_section(html, max_tokens=40)
+
+    assert [part.html for part in parts] == ["<p>intro</p>", table, "<p>after</p>"]
+
+
+def test_loose_text_keeps_its_escaping():
+    html = "<h2>Dosing</h2>Dose &lt; 5 mg &amp; daily<!-- note --><h2>Renal</h2><p>Reduce dose.</p>"
+
+    parts = split_html_section(html, max_tokens=50)
+
+    assert len(parts) == 2
+    assert "".join(part.html for part in parts) == html
+
+
+def test_align_heading_levels_follows_the_input():
+    soup = BeautifulSoup("<h1>A</h1><h2>B</h2>", "html.parser")
+    align_heading_levels(soup, SectionPart("", 0, heading_level=3, context_level=None))
+    assert str(soup) == "<h3>A</h3><h4>B</h4>"
+
+    # Without headings in the input, output headings go below the preceding heading
+    soup = BeautifulSoup("<h2>A</h2>", "html.parser")
+    align_heading_levels(soup, SectionPart("", 0, heading_level=None, context_level=2))
+    assert str(soup) == "<h3>A</h3>"
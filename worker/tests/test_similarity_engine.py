@@ -0,0 +1,67 @@
+from collections import Counter
+
+import numpy as np
+
+import similarity_engine
+from similarity_engine import compute_similar_rankings
+
+
+def make_collection(drugs=12, chunks_per_drug=4, dims=16, seed=0):
+    rng = np.random.default_rng(seed)
+    embeddings = rng.normal(size=(drugs * chunks_per_drug, dims)).astype(np.float32)
+    metadatas = [
+        {"setId": f"set-{drug}", "name": f"Drug {drug}", "slug": f"drug-{drug}"}
+        for drug in range(drugs) for _ in range(chunks_per_drug)
+    ]
+    return embeddings, metadatas
+
+
+def query_one_drug(embeddings, metadatas, drug_name, top_k):
+    """The per-drug query made by find_similar_drugs_by_name, with Chroma replaced by a brute-force L2 search."""
+    rows = [row for row, m in enumerate(metadatas) if m["name"] == drug_name]
+    centroid = embeddings[rows].mean(axis=0)
+    distances = np.linalg.norm(embeddings - centroid, axis=1)
+    nearest = np.argsort(distances, kind="stable")[:top_k * 3]
+    similar_names = [metadatas[row]["slug"] for row in nearest if metadatas[row]["name"] != drug_name]
+    return Counter(similar_names).most_common(top_k)
+
+
+def test_rankings_match_the_per_drug_query():
+    embeddings, metadatas = make_collection()
+    expected = {m["name"]: query_one_drug(embeddings, metadatas, m["name"], 3) for m in metadatas}
+
+    # Small blocks exercise the chunked matrix products
+    assert compute_similar_rankings(embeddings, metadatas, top_k=3, chunk_size=5) == expected
+
+
+def test_only_requested_drugs_with_embeddings_are_ranked():
+    embeddings, metadatas = make_collection(drugs=4)
+
+    rankings = compute_similar_rankings(embeddings, metadatas, drug_names=["Drug 1", "Drug 1", "Missing"], top_k=2)
+
+    assert list(rankings) == ["Drug 1"]
+    assert all(slug != "drug-1" for slug, _ in rankings["Drug 1"])
+
+
+def test_empty_collection_has_no_rankings():
+    assert compute_similar_rankings(np.empty((0, 0), dtype=np.float32), []) == {}
+
+
+def test_job_reads_once_and_stores_rankings_by_set_id(monkeypatch):
+    embeddings, metadatas = make_collection(drugs=3)
+    reads = []
+    stored = []
+
+    def fetch(collection_name):
+        reads.append(collection_name)
+        return embeddings, metadatas
+
+    monkeypatch.setattr(similarity_engine, "fetch_similarity_embeddings", fetch)
+    monkeypatch.setattr(similarity_engine, "bulk_update_vector_similar_ranking", stored.append)
+
+    rankings = similarity_engine.run_similarity_job(top_k=2)
+
+    assert reads == ["drug_similar_data"]
+    assert stored == [rankings]
+    assert set(rankings) == {"set-0", "set-1", "set-2"}
+    assert rankings["set-0"] == compute_similar_rankings(embeddings, metadatas, top_k=2)["Drug 0"]
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight, make_dedup_key, normalize_messages
+
+
+def counting_call(result="answer", error=None):
+    calls = []
+
+    async def create():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        if error is not None:
+            raise error
+        return result
+
+    return create, calls
+
+
+def test_concurrent_requests_join_one_call():
+    flight = SingleFlight()
+    create, calls = counting_call()
+
+    async def run():
+        return await asyncio.gather(*[flight.do("key", create) for _ in range(3)])
+
+    assert asyncio.run(run()) == ["answer"] * 3
+    assert len(calls) == 1
+    assert flight.stats == {"requests": 3, "calls": 1, "joined": 2, "reused": 0}
+
+
+def test_later_requests_reuse_the_response_up_to_max_entries():
+    flight = SingleFlight(max_entries=1)
+    create, calls = counting_call()
+
+    async def run():
+        await flight.do("a", create)
+        await flight.do("a", create)
+        await flight.do("b", create)
+        # "a" was evicted by "b"
+        await flight.do("a", create)
+
+    asyncio.run(run())
+    assert len(calls) == 3
+    assert flight.stats["reused"] == 1
+
+
+def test_failed_calls_are_not_remembered():
+    flight = SingleFlight()
+    failing, _ = counting_call(error=ValueError("truncated"))
+    create, calls = counting_call()
+
+    async def run():
+        with pytest.raises(ValueError):
+            await flight.do("key", failing)
+        return await flight.do("key", create)
+
+    assert asyncio.run(run()) == "answer"
+    assert len(calls) == 1
+
+
+def test_cancelling_one_waiter_keeps_the_call_for_the_others():
+    flight = SingleFlight()
+    create, calls = counting_call()
+
+    async def run():
+        first = asyncio.ensure_future(flight.do("key", create))
+        second = asyncio.ensure_future(flight.do("key", create))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()) == "answer"
+    assert len(calls) == 1
+
+
+def test_dedup_key_ignores_whitespace_only_differences():
+    spaced = [{"role": "user", "content": "<p>Take  two</p>\n  <p>daily</p> "}]
+    compact = [{"role": "user", "content": "<p>Take two</p> <p>daily</p>"}]
+
+    assert normalize_messages(spaced) == compact
+    assert make_dedup_key("gpt-4o", spaced, 0.1, 100) == make_dedup_key("gpt-4o", compact, 0.1, 100)
+    assert make_dedup_key("gpt-4o", compact, 0.1, 100) != make_dedup_key("gpt-4o-mini", compact, 0.1, 100)
+
+
+def test_dedup_key_keeps_whitespace_between_tags():
+    spaced = [{"role": "user", "content": "<b>a</b> <i>b</i>"}]
+    joined = [{"role": "user", "content": "<b>a</b><i>b</i>"}]
+
+    assert make_dedup_key("gpt-4o", spaced, 0.1, 100) != make_dedup_key("gpt-4o", joined, 0.1, 100)
@@ -0,0 +1,117 @@
+import asyncio
+
+from sink_fanout import SinkFanout, SinkWorker
+
+
+def run_fanout(sinks, records, on_written=None):
+    async def run():
+        fanout = SinkFanout(sinks, on_written=on_written)
+        fanout.start()
+        for record in records:
+            await fanout.submit(record)
+        return await fanout.close()
+    return asyncio.run(run())
+
+
+def test_record_is_reported_once_every_sink_wrote_it():
+    written = []
+    reported = []
+
+    def write(batch):
+        written.extend(record["setId"] for record in batch)
+
+    def broken(batch):
+        if any(record["setId"] == "b" for record in batch):
+            raise RuntimeError("store rejected b")
+
+    sinks = [
+        SinkWorker("es", write, batch_size=1),
+        SinkWorker("pg", broken, batch_size=1, max_retries=0),
+    ]
+    run_fanout(sinks, [{"setId": "a"}, {"setId": "b"}], on_written=lambda record: reported.append(record["setId"]))
+
+    assert written == ["a", "b"]
+    # b never reached Postgres, so it is not completed
+    assert reported == ["a"]
+
+
+def test_batches_flush_on_size_and_on_close():
+    batches = []
+    sink = SinkWorker("es", lambda batch: batches.append([record["setId"] for record in batch]), batch_size=2)
+
+    stats = run_fanout([sink], [{"setId": s} for s in "abc"])
+
+    assert batches == [["a", "b"], ["c"]]
+    assert stats["es"] == {"written": 3, "batches": 2, "retries": 0, "failed": 0}
+
+
+def test_open_batch_is_flushed_after_the_interval():
+    flushed_while_open = []
+    sink = SinkWorker("es", lambda batch: flushed_while_open.append(len(batch)), batch_size=10, flush_interval=0.05)
+
+    async def run():
+        fanout = SinkFanout([sink])
+        fanout.start()
+        await fanout.submit({"setId": "a"})
+        await asyncio.sleep(0.2)
+        # The record was written before the fan-out closed
+        assert flushed_while_open == [1]
+        await fanout.close()
+
+    asyncio.run(run())
+
+
+def test_failed_batch_is_retried():
+    attempts = []
+
+    def flaky(batch):
+        attempts.append(len(batch))
+        if len(attempts) < 3:
+            raise ConnectionError("timeout")
+
+    sink = SinkWorker("chroma", flaky, batch_size=1, base_delay=0.0)
+    stats = run_fanout([sink], [{"setId": "a"}])
+
+    assert attempts == [1, 1, 1]
+    assert stats["chroma"] == {"written": 1, "batches": 1, "retries": 2, "failed": 0}
+
+
+def test_batch_is_given_up_after_max_retries():
+    def broken(batch):
+        raise ConnectionError("refused")
+
+    sink = SinkWorker("pg", broken, batch_size=1, max_retries=2, base_delay=0.0)
+    stats = run_fanout([sink], [{"setId": "a"}])
+
+    assert stats["pg"] == {"written": 0, "batches": 0, "retries": 2, "failed": 1}
+    assert sink.failed_records == [{"setId": "a"}]
+
+
+def test_unreachable_sink_drains_without_blocking_the_others():
+    written = []
+    reported = []
+
+    def cannot_open():
+        raise ConnectionError("refused")
+
+    sinks = [
+        SinkWorker("es", lambda batch: written.extend(batch), batch_size=1),
+        SinkWorker("pg", lambda batch: None, queue_size=1, open_sink=cannot_open),
+    ]
+    records = [{"setId": s} for s in "abc"]
+    stats = run_fanout(sinks, records, on_written=lambda record: reported.append(record["setId"]))
+
+    assert written == records
+    assert sinks[1].failed_records == records
+    assert stats["pg"]["failed"] == 3
+    assert reported == []
+
+
+def test_sink_is_closed_after_its_last_flush():
+    events = []
+    sink = SinkWorker("es", lambda batch: events.append("write"), open_sink=lambda: events.append("open"),
+                      close_sink=lambda: events.append("close"))
+
+    run_fanout([sink], [{"setId": "a"}])
+
+    assert events == ["open", "write", "close"]
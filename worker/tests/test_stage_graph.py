@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from stage_graph import StageGraph
+
+
+def recording_stage(log, name, delay=0.0, error=None):
+    async def run():
+        log.append(f"start {name}")
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        log.append(f"end {name}")
+        return name.upper()
+    return run
+
+
+def test_stage_starts_when_its_own_dependencies_finish():
+    log = []
+    graph = StageGraph()
+    graph.add("enhance:a", recording_stage(log, "enhance:a", 0.01))
+    graph.add("enhance:b", recording_stage(log, "enhance:b", 0.05))
+    graph.add("summary:a", recording_stage(log, "summary:a"), depends_on=["enhance:a"])
+    graph.add("summary:ab", recording_stage(log, "summary:ab"), depends_on=["enhance:a", "enhance:b"])
+
+    results = asyncio.run(graph.run())
+
+    assert results == {"enhance:a": "ENHANCE:A", "enhance:b": "ENHANCE:B", "summary:a": "SUMMARY:A",
+                       "summary:ab": "SUMMARY:AB"}
+    # summary:a does not wait for the slower enhance:b
+    assert log.index("end summary:a") < log.index("end enhance:b")
+    assert log.index("start summary:ab") > log.index("end enhance:b")
+
+
+def test_limited_concurrency_starts_ready_stages_by_priority():
+    log = []
+    graph = StageGraph(max_concurrency=1)
+    graph.add("tags", recording_stage(log, "tags"), priority=2)
+    graph.add("summary", recording_stage(log, "summary"), priority=1)
+    graph.add("enhance", recording_stage(log, "enhance"), priority=0)
+
+    asyncio.run(graph.run())
+
+    assert [entry for entry in log if entry.startswith("start")] == ["start enhance", "start summary", "start tags"]
+
+
+def test_failure_cancels_running_stages():
+    log = []
+    graph = StageGraph()
+    graph.add("slow", recording_stage(log, "slow", 1.0))
+    graph.add("broken", recording_stage(log, "broken", error=ValueError("bad stage")))
+    graph.add("after", recording_stage(log, "after"), depends_on=["broken"])
+
+    with pytest.raises(ValueError, match="bad stage"):
+        asyncio.run(graph.run())
+    assert "end slow" not in log
+    assert "start after" not in log
+
+
+def test_invalid_graphs_are_rejected():
+    async def run():
+        return None
+
+    graph = StageGraph()
+    graph.add("a", run)
+    with pytest.raises(ValueError):
+        graph.add("a", run)
+
+    graph.add("b", run, depends_on=["missing"])
+    with pytest.raises(ValueError, match="unknown stage"):
+        asyncio.run(graph.run())
+
+    graph = StageGraph()
+    graph.add("a", run, depends_on=["b"])
+    graph.add("b", run, depends_on=["a"])
+    with pytest.raises(ValueError, match="cycle"):
+        asyncio.run(graph.run())
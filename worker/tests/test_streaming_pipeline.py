@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+from streaming_pipeline import iter_json_array
+
+ELEMENTS = [
+    {"setId": "a", "label": {"description": "<p>Take [two] {tablets}</p>", "quote": "say \"hi\"\\"}},
+    [1, [2, {"nested": []}], "]"],
+    "plain, string",
+    12.5e3,
+    True,
+    None,
+    {"unicode": "café µg", "escaped": "line\nbreak \\\" end"},
+]
+
+
+def write_array(tmp_path, text):
+    path = tmp_path / "items.json"
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, 1 << 16])
+def test_elements_match_json_load_at_any_chunk_size(tmp_path, chunk_size):
+    path = write_array(tmp_path, json.dumps(ELEMENTS, indent=2))
+
+    assert list(iter_json_array(path, chunk_size=chunk_size)) == ELEMENTS
+
+
+def test_compact_and_empty_arrays(tmp_path):
+    assert list(iter_json_array(write_array(tmp_path, '[1,"x",{"a":[]},null]'), chunk_size=2)) == [1, "x", {"a": []}, None]
+    assert list(iter_json_array(write_array(tmp_path, "  [ \n ]  "), chunk_size=1)) == []
+
+
+def test_element_spanning_many_chunks_is_decoded_once(tmp_path, monkeypatch):
+    big = {"setId": "a", "label": {"section": "<p>" + "x" * 20000 + "</p>"}}
+    path = write_array(tmp_path, json.dumps([big, {"setId": "b"}]))
+    decodes = []
+    raw_decode = json.JSONDecoder.raw_decode
+
+    def counting_raw_decode(self, s, idx=0):
+        decodes.append(len(s))
+        return raw_decode(self, s, idx)
+
+    monkeypatch.setattr(json.JSONDecoder, "raw_decode", counting_raw_decode)
+
+    assert list(iter_json_array(path, chunk_size=64)) == [big, {"setId": "b"}]
+    assert len(decodes) == 2
+
+
+@pytest.mark.parametrize("text", ['[{"setId": "a"}, {"setId": "b"', '[{"setId": "a"}, 12', '[{"setId": "a"}'])
+def test_truncated_array_raises(tmp_path, text):
+    with pytest.raises(ValueError):
+        list(iter_json_array(write_array(tmp_path, text), chunk_size=4))
+
+
+def test_file_without_an_array_raises(tmp_path):
+    with pytest.raises(ValueError, match="does not contain a JSON array"):
+        list(iter_json_array(write_array(tmp_path, '{"setId": "a"}')))
+    with pytest.raises(ValueError, match="does not contain a JSON array"):
+        list(iter_json_array(write_array(tmp_path, "")))
@@ -0,0 +1,62 @@
+import os
+import json
+
+import pytest
+from bs4 import BeautifulSoup
+
+from html_normalizer import clean_html
+from structure_json_html import build_blocks, parse_element_to_dict, ALLOWED_BLOCK_TAGS
+
+LABELS_PATH = os.path.join(os.path.dirname(__file__), "..", "scripts", "data", "Labels.json")
+
+
+def label_sections():
+    """(drug name, section name, html) of every string section of the sample labels."""
+    with open(LABELS_PATH, "r", encoding="utf-8") as f:
+        items = json.load(f)
+    return [
+        (item.get("drugName", ""), name, value)
+        for item in items
+        for name, value in (item.get("label") or {}).items()
+        if isinstance(value, str)
+    ]
+
+
+def block_types(block: dict):
+    yield block["type"]
+    for content in block["contents"]:
+        if isinstance(content, dict):
+            yield from block_types(content)
+
+
+def soup_blocks(html: str) -> dict:
+    return parse_element_to_dict(BeautifulSoup(html, "html.parser"))
+
+
+@pytest.mark.parametrize("html", [
+    "<p>Take <b>two</b> tablets<br>daily</p>",
+    "<ul><li>one<li>two</ul><p>after",
+    "</div><p>stray end tags</span></p>",
+    "<h2>Dosing</h2><!-- comment --><p>a &amp; b</p>",
+    "<table><tr><td colspan=\"2\">Adults</td></tr></table>",
+    "",
+])
+def test_build_blocks_matches_beautifulsoup(html):
+    assert build_blocks(html, allowed_tags=None) == soup_blocks(html)
+
+
+def test_build_blocks_drops_scripts_and_unwraps_unknown_tags():
+    blocks = build_blocks("<div><p>Take <span>two</span></p><script>skip()</script><style>p {}</style></div>")
+    assert blocks == {
+        "type": "[document]",
+        "contents": [{"type": "p", "contents": ["Take", "two"], "attrs": {}}],
+        "attrs": {},
+    }
+
+
+@pytest.mark.parametrize("drug, name, raw", label_sections())
+def test_label_section_blocks_match_beautifulsoup(drug, name, raw):
+    # Raw sections carry attributes and layout tags; cleaned ones are what the pipeline sees
+    for html in (raw, clean_html(raw)):
+        assert build_blocks(html, allowed_tags=None) == soup_blocks(html)
+        assert set(block_types(build_blocks(html))) <= ALLOWED_BLOCK_TAGS | {"[document]"}
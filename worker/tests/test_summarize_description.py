@@ -0,0 +1,106 @@
+import asyncio
+import json
+
+import pytest
+
+import summarize_description
+from summarize_description import DrugSummaries, is_valid_summary, summarize_all
+
+LABEL = {
+    "description": "<p>Metformin tablets</p>",
+    "indicationsAndUsage": "<p>Type 2 diabetes</p>",
+    "dosageAndAdministration": "<p>500 mg twice daily</p>",
+    "dosageFormsAndStrengths": "",
+    "contraindications": "<p> </p>",
+    "warningsAndPrecautions": "",
+}
+
+
+@pytest.fixture
+def consolidated_call(monkeypatch):
+    calls = []
+    fallback_calls = []
+
+    def install(content):
+        async def fake_chat_completion(model, messages, temperature, max_tokens, response_format=None):
+            calls.append({"prompt": messages[0]["content"], "response_format": response_format})
+            return content
+        monkeypatch.setattr(summarize_description, "chat_completion", fake_chat_completion)
+
+        def fallback(field):
+            async def run(q_item):
+                fallback_calls.append(field)
+                return f"<p>{field} fallback</p>"
+            return run
+
+        for field in summarize_description.SUMMARY_FALLBACKS:
+            monkeypatch.setitem(summarize_description.SUMMARY_FALLBACKS, field, fallback(field))
+        return calls, fallback_calls
+    return install
+
+
+def summaries(**fields):
+    answer = {field: "" for field in DrugSummaries.model_fields}
+    answer.update(fields)
+    return json.dumps(answer)
+
+
+@pytest.mark.parametrize("value, valid", [
+    ("<h3>Adults</h3><ul><li>500 mg</li></ul>", True),
+    ("<p>Take with food</p>", True),
+    ("", False),
+    ("```html\n<p>x</p>\n```", False),
+    ("<p>Take <b>two</b></p>", False),
+])
+def test_summary_validation(value, valid):
+    assert is_valid_summary(value) is valid
+
+
+def test_fields_are_written_with_one_call(consolidated_call):
+    calls, fallback_calls = consolidated_call(summaries(
+        metaDescription="<p>Metformin</p>", description="<p>Metformin tablets</p>",
+        useAndConditions="<p>Type 2 diabetes</p>", dosing=" <p>500 mg twice daily</p> ",
+    ))
+    q_item = {"drugName": "Example", "label": LABEL}
+
+    result = asyncio.run(summarize_all(q_item))
+
+    assert result == {"metaDescription": "<p>Metformin</p>", "description": "<p>Metformin tablets</p>",
+                      "useAndConditions": "<p>Type 2 diabetes</p>", "contraIndications": "", "warnings": "",
+                      "dosing": "<p>500 mg twice daily</p>"}
+    assert len(calls) == 1 and fallback_calls == []
+    assert calls[0]["response_format"] is DrugSummaries
+    # Shared sections are sent once; fields with blank sources are not requested
+    assert calls[0]["prompt"].count("## BEGIN description:") == 1
+    assert "- warnings" not in calls[0]["prompt"]
+
+
+def test_invalid_fields_are_rewritten_on_their_own(consolidated_call):
+    _, fallback_calls = consolidated_call(summaries(
+        metaDescription="<p>Metformin</p>", description="```<p>Metformin</p>```",
+        useAndConditions="<p>Type 2 <em>diabetes</em></p>", dosing="<p>500 mg</p>",
+    ))
+
+    result = asyncio.run(summarize_all({"drugName": "Example", "label": LABEL}))
+
+    assert sorted(fallback_calls) == ["description", "useAndConditions"]
+    assert result["description"] == "<p>description fallback</p>"
+    assert result["dosing"] == "<p>500 mg</p>"
+
+
+def test_response_outside_the_schema_falls_back_for_every_requested_field(consolidated_call):
+    _, fallback_calls = consolidated_call('{"description": "<p>only one field</p>"}')
+
+    result = asyncio.run(summarize_all({"drugName": "Example", "label": LABEL}))
+
+    assert sorted(fallback_calls) == ["description", "dosing", "metaDescription", "useAndConditions"]
+    assert result["warnings"] == ""
+
+
+def test_blank_label_makes_no_call(consolidated_call):
+    calls, fallback_calls = consolidated_call(summaries())
+
+    result = asyncio.run(summarize_all({"drugName": "Example", "label": {"description": "<p></p>"}}))
+
+    assert calls == [] and fallback_calls == []
+    assert result == {field: "" for field in DrugSummaries.model_fields}
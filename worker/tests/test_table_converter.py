@@ -0,0 +1,73 @@
+import pytest
+
+import table_converter
+from table_converter import ComplexSection, LocalConverter, convert_section, convert_locally
+
+
+def test_header_table_is_spelled_out_as_a_list():
+    html = """<p>Strengths</p><table><caption>Table 1</caption>
+<thead><tr><th>Form</th><th>Strength</th></tr></thead>
+<tbody><tr><td>Tablet</td><td>10 mg</td></tr><tr><td>Solution</td><td>1 mg/mL</td></tr></tbody>
+<tfoot><tr><td colspan="2">Scored tablets</td></tr></tfoot></table>"""
+
+    assert convert_section(html) == (
+        "<p>Strengths</p><p>Table 1</p>"
+        "<ul><li>Form: Tablet; Strength: 10 mg</li><li>Form: Solution; Strength: 1 mg/mL</li></ul>"
+        "<p>Scored tablets</p>"
+    )
+
+
+def test_row_label_column_leads_each_item():
+    html = ("<table><tr><td></td><td>eGFR</td><td>Dose</td></tr>"
+            "<tr><td>Mild</td><td>60-89</td><td>10 mg</td></tr></table>")
+
+    assert convert_section(html) == "<ul><li>Mild – eGFR: 60-89; Dose: 10 mg</li></ul>"
+
+
+def test_formatting_is_unwrapped_and_footnotes_dropped():
+    html = "<div><p>Take <b>two</b> tablets<sup>1</sup></p></div>loose text"
+
+    assert convert_section(html) == "<p>Take two tablets</p><p>loose text</p>"
+    # Loose text around inline tags stays one paragraph
+    assert convert_section("Take <b>two</b> tablets daily") == "<p>Take two tablets daily</p>"
+    assert convert_section("<p>Dosing</p>Take <i>two</i> tablets<ul><li>daily</li></ul>") == \
+        "<p>Dosing</p><p>Take two tablets</p><ul><li>daily</li></ul>"
+
+
+@pytest.mark.parametrize("html, reason", [
+    ("<table><tr><th>A</th><th>B</th></tr><tr><td><table><tr><td>x</td></tr></table></td><td>y</td></tr></table>",
+     "nested table"),
+    ("<table><tr><th>A</th><th>B</th></tr><tr><td rowspan=\"2\">1</td><td>2</td></tr></table>", "rowspan/colspan"),
+    ("<table><tr><th>A</th><th>B</th><th>C</th></tr><tr><td colspan=\"2\">1</td><td>2</td></tr></table>",
+     "rowspan/colspan"),
+    ("<table><tr><th>A</th><th>B</th></tr><tr><td>1</td><td>2</td><td>3</td></tr></table>", "irregular rows"),
+    ("<table><tr><th>A</th></tr><tr><td>1</td></tr></table>", "single-column table"),
+    ("<table><thead><tr><th>A</th><th>B</th></tr><tr><th>C</th><th>D</th></tr></thead></table>", "multi-row header"),
+    ("<table><tr><td>Take 1</td><td>daily 2</td></tr><tr><td>3</td><td>4</td></tr></table>", "no header row"),
+    ("<table><tr><th>A</th><th>B</th></tr><tr><td><ul><li>1</li></ul></td><td>2</td></tr></table>",
+     "block content in cell"),
+    ("<p>See <img src=\"figure.png\"></p>", "<img>"),
+])
+def test_complex_sections_go_to_the_llm(html, reason):
+    with pytest.raises(ComplexSection) as error:
+        convert_section(html)
+    assert str(error.value) == reason
+
+
+def test_local_converter_counts_decisions(monkeypatch):
+    monkeypatch.setattr(table_converter, "_local_converter", None)
+    assert convert_locally("<p>text</p>") is None
+
+    converter = table_converter.enable_local_conversion()
+    assert convert_locally("<p>text</p>") == "<p>text</p>"
+    assert convert_locally("<table><tr><th>A</th></tr><tr><td>1</td></tr></table>") is None
+
+    # Long free-form prose is left to the LLM
+    assert convert_locally("<p>" + "word " * 400 + "</p>") is None
+
+    assert converter.decisions == {"local (no tables)": 1, "llm (single-column table)": 1, "llm (long prose)": 1}
+    assert converter.report().startswith("Local conversion: 1/3 enhance inputs (33%) converted locally")
+
+
+def test_empty_report():
+    assert LocalConverter().report() == "Local conversion: no inputs"